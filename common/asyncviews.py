@@ -0,0 +1,174 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from common.pagination import KeysetPagination
+
+
+class AsyncAPIView(View):
+    """
+    Base class of the async read endpoints.
+
+    DRF views are synchronous, so these are plain Django async views that
+    reuse the parts of DRF that never touch the database: authentication
+    (tokens are verified from their claims), permissions, throttles, cursor
+    handling and serializers. Only the queries go through Django's async ORM.
+    """
+
+    queryset = None
+    serializer_class = None
+    authentication_classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    permission_classes = api_settings.DEFAULT_PERMISSION_CLASSES
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+    renderer = JSONRenderer()
+    content_type = "application/json"
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            await sync_to_async(self.initial)(request)
+            return await super().dispatch(request, *args, **kwargs)
+        except Http404:
+            return self.handle_exception(exceptions.NotFound())
+        except exceptions.APIException as exc:
+            return self.handle_exception(exc)
+
+    def initial(self, request):
+        """
+        Wrap the request, authenticate it and check the view permissions and
+        throttles.
+        """
+        self.request = Request(
+            request, authenticators=[auth() for auth in self.authentication_classes]
+        )
+        # Authenticate up front, like DRF, so an invalid token is rejected even
+        # on endpoints that allow anonymous access.
+        self.request.user
+        for permission in [permission() for permission in self.permission_classes]:
+            if not permission.has_permission(self.request, self):
+                if (
+                    self.request.authenticators
+                    and not self.request.successful_authenticator
+                ):
+                    raise exceptions.NotAuthenticated()
+                raise exceptions.PermissionDenied(getattr(permission, "message", None))
+        self.check_throttles()
+
+    def check_throttles(self):
+        """
+        Raise Throttled with the longest wait of the throttles that refuse the
+        request, like APIView.check_throttles().
+        """
+        waits = [
+            throttle.wait()
+            for throttle in [throttle() for throttle in self.throttle_classes]
+            if not throttle.allow_request(self.request, self)
+        ]
+        if waits:
+            wait = max([wait for wait in waits if wait is not None], default=None)
+            raise exceptions.Throttled(wait)
+
+    def handle_exception(self, exc):
+        """
+        Render an API exception the way DRF's default exception handler does.
+        """
+        data = exc.detail
+        if not isinstance(data, (list, dict)):
+            data = {"detail": data}
+        response = HttpResponse(
+            self.render(data), status=exc.status_code, content_type=self.content_type
+        )
+        if isinstance(
+            exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)
+        ):
+            header = self.request.authenticators[0].authenticate_header(self.request)
+            if header:
+                response.status_code = status.HTTP_401_UNAUTHORIZED
+                response["WWW-Authenticate"] = header
+        if getattr(exc, "wait", None):
+            response["Retry-After"] = "%d" % exc.wait
+        return response
+
+    def get_queryset(self):
+        return self.queryset.all()
+
+    def get_serializer_class(self):
+        return self.serializer_class
+
+    def get_serializer_context(self):
+        return {"request": self.request, "view": self}
+
+    def get_serializer(self):
+        return self.get_serializer_class()(context=self.get_serializer_context())
+
+    def render(self, data):
+        return self.renderer.render(data)
+
+
+class AsyncListView(AsyncAPIView):
+    """
+    List a page of objects with keyset pagination, streaming the JSON as the
+    rows arrive from the database.
+
+    The body is `{"results": [...], "next": ...}`: the link to the next page
+    comes last, because it is only known once the page has been read.
+    """
+
+    pagination_class = KeysetPagination
+    chunk_size = 100
+
+    async def get(self, request, *args, **kwargs):
+        paginator = self.pagination_class()
+        queryset = paginator.get_page_queryset(self.get_queryset(), self.request, self)
+        rows = queryset.aiterator(chunk_size=self.chunk_size)
+        first = await anext(rows, None)
+        if first is None:
+            await self.check_empty_page()
+        return StreamingHttpResponse(
+            self.stream(paginator, first, rows), content_type=self.content_type
+        )
+
+    async def check_empty_page(self):
+        """
+        Hook to tell a missing parent object from an empty list. Called before
+        the response starts, because the status can not change afterwards.
+        """
+
+    async def stream(self, paginator, row, rows):
+        serializer = self.get_serializer()
+        yield b'{"results":['
+        count = 0
+        try:
+            while row is not None and count < paginator.page_size:
+                if count:
+                    yield b","
+                yield self.render(serializer.to_representation(row))
+                count += 1
+                paginator.page = [row]
+                row = await anext(rows, None)
+        finally:
+            await rows.aclose()
+
+        paginator.has_next = row is not None
+        paginator.base_url = self.request.build_absolute_uri()
+        yield b'],"next":' + json.dumps(paginator.get_next_link()).encode() + b"}"
+
+
+class AsyncRetrieveView(AsyncAPIView):
+    """
+    Retrieve an object by primary key.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            instance = await self.get_queryset().aget(pk=self.kwargs["pk"])
+        except ObjectDoesNotExist:
+            raise exceptions.NotFound()
+        data = self.get_serializer().to_representation(instance)
+        return HttpResponse(self.render(data), content_type=self.content_type)
@@ -0,0 +1,143 @@
+import time
+import uuid
+from collections import Counter
+from functools import partial
+
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+from rest_framework.response import Response
+
+
+class ReadThroughCache:
+    """
+    Read-through cache of serialized payloads keyed by object id and generation.
+
+    A small pointer key maps the id to its current generation, a random token,
+    and the payload is stored under the id plus that generation, so a write
+    only has to replace the pointer. A reader that loaded the object before a
+    write stores its payload under the generation it started from, which the
+    write has replaced, so stale data is never served after the write. On a
+    miss a single caller recomputes the payload while concurrent callers wait
+    for it, instead of every caller hitting the database at once.
+    """
+
+    lock_timeout = 10
+    wait_timeout = 1.0
+    poll_interval = 0.01
+
+    def __init__(self, prefix, timeout=DEFAULT_TIMEOUT):
+        self.prefix = prefix
+        self.timeout = timeout
+        self.stats = Counter()
+
+    def pointer_key(self, pk):
+        return f"{self.prefix}:{pk}"
+
+    def payload_key(self, pk, generation):
+        return f"{self.prefix}:{pk}:{generation}"
+
+    def lock_key(self, pk):
+        return f"{self.prefix}:{pk}:lock"
+
+    def generation(self, pk):
+        """
+        Return the current generation of `pk`, starting a new one if it has none.
+        """
+        key = self.pointer_key(pk)
+        generation = cache.get(key)
+        if generation is None:
+            cache.add(key, uuid.uuid4().hex, self.timeout)
+            generation = cache.get(key)
+        return generation
+
+    def lookup(self, pk):
+        generation = cache.get(self.pointer_key(pk))
+        if generation is None:
+            return None
+        return cache.get(self.payload_key(pk, generation))
+
+    def get(self, pk, load, build):
+        """
+        Return the payload for `pk`, calling `build(load())` on a miss.
+        """
+        payload = self.lookup(pk)
+        if payload is not None:
+            self.stats["hits"] += 1
+            return payload
+
+        self.stats["misses"] += 1
+        lock_key = self.lock_key(pk)
+        if not cache.add(lock_key, 1, self.lock_timeout):
+            payload = self.wait(pk)
+            if payload is not None:
+                return payload
+            return build(load())
+
+        try:
+            # Read before loading: a write committed after this point replaces
+            # the generation, and with it what is stored below.
+            generation = self.generation(pk)
+            payload = build(load())
+            cache.set(self.payload_key(pk, generation), payload, self.timeout)
+        finally:
+            cache.delete(lock_key)
+        return payload
+
+    def wait(self, pk):
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            payload = self.lookup(pk)
+            if payload is not None:
+                self.stats["waits"] += 1
+                return payload
+        return None
+
+    def invalidate(self, pk):
+        self.invalidate_many([pk])
+
+    def invalidate_many(self, pks):
+        """
+        Start new generations for `pks`, right away and again once the current
+        transaction commits, since a reader may load the rows in between.
+        """
+        keys = [self.pointer_key(pk) for pk in pks]
+        if not keys:
+            return
+        self.replace_generations(keys)
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(partial(self.replace_generations, keys))
+
+    def replace_generations(self, keys):
+        cache.set_many({key: uuid.uuid4().hex for key in keys}, self.timeout)
+
+
+class CachedRetrieveMixin:
+    """
+    View mixin that serves unexpanded retrieve() responses from `payload_cache`.
+
+    The cached payload is built without the request, so it is the same for
+    every caller and host.
+    """
+
+    payload_cache = None
+
+    def retrieve(self, request, *args, **kwargs):
+        if getattr(self, "get_expand", lambda: None)():
+            return super().retrieve(request, *args, **kwargs)
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        data, self.validator_rows = self.payload_cache.get(
+            self.kwargs[lookup_url_kwarg],
+            load=self.get_object,
+            build=self.build_payload,
+        )
+        return Response(data)
+
+    def build_payload(self, instance):
+        """
+        Return the serialized data together with the HTTP validator rows that
+        `get_object()` recorded, so cache hits can still send validators.
+        """
+        data = self.get_serializer_class()(instance, context={"view": self}).data
+        return data, getattr(self, "validator_rows", None)
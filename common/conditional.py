@@ -0,0 +1,125 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+class ConditionalGetMixin:
+    """
+    View mixin that adds an ETag validator to retrieve() and list(), and a
+    Last-Modified one to retrieve(), and answers matching conditional requests
+    with 304 Not Modified.
+
+    The ETag is derived from the primary key and `validator_fields` of the
+    object, or of the rows on the page. Lists get no Last-Modified, because the
+    latest `validator_fields` of a page do not change when rows leave it or
+    move within it. A plain request takes the validators from the objects it
+    serves at no extra cost. A conditional request first reads them with a
+    narrow query, so a 304 never fetches or serializes the full rows.
+    Requests with expansions are served unconditionally, because the expanded
+    data lives in other tables.
+    """
+
+    validator_fields = ("updated_at",)
+
+    def retrieve(self, request, *args, **kwargs):
+        if self.is_expanded():
+            return super().retrieve(request, *args, **kwargs)
+        if self.is_conditional(request):
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            queryset = self.filter_queryset(self.get_queryset()).filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+            rows = list(queryset.values_list("pk", *self.validator_fields)[:1])
+            if rows:
+                last_modified = self.get_last_modified(rows)
+                response = self.not_modified(request, rows, last_modified)
+                if response is not None:
+                    return response
+        response = super().retrieve(request, *args, **kwargs)
+        rows = self.validator_rows
+        return self.set_validators(request, response, rows, self.get_last_modified(rows))
+
+    def list(self, request, *args, **kwargs):
+        if self.is_expanded():
+            return super().list(request, *args, **kwargs)
+        if not hasattr(self.paginator, "get_page_queryset"):
+            return self.list_with_page_validators(request, *args, **kwargs)
+
+        if self.is_conditional(request):
+            queryset = self.filter_queryset(self.get_queryset())
+            page = self.paginator.get_page_queryset(queryset, request, self)
+            rows = list(page.values_list("pk", *self.validator_fields))
+            page_size = self.paginator.page_size
+            response = self.not_modified(
+                request, rows[:page_size] + [len(rows) > page_size]
+            )
+            if response is not None:
+                return response
+
+        response = super().list(request, *args, **kwargs)
+        rows = [self.get_validator_row(instance) for instance in self.paginator.page]
+        return self.set_validators(request, response, rows + [self.paginator.has_next])
+
+    def list_with_page_validators(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset()).values_list(
+            "pk", *self.validator_fields
+        )
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            rows = list(queryset)
+        else:
+            rows = [*page, self.get_paginated_response([]).data]
+        response = self.not_modified(request, rows)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+        return self.set_validators(request, response, rows)
+
+    def get_object(self):
+        instance = super().get_object()
+        self.validator_rows = [self.get_validator_row(instance)]
+        return instance
+
+    def get_validator_row(self, instance):
+        return (
+            instance.pk,
+            *(getattr(instance, name) for name in self.validator_fields),
+        )
+
+    def is_expanded(self):
+        return bool(getattr(self, "get_expand", lambda: None)())
+
+    @staticmethod
+    def is_conditional(request):
+        return (
+            "HTTP_IF_NONE_MATCH" in request.META
+            or "HTTP_IF_MODIFIED_SINCE" in request.META
+        )
+
+    @staticmethod
+    def get_etag(request, rows):
+        digest = hashlib.md5(
+            repr((request.get_full_path(), rows)).encode(), usedforsecurity=False
+        )
+        return quote_etag(digest.hexdigest())
+
+    @staticmethod
+    def get_last_modified(rows):
+        timestamps = [
+            value for row in rows for value in row if hasattr(value, "timestamp")
+        ]
+        return int(max(timestamps).timestamp()) if timestamps else None
+
+    def not_modified(self, request, rows, last_modified=None):
+        response = get_conditional_response(
+            request, etag=self.get_etag(request, rows), last_modified=last_modified
+        )
+        if response is not None:
+            self.set_validators(request, response, rows, last_modified)
+        return response
+
+    def set_validators(self, request, response, rows, last_modified=None):
+        response["ETag"] = self.get_etag(request, rows)
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified)
+        return response
@@ -0,0 +1,128 @@
+import atexit
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from common.tasks import get_executor, run_task
+
+
+def has_field(model, name):
+    try:
+        model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return False
+    return True
+
+
+class CounterBuffer:
+    """
+    Write-combining counters.
+
+    Increments are summed in memory and written every COUNTER_FLUSH_INTERVAL
+    seconds, with one `UPDATE ... SET field = field + delta` per model, field
+    and delta for all the rows that got that delta. A row that gets a
+    thousand increments between two flushes is locked once instead of a
+    thousand times, and never by a request.
+
+    Increments not flushed yet are lost if the process dies, so the counters
+    must be rebuildable from the rows they count. Rows that have an
+    `updated_at` field get it bumped, so validators and caches keyed on it
+    change with the counts, and the `on_flush` callback of the model, if any,
+    is called with the primary keys of the rows that changed.
+    """
+
+    def __init__(self, on_flush=None):
+        self.on_flush = on_flush or {}
+        self.lock = threading.Lock()
+        self.deltas = defaultdict(int)
+        self.timer = None
+        atexit.register(self.flush)
+
+    def add(self, model, pk, field, delta=1):
+        """
+        Add `delta` to `field` of the `model` row with primary key `pk`, once
+        the current transaction commits.
+        """
+        transaction.on_commit(lambda: self.buffer(model, pk, field, delta))
+
+    def buffer(self, model, pk, field, delta):
+        with self.lock:
+            self.deltas[model, field, pk] += delta
+            if settings.TASKS_EAGER:
+                schedule = False
+            else:
+                schedule = self.timer is None
+                if schedule:
+                    # The one-shot timer thread only hands the flush to a task
+                    # worker, whose database connection outlives the flush.
+                    self.timer = threading.Timer(
+                        settings.COUNTER_FLUSH_INTERVAL,
+                        get_executor().submit,
+                        [run_task, self.flush],
+                    )
+                    self.timer.daemon = True
+        if settings.TASKS_EAGER:
+            self.flush()
+        elif schedule:
+            self.timer.start()
+
+    def flush(self):
+        """
+        Write the buffered increments and return the number of rows updated.
+        """
+        with self.lock:
+            deltas, self.deltas = self.deltas, defaultdict(int)
+            timer, self.timer = self.timer, None
+        if timer is not None:
+            timer.cancel()
+        groups = defaultdict(list)
+        for (model, field, pk), delta in deltas.items():
+            if delta:
+                groups[model, field, delta].append(pk)
+        if not groups:
+            return 0
+
+        changed = defaultdict(set)
+        for (model, _, _), pks in groups.items():
+            changed[model].update(pks)
+
+        updated = 0
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                for model, pks in changed.items():
+                    # Lock the rows in primary key order, the same in every
+                    # process, so concurrent flushes can not deadlock.
+                    list(
+                        model._default_manager.select_for_update()
+                        .filter(pk__in=pks)
+                        .order_by("pk")
+                        .values_list("pk", flat=True)
+                    )
+                for (model, field, delta), pks in groups.items():
+                    value = F(field) + delta
+                    if delta < 0:
+                        value = Greatest(value, Value(0))
+                    fields = {field: value}
+                    if has_field(model, "updated_at"):
+                        fields["updated_at"] = now
+                    queryset = model._default_manager.filter(pk__in=pks)
+                    updated += queryset.update(**fields)
+        except Exception:
+            # Keep the increments for the next flush instead of losing them.
+            with self.lock:
+                for key, delta in deltas.items():
+                    self.deltas[key] += delta
+            raise
+
+        for model, pks in changed.items():
+            callback = self.on_flush.get(model)
+            if callback is not None:
+                callback(pks)
+        return updated
@@ -0,0 +1,49 @@
+from rest_framework.exceptions import ValidationError
+
+
+class ExpandableFieldsMixin:
+    """
+    Serializer mixin that leaves out the fields listed in `Meta.expandable_fields`
+    unless they were requested through the `expand` serializer context.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        expand = self.context.get("expand", ())
+        for name in getattr(self.Meta, "expandable_fields", ()):
+            if name not in expand:
+                fields.pop(name, None)
+        return fields
+
+
+class ExpandMixin:
+    """
+    View mixin that reads `?expand=a,b` and hands the requested expansions to
+    the serializer context and to the queryset's `expand()` method, so the
+    related data is loaded up front instead of once per row.
+    """
+
+    expand_query_param = "expand"
+
+    def get_expand(self):
+        if not hasattr(self, "_expand"):
+            value = self.request.query_params.get(self.expand_query_param, "")
+            expand = {name.strip() for name in value.split(",") if name.strip()}
+            meta = getattr(self.get_serializer_class(), "Meta", None)
+            unknown = expand - set(getattr(meta, "expandable_fields", ()))
+            if unknown:
+                raise ValidationError(
+                    {
+                        self.expand_query_param: f"Unknown expansions: {', '.join(sorted(unknown))}."
+                    }
+                )
+            self._expand = frozenset(expand)
+        return self._expand
+
+    def get_queryset(self):
+        return super().get_queryset().expand(self.get_expand())
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["expand"] = self.get_expand()
+        return context
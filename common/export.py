@@ -0,0 +1,85 @@
+import zlib
+
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from rest_framework import generics, permissions
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def parse_since(value):
+    """
+    Parse the ISO 8601 timestamp of an incremental export, or return None.
+    """
+    if not value:
+        return None
+    try:
+        since = parse_datetime(value)
+    except ValueError:
+        since = None
+    if since is None:
+        raise ValidationError({"since": "Enter a valid ISO 8601 date and time."})
+    return since
+
+
+def export_queryset(queryset, since=None):
+    """
+    Order rows for export by (updated_at, id), keeping only those updated at or
+    after `since`. The bound is inclusive, so rows that share the timestamp of
+    the last exported row are exported again rather than skipped.
+    """
+    if since is not None:
+        queryset = queryset.filter(updated_at__gte=since)
+    return queryset.order_by("updated_at", "id")
+
+
+def iter_ndjson(queryset, serializer, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield one JSON line per row, fetching the rows in chunks through a
+    server-side cursor, so only one chunk is ever held in memory.
+    """
+    renderer = JSONRenderer()
+    for instance in queryset.iterator(chunk_size=chunk_size):
+        yield renderer.render(serializer.to_representation(instance)) + b"\n"
+
+
+def iter_gzip(chunks, level=6):
+    """
+    Compress a stream of byte chunks into a gzip stream.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+class NDJSONExportView(generics.GenericAPIView):
+    """
+    Stream every row of the queryset as newline-delimited JSON.
+
+    `?since=` limits the export to rows updated at or after the given time,
+    and the body is gzipped when the client accepts it.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+    pagination_class = None
+    chunk_size = DEFAULT_CHUNK_SIZE
+    content_type = "application/x-ndjson"
+
+    def get(self, request, *args, **kwargs):
+        since = parse_since(request.query_params.get("since"))
+        queryset = export_queryset(self.get_queryset(), since)
+        serializer = self.get_serializer()
+        lines = iter_ndjson(queryset, serializer, self.chunk_size)
+
+        response = StreamingHttpResponse(content_type=self.content_type)
+        if "gzip" in request.headers.get("Accept-Encoding", ""):
+            lines = iter_gzip(lines)
+            response["Content-Encoding"] = "gzip"
+        response["Vary"] = "Accept-Encoding"
+        response.streaming_content = lines
+        return response
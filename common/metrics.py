@@ -0,0 +1,245 @@
+import hmac
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+# Upper bounds, in seconds, of the request duration histogram buckets.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Counters kept for every route: metric name, help text and RouteStats attribute.
+COUNTERS = (
+    ("http_request_db_queries_total", "Database queries run.", "queries"),
+    ("http_request_db_seconds_total", "Time spent in database queries.", "db_time"),
+    (
+        "http_request_serializer_seconds_total",
+        "Time spent validating and serializing.",
+        "serializer_time",
+    ),
+    (
+        "http_response_bytes_total",
+        "Size of the response bodies, not counting streamed ones.",
+        "bytes",
+    ),
+)
+
+_current = ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    """
+    What one request spent its time on, collected while it is handled.
+    """
+
+    __slots__ = ("started", "queries", "db_time", "serializer_time", "in_serializer")
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.in_serializer = False
+
+
+@contextmanager
+def collect_metrics():
+    """
+    Collect the metrics of the queries and serializers run in the block.
+    """
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper adding the query to the metrics of the current request.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_time += perf_counter() - started
+
+
+def install_query_recorder(connection, **kwargs):
+    """
+    Add record_query() to the execute wrappers of a database connection, for
+    good: it costs a context variable lookup per query outside of requests.
+    Connected to connection_created, so the connections opened by the threads
+    running async ORM queries are covered too.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def serializer_timer():
+    """
+    Add the time spent in the block to the serializer time of the current
+    request. Nested blocks are only counted once.
+    """
+    metrics = _current.get()
+    if metrics is None or metrics.in_serializer:
+        yield
+        return
+    metrics.in_serializer = True
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_time += perf_counter() - started
+        metrics.in_serializer = False
+
+
+def instrument_serializers():
+    """
+    Time BaseSerializer.is_valid() and BaseSerializer.data, which every DRF
+    serializer goes through to validate input and to build output, and
+    ListSerializer.is_valid(), which `many=True` serializers override. Queries
+    run by the serializer are counted both as serializer and database time.
+    """
+    if getattr(BaseSerializer, "_metrics_instrumented", False):
+        return
+    data = BaseSerializer.data.fget
+
+    def timed(method):
+        def timed_method(self, *args, **kwargs):
+            with serializer_timer():
+                return method(self, *args, **kwargs)
+
+        return timed_method
+
+    BaseSerializer.is_valid = timed(BaseSerializer.is_valid)
+    ListSerializer.is_valid = timed(ListSerializer.is_valid)
+    BaseSerializer.data = property(timed(data))
+    BaseSerializer._metrics_instrumented = True
+
+
+class RouteStats:
+    __slots__ = (
+        "buckets",
+        "count",
+        "duration",
+        "queries",
+        "db_time",
+        "serializer_time",
+        "bytes",
+    )
+
+    def __init__(self):
+        self.buckets = [0] * (len(DURATION_BUCKETS) + 1)
+        self.count = 0
+        self.duration = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.bytes = 0
+
+    def copy(self):
+        stats = RouteStats()
+        for name in self.__slots__:
+            setattr(stats, name, getattr(self, name))
+        stats.buckets = list(self.buckets)
+        return stats
+
+
+class MetricsRegistry:
+    """
+    In-process statistics of the requests handled, per route name.
+
+    Each worker process keeps its own statistics, so a scrape reads those of
+    the worker that answers it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+
+    def observe(self, route, duration, metrics, size):
+        bucket = bisect_left(DURATION_BUCKETS, duration)
+        with self.lock:
+            stats = self.routes.get(route)
+            if stats is None:
+                stats = self.routes[route] = RouteStats()
+            stats.buckets[bucket] += 1
+            stats.count += 1
+            stats.duration += duration
+            stats.queries += metrics.queries
+            stats.db_time += metrics.db_time
+            stats.serializer_time += metrics.serializer_time
+            stats.bytes += size
+
+    def clear(self):
+        with self.lock:
+            self.routes.clear()
+
+    def render(self):
+        """
+        Render the statistics in the Prometheus text exposition format.
+        """
+        with self.lock:
+            routes = sorted(
+                (route, stats.copy()) for route, stats in self.routes.items()
+            )
+        lines = [
+            "# HELP http_request_duration_seconds Time to handle a request, "
+            "up to the response headers.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for route, stats in routes:
+            label = f'route="{escape_label(route)}"'
+            count = 0
+            for bound, value in zip(DURATION_BUCKETS + ("+Inf",), stats.buckets):
+                count += value
+                lines.append(
+                    f'http_request_duration_seconds_bucket{{{label},le="{bound}"}} {count}'
+                )
+            lines.append(
+                f"http_request_duration_seconds_sum{{{label}}} {stats.duration}"
+            )
+            lines.append(
+                f"http_request_duration_seconds_count{{{label}}} {stats.count}"
+            )
+        for name, help, attr in COUNTERS:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} counter")
+            for route, stats in routes:
+                label = f'route="{escape_label(route)}"'
+                lines.append(f"{name}{{{label}}} {getattr(stats, attr)}")
+        return "\n".join(lines) + "\n"
+
+
+def escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = MetricsRegistry()
+
+
+def metrics_view(request):
+    """
+    Expose the request statistics to a scraper presenting METRICS_TOKEN as a
+    bearer token. The endpoint does not exist while the token is not set.
+    """
+    token = settings.METRICS_TOKEN
+    if not token:
+        raise Http404
+    header = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(header.encode(), f"Bearer {token}".encode()):
+        response = HttpResponse(status=401)
+        response["WWW-Authenticate"] = "Bearer"
+        return response
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4")
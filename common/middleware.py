@@ -0,0 +1,98 @@
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+from common.metrics import (
+    collect_metrics,
+    install_query_recorder,
+    instrument_serializers,
+    registry,
+)
+
+
+class RequestMetricsMiddleware:
+    """
+    Measure every request: wall time, database queries and their time,
+    serializer time and response size.
+
+    The measures are sent back in a Server-Timing header and added to the
+    per-route statistics served by the metrics endpoint. Streamed responses
+    are measured up to their headers, and their size is not known.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        instrument_serializers()
+        connection_created.connect(install_query_recorder)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        install_query_recorder(connection)
+        with collect_metrics() as metrics:
+            response = self.get_response(request)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        # The async ORM runs the queries in a thread opened for the request,
+        # whose connection gets the query recorder from connection_created.
+        with collect_metrics() as metrics:
+            response = await self.get_response(request)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        duration = perf_counter() - metrics.started
+        size = 0 if response.streaming else len(response.content)
+        match = request.resolver_match
+        route = match.view_name if match is not None else "unresolved"
+        registry.observe(route, duration, metrics, size)
+        response["Server-Timing"] = ", ".join(
+            (
+                f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"',
+                f"serializer;dur={metrics.serializer_time * 1000:.1f}",
+                f"total;dur={duration * 1000:.1f}",
+            )
+        )
+        return response
+
+
+def set_statement_timeout(sender, connection, **kwargs):
+    """
+    Cancel the statements of a new PostgreSQL connection that run longer than
+    STATEMENT_TIMEOUT milliseconds.
+    """
+    if connection.vendor == "postgresql" and settings.STATEMENT_TIMEOUT:
+        with connection.cursor() as cursor:
+            cursor.execute("SET statement_timeout = %s", [settings.STATEMENT_TIMEOUT])
+
+
+class StatementTimeoutMiddleware:
+    """
+    Limit the time database statements may run in the processes serving
+    requests.
+
+    The limit is set with SET on every connection they open, so management
+    commands, which never load the middleware, run their long statements
+    without it, and it does not depend on startup parameters a connection
+    pooler may drop.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        connection_created.connect(set_statement_timeout)
+
+    def __call__(self, request):
+        return self.get_response(request)
@@ -0,0 +1,178 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+def _encode_value(value):
+    # DjangoJSONEncoder rounds datetimes to milliseconds, which would make the
+    # cursor skip rows created within the same millisecond.
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"Cannot encode {type(value).__name__} in a cursor")
+
+
+def encode_position(values):
+    """
+    Pack the key values of a row into an opaque url-safe token.
+    """
+    payload = json.dumps(list(values), default=_encode_value, separators=(",", ":"))
+    return urlsafe_b64encode(payload.encode()).decode("ascii")
+
+
+def decode_position(token, size):
+    """
+    Unpack a token produced by `encode_position`, or return None if it is malformed.
+    """
+    try:
+        values = json.loads(urlsafe_b64decode(token.encode("ascii")))
+    except (BinasciiError, UnicodeError, ValueError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
+def keyset_filter(ordering, position):
+    """
+    Build the row-value comparison `(f1, f2, ...) < (v1, v2, ...)` for the given
+    ordering as a Q object.
+
+    The leading `f1 <= v1` term is redundant logically, but it gives the planner
+    a range bound on the first index column, so the scan starts right at the
+    cursor instead of filtering from the beginning of the index.
+    """
+    lookup = "lt" if ordering[0].startswith("-") else "gt"
+    fields = [name.lstrip("-") for name in ordering]
+
+    condition = Q(**{f"{fields[-1]}__{lookup}": position[-1]})
+    for field, value in zip(reversed(fields[:-1]), reversed(position[:-1])):
+        condition = Q(**{f"{field}__{lookup}": value}) | (
+            Q(**{field: value}) & condition
+        )
+    return Q(**{f"{fields[0]}__{lookup}e": position[0]}) & condition
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward-only cursor pagination over a unique composite key.
+
+    The cursor holds the key of the last row on the page and the next page is
+    selected with a keyset comparison instead of an OFFSET, so every page is a
+    single index range scan that costs the same as the first one. The ordering
+    must end with a unique column, all its columns must be non-null and sorted
+    in the same direction, and a composite index should cover it.
+    """
+
+    cursor_query_param = "cursor"
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    ordering = ("-created_at", "-id")
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        results = list(queryset)
+        self.page = results[: self.page_size]
+        self.has_next = len(results) > self.page_size
+        return self.page
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """
+        Return the queryset of the requested page plus one look-ahead row,
+        without evaluating it.
+        """
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.ordering = self.get_ordering(view)
+        self.position = self.decode_cursor(request, queryset)
+        queryset = self.filter_queryset(queryset, self.position)
+        return queryset[: self.page_size + 1]
+
+    def filter_queryset(self, queryset, position):
+        """
+        Order the queryset by the keyset and skip everything up to `position`.
+        """
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(keyset_filter(self.ordering, position))
+        return queryset
+
+    def get_ordering(self, view):
+        ordering = tuple(getattr(view, "keyset_ordering", self.ordering))
+        directions = {name.startswith("-") for name in ordering}
+        assert (
+            len(directions) == 1
+        ), "Keyset ordering fields must all be sorted in the same direction."
+        return ordering
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return _positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True,
+                    cutoff=self.max_page_size,
+                )
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def decode_cursor(self, request, queryset):
+        token = request.query_params.get(self.cursor_query_param)
+        if token is None:
+            return None
+
+        values = decode_position(token, len(self.ordering))
+        if values is None:
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            return [
+                self.to_python(queryset.model, name.lstrip("-"), value)
+                for name, value in zip(self.ordering, values)
+            ]
+        except ValidationError:
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def to_python(model, name, value):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return value
+        return field.to_python(value)
+
+    def get_position(self, instance):
+        return [getattr(instance, name.lstrip("-")) for name in self.ordering]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        token = encode_position(self.get_position(self.page[-1]))
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True},
+                "results": schema,
+            },
+        }
@@ -0,0 +1,12 @@
+from rest_framework import serializers
+
+
+class BulkCreateListSerializer(serializers.ListSerializer):
+    """
+    List serializer that saves all validated items with a single bulk_create()
+    instead of one INSERT per item.
+    """
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        return model.objects.bulk_create(model(**attrs) for attrs in validated_data)
@@ -0,0 +1,79 @@
+from django.db import models, transaction
+from django.utils import timezone
+
+from common.counters import has_field
+
+DEFAULT_PURGE_BATCH_SIZE = 1000
+
+
+class SoftDeleteQuerySet(models.QuerySet):
+    def soft_delete(self):
+        """
+        Mark the rows as deleted and return how many were. Their dependents
+        are left for a purge to delete in batches.
+        """
+        now = timezone.now()
+        fields = {"deleted_at": now}
+        if has_field(self.model, "updated_at"):
+            fields["updated_at"] = now
+        return self.filter(deleted_at=None).update(**fields)
+
+    def deleted(self):
+        """
+        Keep the rows waiting to be purged, served by the partial index on
+        `deleted_at`.
+        """
+        return self.filter(deleted_at__isnull=False)
+
+
+class LiveDependentManager(models.Manager):
+    """
+    Manager of the rows whose parents, the soft deletable models at the
+    relations `parents`, are not soft deleted, so they are hidden along with
+    them until a purge deletes them, without writing to them. Models declare
+    it first, as `objects`, next to an unfiltered `all_objects`.
+    """
+
+    def __init__(self, *parents):
+        super().__init__()
+        self.parents = parents
+
+    def get_queryset(self):
+        return (
+            super()
+            .get_queryset()
+            .filter(**{f"{parent}__deleted_at": None for parent in self.parents})
+        )
+
+
+class LiveManager(LiveDependentManager):
+    """
+    Manager of the rows that are not soft deleted, nor any of their `parents`.
+    Models declare it first, as `objects`, so it is their default manager and
+    reverse relations skip deleted rows too, and keep an unfiltered
+    `all_objects` next to it.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at=None)
+
+
+def delete_in_batches(queryset, batch_size=DEFAULT_PURGE_BATCH_SIZE, before=None):
+    """
+    Delete the rows of `queryset` at most `batch_size` at a time, each batch
+    in its own short transaction, and return how many rows were selected.
+
+    `before(pks)` is called in the transaction of each batch, before the
+    delete, to adjust what depends on the rows.
+    """
+    model = queryset.model
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            pks = list(queryset.values_list("pk", flat=True)[:batch_size])
+            if not pks:
+                return deleted
+            if before is not None:
+                before(pks)
+            model._base_manager.filter(pk__in=pks).delete()
+        deleted += len(pks)
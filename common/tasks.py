@@ -0,0 +1,55 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.TASK_WORKERS, thread_name_prefix="tasks"
+        )
+    return _executor
+
+
+def run_task(func, *args, **kwargs):
+    """
+    Run a task and log its failure instead of raising it.
+
+    Like a request, the task starts and ends by closing the database
+    connections of its worker thread that are broken or older than
+    CONN_MAX_AGE, so the thread keeps its connection between tasks.
+    """
+    if not settings.TASKS_EAGER:
+        close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        logger.exception("Task %s failed", func.__qualname__)
+    finally:
+        if not settings.TASKS_EAGER:
+            close_old_connections()
+
+
+def enqueue(func, *args, **kwargs):
+    """
+    Run `func(*args, **kwargs)` off the request thread once the current
+    transaction commits, so the task sees the rows the request wrote.
+
+    This in-process pool stands in for a task queue: tasks do not survive a
+    restart, so they must be safe to re-run from a management command. With
+    TASKS_EAGER the task runs synchronously on commit instead, which is what
+    the tests use.
+    """
+    task = partial(run_task, func, *args, **kwargs)
+    if settings.TASKS_EAGER:
+        transaction.on_commit(task)
+    else:
+        transaction.on_commit(partial(get_executor().submit, task))
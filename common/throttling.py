@@ -0,0 +1,143 @@
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+# The counter of a window holds the count of the previous window above these
+# bits and its own count below them.
+COUNT_BITS = 32
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    """
+    Sliding window rate limit, with one atomic cache counter per key and window.
+
+    The requests of the last `duration` seconds are estimated as those of the
+    current fixed window plus those of the previous one, weighted by the part
+    of the previous window still inside the sliding one. The count of the
+    previous window is copied into the counter of the current one when it is
+    created, so a check is a single cache.incr() round trip, except for the
+    first request of a window. Throttled requests are counted too, so a client
+    that keeps flooding stays throttled.
+
+    Rates come from DEFAULT_THROTTLE_RATES when the request is checked, and a
+    scope without a rate is not throttled.
+    """
+
+    def __init__(self):
+        # The rate is looked up by allow_request(), once the scope is known.
+        pass
+
+    def get_rate(self):
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def allow_request(self, request, view):
+        self.rate = self.get_rate()
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window, self.elapsed = divmod(self.now / self.duration, 1)
+        self.previous, self.current = divmod(self.hit(int(window)), 1 << COUNT_BITS)
+        estimate = self.previous * (1 - self.elapsed) + self.current
+        return estimate <= self.num_requests
+
+    def hit(self, window):
+        """
+        Count a request in `window` and return the value of its counter.
+        """
+        key = f"{self.key}:{window}"
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            pass
+        previous = self.cache.get(f"{self.key}:{window - 1}", 0) % (1 << COUNT_BITS)
+        value = (previous << COUNT_BITS) + 1
+        # The counter is read as the previous window during the next one.
+        if self.cache.add(key, value, self.duration * 2):
+            return value
+        return self.cache.incr(key)
+
+    def wait(self):
+        """
+        Return how long until the estimate falls back within the rate.
+        """
+        if self.current <= self.num_requests:
+            # The previous window has to slide out far enough.
+            needed = 1 - (self.num_requests - self.current) / self.previous
+            return max(0, needed - self.elapsed) * self.duration
+        # The current window has to end, and then slide out far enough.
+        needed = 1 - self.num_requests / self.current
+        return (1 - self.elapsed + needed) * self.duration
+
+
+class AnonThrottle(SlidingWindowThrottle):
+    """
+    Limit the requests of anonymous clients, by IP address.
+    """
+
+    scope = "anon"
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.cache_format % {
+            "scope": self.scope,
+            "ident": self.get_ident(request),
+        }
+
+
+class UserThrottle(SlidingWindowThrottle):
+    """
+    Limit the requests of authenticated users, by user.
+    """
+
+    scope = "user"
+
+    def get_cache_key(self, request, view):
+        if not request.user or not request.user.is_authenticated:
+            return None
+        return self.cache_format % {"scope": self.scope, "ident": request.user.pk}
+
+
+class ScopedThrottle(SlidingWindowThrottle):
+    """
+    Limit the requests to the views of a `throttle_scope`, by user, or by IP
+    address for anonymous clients. Views without a scope are not limited.
+    """
+
+    def get_scope(self, view):
+        return getattr(view, "throttle_scope", None)
+
+    def allow_request(self, request, view):
+        self.scope = self.get_scope(view)
+        if self.scope is None:
+            return True
+        return super().allow_request(request, view)
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {"scope": self.scope, "ident": ident}
+
+
+class ScopedIPThrottle(ScopedThrottle):
+    """
+    Limit the requests to the views of a `throttle_scope` by IP address, with
+    the rate of the scope suffixed with `_ip`, whoever is authenticated.
+    """
+
+    def get_scope(self, view):
+        scope = super().get_scope(view)
+        return None if scope is None else f"{scope}_ip"
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            "scope": self.scope,
+            "ident": self.get_ident(request),
+        }
@@ -1,6 +1,7 @@
 import os
 from datetime import timedelta
 from pathlib import Path
+
 from dotenv import load_dotenv
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -31,6 +32,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "common.middleware.RequestMetricsMiddleware",
+    "common.middleware.StatementTimeoutMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -62,14 +65,38 @@ TEMPLATES = [
 WSGI_APPLICATION = "config.wsgi.application"
 
 
+# Milliseconds a statement may run while serving requests, 0 for no limit.
+# It is set by common.middleware.StatementTimeoutMiddleware, so management
+# commands such as migrate or the purge and import commands run without it.
+STATEMENT_TIMEOUT = int(os.getenv("POSTGRES_STATEMENT_TIMEOUT") or 30000)
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql_psycopg2",
+        "ENGINE": "django.db.backends.postgresql",
         "NAME": os.getenv("POSTGRES_DB"),
         "USER": os.getenv("POSTGRES_USER"),
         "PASSWORD": os.getenv("POSTGRES_PASSWORD"),
-        "HOST": "127.0.0.1",
-        "PORT": 5432,
+        "HOST": os.getenv("POSTGRES_HOST") or "127.0.0.1",
+        "PORT": int(os.getenv("POSTGRES_PORT") or 5432),
+        # Seconds a connection is kept open for the next requests of the same
+        # worker thread, 0 to close it after every request.
+        "CONN_MAX_AGE": int(os.getenv("POSTGRES_CONN_MAX_AGE") or 60),
+        # Check that a persistent connection still works before reusing it.
+        "CONN_HEALTH_CHECKS": os.getenv("POSTGRES_CONN_HEALTH_CHECKS", "1").lower() in ("1", "true", "yes"),
+        # Needed behind PgBouncer in transaction pooling mode.
+        "DISABLE_SERVER_SIDE_CURSORS": os.getenv("POSTGRES_DISABLE_SERVER_SIDE_CURSORS", "").lower() in ("1", "true", "yes"),
+        "OPTIONS": {
+            "connect_timeout": int(os.getenv("POSTGRES_CONNECT_TIMEOUT") or 5),
+        },
+    }
+}
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND")
+        or "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+        "TIMEOUT": int(os.getenv("CACHE_TIMEOUT") or 300),
     }
 }
 
@@ -89,12 +116,74 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# New passwords are hashed with the first hasher. The others still verify
+# existing hashes, which are rehashed with the first one on the next login.
+PASSWORD_HASHER_CHOICES = {
+    "pbkdf2": "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+    "scrypt": "users.hashers.ScryptPasswordHasher",
+    "argon2": "users.hashers.Argon2PasswordHasher",
+}
+PASSWORD_HASHER = os.getenv("PASSWORD_HASHER") or "pbkdf2"
+PASSWORD_HASHERS = [PASSWORD_HASHER_CHOICES[PASSWORD_HASHER]] + [
+    hasher
+    for name, hasher in PASSWORD_HASHER_CHOICES.items()
+    if name != PASSWORD_HASHER
+]
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS") or 0)
+
+SCRYPT_WORK_FACTOR = int(os.getenv("SCRYPT_WORK_FACTOR") or 2**14)
+SCRYPT_BLOCK_SIZE = int(os.getenv("SCRYPT_BLOCK_SIZE") or 8)
+SCRYPT_PARALLELISM = int(os.getenv("SCRYPT_PARALLELISM") or 1)
+
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST") or 2)
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST") or 102400)
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM") or 8)
+
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
-    )
+        "users.authentication.StatelessJWTAuthentication",
+    ),
+    "DEFAULT_PAGINATION_CLASS": "common.pagination.KeysetPagination",
+    "PAGE_SIZE": 20,
+    "DEFAULT_THROTTLE_CLASSES": (
+        "common.throttling.AnonThrottle",
+        "common.throttling.UserThrottle",
+        "common.throttling.ScopedThrottle",
+        "common.throttling.ScopedIPThrottle",
+    ),
+    # Requests per second, minute, hour or day, for example "10/min".
+    # Scopes suffixed with _ip limit an IP address whoever is authenticated.
+    "DEFAULT_THROTTLE_RATES": {
+        "anon": os.getenv("THROTTLE_RATE_ANON") or "1000/min",
+        "user": os.getenv("THROTTLE_RATE_USER") or "3000/min",
+        "write": os.getenv("THROTTLE_RATE_WRITE") or "60/min",
+        "write_ip": os.getenv("THROTTLE_RATE_WRITE_IP") or "300/min",
+        "login": os.getenv("THROTTLE_RATE_LOGIN") or "10/min",
+        "register": os.getenv("THROTTLE_RATE_REGISTER") or "20/hour",
+    },
+    # Proxies in front of the application, to find client addresses in
+    # X-Forwarded-For. Unset, the whole header is the address.
+    "NUM_PROXIES": int(os.getenv("NUM_PROXIES")) if os.getenv("NUM_PROXIES") else None,
 }
 
+BULK_CREATE_MAX_ITEMS = int(os.getenv("BULK_CREATE_MAX_ITEMS") or 100)
+
+MODERATION_LEXICON_FILE = os.getenv("MODERATION_LEXICON_FILE") or None
+
+UPLOAD_MAX_SIZE = int(os.getenv("UPLOAD_MAX_SIZE") or 50 * 1024 * 1024)
+UPLOAD_CHUNK_MAX_SIZE = int(os.getenv("UPLOAD_CHUNK_MAX_SIZE") or 8 * 1024 * 1024)
+
+TIMELINE_FANOUT_LIMIT = int(os.getenv("TIMELINE_FANOUT_LIMIT") or 10000)
+TIMELINE_BACKFILL = int(os.getenv("TIMELINE_BACKFILL") or 100)
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN") or None
+
+TASK_WORKERS = int(os.getenv("TASK_WORKERS") or 4)
+TASKS_EAGER = os.getenv("TASKS_EAGER", "").lower() in ("1", "true", "yes")
+
+# Seconds between two writes of the buffered like counters.
+COUNTER_FLUSH_INTERVAL = int(os.getenv("COUNTER_FLUSH_INTERVAL") or 5)
+
 
 LANGUAGE_CODE = "en-us"
 
@@ -118,4 +207,11 @@ AUTH_USER_MODEL = "users.User"
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(days=1),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
+    "TOKEN_USER_CLASS": "users.authentication.ClaimsUser",
+    "TOKEN_OBTAIN_SERIALIZER": "users.serializers.ClaimsTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "users.serializers.DenylistTokenRefreshSerializer",
 }
+
+# Seconds a token is cached as not revoked. Revocations clear the entries of the
+# shared cache; with a per-process cache, other processes see them this late.
+TOKEN_DENYLIST_CACHE_TIMEOUT = int(os.getenv("TOKEN_DENYLIST_CACHE_TIMEOUT") or 60)
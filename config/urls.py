@@ -1,8 +1,12 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from common.metrics import metrics_view
+
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics/", metrics_view, name="metrics"),
+    path("async/", include("urls.async_urls", namespace="async")),
     path("", include("urls.user_urls")),
     path("posts/", include("urls.post_urls", namespace="posts")),
     path(
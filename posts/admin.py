@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.urls import reverse
 from django.utils.html import format_html
 
-from posts.models import Post, Comment
+from posts.models import Post, Comment, ForbiddenTerm
 
 
 @admin.register(Post)
@@ -22,3 +22,9 @@ class PostAdmin(admin.ModelAdmin):
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
     list_display = ("__str__", 'id')
+
+
+@admin.register(ForbiddenTerm)
+class ForbiddenTermAdmin(admin.ModelAdmin):
+    list_display = ("term", "created_at")
+    search_fields = ("term",)
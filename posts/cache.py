@@ -0,0 +1,4 @@
+from common.cache import ReadThroughCache
+
+post_cache = ReadThroughCache("post")
+comment_cache = ReadThroughCache("comment")
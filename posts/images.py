@@ -0,0 +1,80 @@
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from posts.cache import post_cache
+from posts.models import Post
+
+# Longest side of each variant, in pixels.
+IMAGE_SIZES = {"small": 320, "medium": 800, "large": 1600}
+IMAGE_FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 85, "optimize": True, "progressive": True}),
+}
+VARIANTS_DIR = "posts/variants"
+
+
+def render_variants(image):
+    """
+    Yield `(size, extension, content, width, height)` for each variant of an
+    open Pillow image.
+
+    Sizes larger than the original are skipped, except for the smallest one,
+    so every image gets at least one variant. Only pixels are written, which
+    drops EXIF (including GPS), XMP and ICC metadata; the EXIF orientation is
+    applied to the pixels first.
+    """
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+    longest = max(image.size)
+    for index, (size, limit) in enumerate(IMAGE_SIZES.items()):
+        if index and limit > longest:
+            break
+        resized = image.copy()
+        resized.thumbnail((limit, limit), Image.Resampling.LANCZOS)
+        for extension, (image_format, options) in IMAGE_FORMATS.items():
+            frame = resized
+            if image_format == "JPEG" and frame.mode != "RGB":
+                frame = frame.convert("RGB")
+            buffer = BytesIO()
+            frame.save(buffer, image_format, **options)
+            yield size, extension, buffer.getvalue(), *resized.size
+
+
+def build_image_variants(post_id):
+    """
+    Render the resized variants of a post image into storage and record their
+    URLs and dimensions on the post.
+
+    Variant names derive from the original file name, so re-running the task
+    overwrites them, and the post is only updated if its image has not been
+    replaced in the meantime.
+    """
+    post = Post.objects.filter(pk=post_id).only("id", "image").first()
+    if post is None or not post.image:
+        return
+
+    stem = posixpath.splitext(posixpath.basename(post.image.name))[0]
+    variants = {}
+    with post.image.open("rb") as file, Image.open(file) as image:
+        for size, extension, content, width, height in render_variants(image):
+            name = f"{VARIANTS_DIR}/{post.pk}/{stem}-{size}.{extension}"
+            default_storage.delete(name)
+            name = default_storage.save(name, ContentFile(content))
+            variants.setdefault(size, {})[extension] = {
+                "url": default_storage.url(name),
+                "width": width,
+                "height": height,
+            }
+
+    updated = Post.objects.filter(pk=post.pk, image=post.image.name).update(
+        image_variants=variants, updated_at=timezone.now()
+    )
+    if updated:
+        post_cache.invalidate(post.pk)
@@ -0,0 +1,292 @@
+import csv
+import gzip
+import io
+import json
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+from rest_framework.exceptions import ValidationError
+from rest_framework.validators import UniqueValidator
+
+from posts.models import Comment, ImportCheckpoint, Post, allocate_ids, comment_path
+from posts.serializers import CommentImportSerializer, PostImportSerializer
+from users.models import User, get_adult_since
+from users.serializers import UserImportSerializer
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def open_source(path):
+    """
+    Open an import file as text, decompressing it if its name ends with .gz.
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, encoding="utf-8", newline="")
+
+
+def read_records(file, format):
+    """
+    Yield a (record, error) pair for every NDJSON line or CSV row of `file`.
+    Empty CSV cells are left out, so optional fields take their defaults.
+    """
+    if format == "csv":
+        for row in csv.DictReader(file):
+            yield {key: value for key, value in row.items() if value != ""}, None
+        return
+    for line in file:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as error:
+            yield None, [f"Invalid JSON: {error}"]
+            continue
+        if not isinstance(record, dict):
+            yield None, ["Expected a JSON object."]
+            continue
+        yield record, None
+
+
+def copy_value(value):
+    """
+    Format a value for the text format of COPY.
+    """
+    if value is None:
+        return "\\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def copy_objects(model, objs):
+    """
+    Insert `objs` with COPY ... FROM STDIN, which PostgreSQL loads much faster
+    than INSERT. Values go through pre_save() like in bulk_create(), so
+    auto_now fields are filled in, and row triggers still fire.
+    """
+    opts = model._meta
+    groups = [
+        ([obj for obj in objs if obj.pk is not None], opts.concrete_fields),
+        (
+            [obj for obj in objs if obj.pk is None],
+            [field for field in opts.concrete_fields if field is not opts.pk],
+        ),
+    ]
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for group, fields in groups:
+            if not group:
+                continue
+            lines = []
+            for obj in group:
+                values = []
+                for field in fields:
+                    value = field.pre_save(obj, True)
+                    if isinstance(field, models.JSONField):
+                        value = None if value is None else json.dumps(value)
+                    else:
+                        value = field.get_db_prep_save(value, connection)
+                    values.append(copy_value(value))
+                lines.append("\t".join(values) + "\n")
+            columns = ", ".join(quote(field.column) for field in fields)
+            sql = f"COPY {quote(opts.db_table)} ({columns}) FROM STDIN"
+            data = "".join(lines)
+            if hasattr(cursor, "copy_expert"):
+                cursor.copy_expert(sql, io.StringIO(data))
+            else:
+                with cursor.copy(sql) as copy:
+                    copy.write(data)
+
+
+class Importer:
+    """
+    Validate records with a serializer and insert them in batches.
+
+    The serializer validates each record on its own. Relations and unique
+    fields are checked once per batch, with one query per field, and the
+    valid records of a batch are inserted with a single bulk_create(), or
+    COPY on PostgreSQL.
+    """
+
+    model = None
+    serializer_class = None
+    # Attributes holding ids of related rows, and the models they point to.
+    relations = {}
+    unique_fields = ("id",)
+
+    def __init__(self, use_copy=True):
+        self.use_copy = use_copy and connection.vendor == "postgresql"
+        self.serializer = self.serializer_class()
+        for field in self.serializer.fields.values():
+            field.validators = [
+                validator
+                for validator in field.validators
+                if not isinstance(validator, UniqueValidator)
+            ]
+
+    def validate(self, record):
+        return self.serializer.run_validation(record)
+
+    def check_batch(self, batch):
+        """
+        Return the errors of the (number, attrs) pairs in `batch` that refer to
+        missing rows or repeat a unique value, by number.
+        """
+        errors = {}
+        for attr, model in self.relations.items():
+            ids = {attrs[attr] for _, attrs in batch}
+            found = set(model.objects.filter(pk__in=ids).values_list("pk", flat=True))
+            for number, attrs in batch:
+                if attrs[attr] not in found:
+                    name = attr.removesuffix("_id")
+                    errors.setdefault(number, {})[name] = ["Object does not exist."]
+        for name in self.unique_fields:
+            values = {attrs[name] for _, attrs in batch if name in attrs}
+            if not values:
+                continue
+            lookup = {f"{name}__in": values}
+            seen = set(
+                self.model._base_manager.filter(**lookup).values_list(
+                    name, flat=True
+                )
+            )
+            for number, attrs in batch:
+                if name not in attrs:
+                    continue
+                if attrs[name] in seen:
+                    errors.setdefault(number, {})[name] = ["Already exists."]
+                seen.add(attrs[name])
+        return errors
+
+    def prepare(self, objs):
+        """
+        Hook to fill in what save() would compute, which bulk inserts skip.
+        """
+
+    def insert(self, objs):
+        self.prepare(objs)
+        if self.use_copy:
+            copy_objects(self.model, objs)
+        else:
+            self.model._default_manager.bulk_create(objs)
+
+    def reset_sequences(self):
+        """
+        Move the id sequence past ids given in the records, so rows created
+        later do not collide with them.
+        """
+        statements = connection.ops.sequence_reset_sql(no_style(), [self.model])
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+
+    def run(
+        self, records, source, batch_size=DEFAULT_BATCH_SIZE, restart=False, report=None
+    ):
+        """
+        Import `records`, a sequence of (record, error) pairs, and return the
+        number of imported and invalid records.
+
+        The number of records read is checkpointed under `source` with every
+        batch, and the import skips that many records when it is started again
+        after a failure, unless `restart` is set.
+        """
+        checkpoint, _ = ImportCheckpoint.objects.get_or_create(source=source)
+        start = 0 if restart else checkpoint.position
+        numbered = islice(enumerate(records, 1), start, None)
+        imported = invalid = 0
+        while batch := list(islice(numbered, batch_size)):
+            valid = []
+            errors = {}
+            for number, (record, error) in batch:
+                if error is None:
+                    try:
+                        valid.append((number, self.validate(record)))
+                    except ValidationError as exc:
+                        error = exc.detail
+                if error is not None:
+                    errors[number] = error
+            with transaction.atomic():
+                errors.update(self.check_batch(valid))
+                objs = [
+                    self.model(**attrs)
+                    for number, attrs in valid
+                    if number not in errors
+                ]
+                if objs:
+                    self.insert(objs)
+                ImportCheckpoint.objects.filter(pk=checkpoint.pk).update(
+                    position=batch[-1][0]
+                )
+            imported += len(objs)
+            invalid += len(errors)
+            if report is not None:
+                for number in sorted(errors):
+                    report(number, errors[number])
+        self.reset_sequences()
+        checkpoint.delete()
+        return imported, invalid
+
+
+class PostImporter(Importer):
+    model = Post
+    serializer_class = PostImportSerializer
+    relations = {"user_id": User}
+
+
+class CommentImporter(Importer):
+    """
+    Imported comments are on the post itself, so their path is their own id.
+    """
+
+    model = Comment
+    serializer_class = CommentImportSerializer
+    relations = {"user_id": User, "post_id": Post}
+
+    def insert(self, comments):
+        if not self.use_copy:
+            super().insert(comments)
+            Comment.all_objects.set_paths(comments)
+            return
+        # COPY does not return the ids, so they are drawn from the sequence
+        # beforehand and the paths are written with the rows.
+        allocate_ids(Comment, comments)
+        for comment in comments:
+            comment.path = comment_path("", comment.pk)
+        super().insert(comments)
+
+
+class UserImporter(Importer):
+    model = User
+    serializer_class = UserImportSerializer
+    unique_fields = ("id", "username", "email", "phone_number")
+
+    def __init__(self, use_copy=True, pool=None):
+        super().__init__(use_copy)
+        self.pool = pool
+
+    def prepare(self, users):
+        passwords = [user.password for user in users]
+        if self.pool is None:
+            hashes = map(make_password, passwords)
+        else:
+            # Hashing is deliberately slow, so it is spread over processes.
+            hashes = self.pool.map(make_password, passwords, chunksize=16)
+        for user, password in zip(users, hashes):
+            user.password = password
+            user.adult_since = get_adult_since(user.birth_date)
+
+
+IMPORTERS = {
+    "posts": PostImporter,
+    "comments": CommentImporter,
+    "users": UserImporter,
+}
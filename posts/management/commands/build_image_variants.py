@@ -0,0 +1,23 @@
+from django.core.management import BaseCommand
+
+from posts.images import build_image_variants
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = "Render the resized variants of post images that do not have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all", action="store_true", help="Re-render the variants of every image."
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image="").exclude(image__isnull=True)
+        if not options["all"]:
+            posts = posts.filter(image_variants={})
+        total = 0
+        for pk in posts.values_list("pk", flat=True).iterator():
+            build_image_variants(pk)
+            total += 1
+        self.stdout.write(f"Built image variants for {total} posts.")
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from posts.models import Upload
+from posts.uploads import delete_parts
+
+
+class Command(BaseCommand):
+    help = "Delete chunked uploads that have not received a chunk for a while, with their parts."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=int, default=24)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options["hours"])
+        total = 0
+        for upload in Upload.objects.filter(updated_at__lt=cutoff).iterator():
+            if Upload.objects.filter(
+                pk=upload.pk, updated_at=upload.updated_at
+            ).delete()[0]:
+                delete_parts(upload.parts)
+                total += 1
+        self.stdout.write(f"Deleted {total} expired uploads.")
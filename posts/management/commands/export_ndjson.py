@@ -0,0 +1,72 @@
+import sys
+
+from django.core.management import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from common.export import (
+    DEFAULT_CHUNK_SIZE,
+    export_queryset,
+    iter_gzip,
+    iter_ndjson,
+    parse_since,
+)
+from posts.models import Comment, Post
+from posts.serializers import CommentSerializer, PostSerializer
+from users.models import User
+from users.serializers import UserExportSerializer
+
+EXPORTS = {
+    "posts": (Post.objects.all(), PostSerializer),
+    "comments": (Comment.objects.all(), CommentSerializer),
+    "users": (
+        User.objects.prefetch_related("groups", "user_permissions"),
+        UserExportSerializer,
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = "Stream posts, comments or users as NDJSON, ordered by updated_at."
+
+    def add_arguments(self, parser):
+        parser.add_argument("model", choices=sorted(EXPORTS))
+        parser.add_argument(
+            "--since", help="Only export rows updated at or after this ISO 8601 time."
+        )
+        parser.add_argument(
+            "--output", default="-", help="File to write, - for stdout."
+        )
+        parser.add_argument("--gzip", action="store_true")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            since = parse_since(options["since"])
+        except ValidationError as error:
+            raise CommandError(error.detail["since"])
+
+        queryset, serializer_class = EXPORTS[options["model"]]
+        queryset = export_queryset(queryset, since)
+        lines = iter_ndjson(queryset, serializer_class(), options["chunk_size"])
+
+        total = 0
+
+        def counted(lines):
+            nonlocal total
+            for line in lines:
+                total += 1
+                yield line
+
+        chunks = counted(lines)
+        if options["gzip"]:
+            chunks = iter_gzip(chunks)
+
+        output = options["output"]
+        file = sys.stdout.buffer if output == "-" else open(output, "wb")
+        try:
+            for chunk in chunks:
+                file.write(chunk)
+        finally:
+            if file is not sys.stdout.buffer:
+                file.close()
+        self.stderr.write(f"Exported {total} {options['model']}.")
@@ -0,0 +1,84 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management import BaseCommand, call_command
+
+from posts.imports import (
+    DEFAULT_BATCH_SIZE,
+    IMPORTERS,
+    UserImporter,
+    open_source,
+    read_records,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Import posts, comments or users from an NDJSON or CSV file, validated "
+        "like the API input. A failed import resumes where it stopped when run again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("model", choices=sorted(IMPORTERS))
+        parser.add_argument("path", help="NDJSON or CSV file, optionally gzipped.")
+        parser.add_argument(
+            "--format",
+            choices=("ndjson", "csv"),
+            help="File format, by default taken from the file extension.",
+        )
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Processes hashing user passwords.",
+        )
+        parser.add_argument(
+            "--no-copy",
+            action="store_true",
+            help="Insert with INSERT instead of COPY on PostgreSQL.",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Start from the first record instead of the last checkpoint.",
+        )
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(options["path"])
+        format = options["format"]
+        if format is None:
+            format = "csv" if path.removesuffix(".gz").endswith(".csv") else "ndjson"
+        model = options["model"]
+        use_copy = not options["no_copy"]
+
+        pool = None
+        if model == "users" and options["workers"] > 1:
+            pool = ProcessPoolExecutor(options["workers"], initializer=django.setup)
+        try:
+            if model == "users":
+                importer = UserImporter(use_copy, pool)
+            else:
+                importer = IMPORTERS[model](use_copy)
+            with open_source(path) as file:
+                imported, invalid = importer.run(
+                    read_records(file, format),
+                    source=f"{model}:{path}",
+                    batch_size=options["batch_size"],
+                    restart=options["restart"],
+                    report=self.report,
+                )
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        if model == "comments":
+            # Comments inserted in bulk skip the counters the comment views keep.
+            call_command("rebuild_comment_counters", stdout=self.stdout)
+            call_command("recompute_hot_scores", "--full", stdout=self.stdout)
+        self.stdout.write(f"Imported {imported} {model}, {invalid} invalid records.")
+
+    def report(self, number, errors):
+        self.stderr.write(f"Record {number}: {json.dumps(errors, ensure_ascii=False)}")
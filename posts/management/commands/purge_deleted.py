@@ -0,0 +1,21 @@
+from django.core.management import BaseCommand
+
+from common.softdelete import DEFAULT_PURGE_BATCH_SIZE
+from posts.purge import purge_deleted
+from posts.reactions import reaction_counters
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the soft deleted users and posts with what depends on them, in "
+        "bounded batches. Deletes are purged in the background right away; this "
+        "picks up the purges a restart interrupted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_PURGE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        users, posts = purge_deleted(options["batch_size"])
+        reaction_counters.flush()
+        self.stdout.write(f"Purged {users} users and {posts} posts.")
@@ -0,0 +1,41 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max
+
+from posts.models import Comment, Post
+
+
+class Command(BaseCommand):
+    help = "Recompute Post.comment_count and Post.last_commented_at from the comments."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        last_id = 0
+        total = 0
+        while True:
+            with transaction.atomic():
+                posts = list(
+                    Post.objects.select_for_update()
+                    .filter(pk__gt=last_id)
+                    .order_by("pk")
+                    .only("pk")[:chunk_size]
+                )
+                if not posts:
+                    break
+                stats = {
+                    row["post_id"]: row
+                    for row in Comment.all_objects.filter(post__in=posts)
+                    .values("post_id")
+                    .annotate(count=Count("id"), last=Max("created_at"))
+                }
+                for post in posts:
+                    row = stats.get(post.pk, {})
+                    post.comment_count = row.get("count", 0)
+                    post.last_commented_at = row.get("last")
+                Post.objects.bulk_update(posts, ["comment_count", "last_commented_at"])
+            last_id = posts[-1].pk
+            total += len(posts)
+        self.stdout.write(f"Rebuilt comment counters for {total} posts.")
@@ -0,0 +1,46 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from posts.models import Comment, Post, Reaction
+
+
+class Command(BaseCommand):
+    help = "Recompute Post.like_count and Comment.like_count from the reactions."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for model in (Post, Comment):
+            total = self.rebuild(model, options["chunk_size"])
+            self.stdout.write(
+                f"Rebuilt like counters for {total} {model._meta.verbose_name_plural}."
+            )
+
+    def rebuild(self, model, chunk_size):
+        field = model._meta.model_name
+        last_id = 0
+        total = 0
+        while True:
+            with transaction.atomic():
+                objs = list(
+                    model.objects.select_for_update()
+                    .filter(pk__gt=last_id)
+                    .order_by("pk")
+                    .only("pk")[:chunk_size]
+                )
+                if not objs:
+                    break
+                counts = dict(
+                    Reaction.objects.filter(**{f"{field}__in": objs})
+                    .values(field)
+                    .annotate(count=Count("id"))
+                    .values_list(field, "count")
+                )
+                for obj in objs:
+                    obj.like_count = counts.get(obj.pk, 0)
+                model.objects.bulk_update(objs, ["like_count"])
+            last_id = objs[-1].pk
+            total += len(objs)
+        return total
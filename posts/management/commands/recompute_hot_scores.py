@@ -0,0 +1,48 @@
+from django.core.management import BaseCommand
+from django.db.models import Max
+from django.utils import timezone
+
+from posts.models import Post, hot_score
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute Post.hot_score for the posts that changed since the previous run. "
+        "Meant to be run every few minutes, for example from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument(
+            "--full", action="store_true", help="Recompute the score of every post."
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        started = timezone.now()
+        posts = Post.objects.all()
+        if not options["full"]:
+            # Every post scored by the previous run got that run's start time,
+            # and comments and edits bump updated_at, so only posts updated
+            # since then can have a different score.
+            since = Post.objects.aggregate(since=Max("hot_scored_at"))["since"]
+            if since is not None:
+                posts = posts.filter(updated_at__gte=since)
+
+        last_id = 0
+        total = 0
+        while True:
+            chunk = list(
+                posts.filter(pk__gt=last_id)
+                .order_by("pk")
+                .only("id", "comment_count", "created_at")[:chunk_size]
+            )
+            if not chunk:
+                break
+            for post in chunk:
+                post.hot_score = hot_score(post.comment_count, post.created_at)
+                post.hot_scored_at = started
+            Post.objects.bulk_update(chunk, ["hot_score", "hot_scored_at"])
+            last_id = chunk[-1].pk
+            total += len(chunk)
+        self.stdout.write(f"Recomputed hot scores of {total} posts.")
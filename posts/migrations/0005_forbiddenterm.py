@@ -0,0 +1,32 @@
+# Generated by Django 5.0.1 on 2026-10-17 20:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("posts", "0004_comment_counters"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ForbiddenTerm",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("term", models.CharField(max_length=255, unique=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "verbose_name": "forbidden term",
+                "verbose_name_plural": "forbidden terms",
+            },
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.0.1 on 2026-10-17 20:52
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_VECTORS = {
+    "posts_post": (
+        "setweight(to_tsvector('russian', coalesce({row}.title, '')), 'A') || "
+        "setweight(to_tsvector('russian', coalesce({row}.text, '')), 'B')",
+        "title, text",
+    ),
+    "posts_comment": (
+        "setweight(to_tsvector('russian', coalesce({row}.text, '')), 'A')",
+        "text",
+    ),
+}
+
+
+def create_search_triggers(apps, schema_editor):
+    """
+    Keep `search_vector` up to date with a trigger, backfill it and GIN-index
+    it. Only PostgreSQL has tsvector, other backends search with a fallback.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for table, (vector, columns) in SEARCH_VECTORS.items():
+        schema_editor.execute(
+            f"""
+            CREATE FUNCTION {table}_search_vector_update() RETURNS trigger AS $$
+            BEGIN
+                NEW.search_vector := {vector.format(row="NEW")};
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+            """
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {table}_search_vector_trigger "
+            f"BEFORE INSERT OR UPDATE OF {columns} ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION {table}_search_vector_update()"
+        )
+        schema_editor.execute(
+            f"UPDATE {table} SET search_vector = {vector.format(row=table)}"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX {table}_search_vector_idx ON {table} USING gin (search_vector)"
+        )
+
+
+def drop_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for table in SEARCH_VECTORS:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {table}_search_vector_idx")
+        schema_editor.execute(
+            f"DROP TRIGGER IF EXISTS {table}_search_vector_trigger ON {table}"
+        )
+        schema_editor.execute(f"DROP FUNCTION IF EXISTS {table}_search_vector_update()")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("posts", "0005_forbiddenterm"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(create_search_triggers, drop_search_triggers),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.0.1 on 2026-10-17 21:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, LPad
+
+
+def set_paths(apps, schema_editor):
+    # Every existing comment is on the post itself, so its path is its own id.
+    Comment = apps.get_model("posts", "Comment")
+    Comment.objects.update(path=LPad(Cast("id", CharField()), 12, Value("0")))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("posts", "0012_importcheckpoint"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="parent",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="replies",
+                to="posts.comment",
+            ),
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="path",
+            field=models.CharField(default="", editable=False, max_length=240),
+        ),
+        migrations.RunPython(set_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(fields=["post", "path"], name="comment_post_path_idx"),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-17 23:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("posts", "0015_soft_delete"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="post",
+            name="last_commented_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -1,12 +1,210 @@
-from django.db import models
+import math
+import uuid
+from datetime import datetime
 
+from django.contrib.postgres.search import SearchVectorField
+from django.db import connection, models, transaction
+from django.db.models import F, Max, OuterRef, Prefetch, Subquery
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from common.softdelete import LiveDependentManager, LiveManager, SoftDeleteQuerySet
+from posts.moderation import bump_lexicon_version
+from posts.search import search
 from users.models import User
 
+RECENT_COMMENTS = 3
+POST_SEARCH_WEIGHTS = {"title": 1.0, "text": 0.4}
+COMMENT_SEARCH_WEIGHTS = {"text": 1.0}
+HOT_SCORE_EPOCH = datetime.fromisoformat("2024-01-01T00:00:00+00:00")
+HOT_SCORE_PERIOD = 45000
+COMMENT_PATH_WIDTH = 12
+COMMENT_MAX_DEPTH = 20
+
+
+def hot_score(comment_count, created_at):
+    """
+    Rank a post by the order of magnitude of its comments plus its age: every
+    HOT_SCORE_PERIOD seconds of recency outweigh ten times as many comments,
+    so older posts decay without their scores ever being recomputed.
+    """
+    age = (created_at - HOT_SCORE_EPOCH).total_seconds()
+    return math.log10(max(comment_count, 1)) + age / HOT_SCORE_PERIOD
+
+
+def comment_path(parent_path, pk):
+    """
+    Return the materialized path of a comment: the zero-padded ids of its
+    ancestors followed by its own. Sorting by path lists every thread
+    depth-first, with replies in the order they were written.
+    """
+    return parent_path + str(pk).zfill(COMMENT_PATH_WIDTH)
+
+
+def allocate_ids(model, objs):
+    """
+    Give the objects without an id the next values of the id sequence of
+    their table. PostgreSQL only.
+    """
+    missing = [obj for obj in objs if obj.pk is None]
+    if not missing:
+        return
+    opts = model._meta
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, %s)) "
+            "FROM generate_series(1, %s)",
+            [opts.db_table, opts.pk.column, len(missing)],
+        )
+        for obj, (pk,) in zip(missing, cursor.fetchall()):
+            obj.pk = pk
+
+
+def last_comment_time():
+    """
+    Return the creation time of the newest remaining comment of each updated
+    post, or NULL for posts left without comments, served by the
+    (post, created_at, id) index.
+    """
+    return Subquery(
+        Comment.all_objects.filter(post=OuterRef("pk"))
+        .order_by()
+        .values("post")
+        .annotate(last=Max("created_at"))
+        .values("last")
+    )
+
+
+def recent_comments(lookup, expand):
+    """
+    Prefetch the RECENT_COMMENTS newest comments of the posts at `lookup` into `recent_comments`.
+    """
+    comments = Comment.objects.expand(expand).order_by("-created_at", "-id")
+    return Prefetch(lookup, queryset=comments[:RECENT_COMMENTS], to_attr="recent_comments")
+
+
+class PostQuerySet(SoftDeleteQuerySet):
+    def expand(self, expand):
+        """
+        Load what the requested serializer expansions read, in a fixed number of queries.
+        """
+        queryset = self
+        if "author" in expand:
+            queryset = queryset.select_related("user")
+        if "comments" in expand:
+            queryset = queryset.prefetch_related(recent_comments("comment_set", expand))
+        return queryset
+
+    def add_comments(self, count):
+        """
+        Adjust the comment counters by `count` (negative for removed comments)
+        and return the number of posts updated. Removals have to be called in
+        the transaction of the delete, after it, so the last comment time is
+        recomputed from the comments that remain.
+        """
+        now = timezone.now()
+        fields = {"comment_count": F("comment_count") + count, "updated_at": now}
+        if count > 0:
+            fields["last_commented_at"] = now
+        elif count < 0:
+            fields["last_commented_at"] = last_comment_time()
+        return self.update(**fields)
+
+    def search(self, query):
+        """
+        Keep the posts matching `query`, annotated with `rank` and `snippet`.
+        """
+        return search(self, query, POST_SEARCH_WEIGHTS, "text")
+
+
+class CommentQuerySet(models.QuerySet):
+    def expand(self, expand):
+        """
+        Load what the requested serializer expansions read, in a fixed number of queries.
+        """
+        queryset = self
+        if "author" in expand:
+            queryset = queryset.select_related("user")
+        return queryset
+
+    def search(self, query):
+        """
+        Keep the comments matching `query`, annotated with `rank` and `snippet`.
+        """
+        return search(self, query, COMMENT_SEARCH_WEIGHTS, "text")
+
+    def subtree(self, path):
+        """
+        Keep the comment at `path` and all its replies, at any depth.
+
+        Paths are digits only, so the subtree is the range of paths from
+        `path` up to the next number of the same length, which compares the
+        same in every collation and is served by the (post, path) index.
+        """
+        successor = str(int(path) + 1).zfill(len(path))
+        if len(successor) > len(path):
+            return self.filter(path__gte=path)
+        return self.filter(path__gte=path, path__lt=successor)
+
+    def set_paths(self, comments):
+        """
+        Fill in the paths of comments inserted in bulk, whose ids were not
+        known before the insert.
+        """
+        for comment in comments:
+            parent_path = comment.parent.path if comment.parent_id else ""
+            comment.path = comment_path(parent_path, comment.pk)
+        self.bulk_update(comments, ["path"])
+
+
+class TimelineEntryQuerySet(models.QuerySet):
+    def expand(self, expand):
+        """
+        Load what the requested serializer expansions read from the timeline posts.
+        """
+        queryset = self
+        if "author" in expand:
+            queryset = queryset.select_related("post__user")
+        if "comments" in expand:
+            queryset = queryset.prefetch_related(
+                recent_comments("post__comment_set", expand)
+            )
+        return queryset
+
+
+class ForbiddenTermQuerySet(models.QuerySet):
+    """
+    Bulk writes send no save signal, so they bump the lexicon version
+    themselves, once committed. Deletes send post_delete for every row.
+    """
+
+    def update(self, **kwargs):
+        transaction.on_commit(bump_lexicon_version)
+        return super().update(**kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        transaction.on_commit(bump_lexicon_version)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        transaction.on_commit(bump_lexicon_version)
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
 
 class Post(models.Model):
     """
     Post - A model that represents a post created by a user.
     It contains information about the title, text, image (if there is one), and the user who created the post.
+    The comment counter and last comment time are kept up to date by the comment views,
+    so feeds can read and sort by them without aggregating over the comments.
+    The search vector is maintained by a database trigger and GIN-indexed on PostgreSQL.
+    Resized copies of the image are rendered in the background and listed in image_variants.
+    The hot score is recomputed periodically by the recompute_hot_scores command.
+    The like counter is written in batches by the reaction counter buffer (see posts.reactions).
+    A deleted post is only marked with deleted_at, which hides it from `objects`, as does
+    deleting its author, and is removed with its comments by the purge_deleted command
+    in bounded batches. The listing indexes are partial, over the posts that are not deleted.
     """
 
     title = models.CharField(max_length=255)
@@ -15,6 +213,17 @@ class Post(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="creator")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    comment_count = models.PositiveIntegerField(default=0)
+    last_commented_at = models.DateTimeField(null=True, blank=True, editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    hot_score = models.FloatField(default=0, editable=False)
+    hot_scored_at = models.DateTimeField(null=True, editable=False)
+    like_count = models.PositiveIntegerField(default=0, editable=False)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = LiveManager.from_queryset(PostQuerySet)("user")
+    all_objects = PostQuerySet.as_manager()
 
     def __str__(self):
         return self.title
@@ -22,6 +231,30 @@ class Post(models.Model):
     class Meta:
         verbose_name = 'post'
         verbose_name_plural = 'posts'
+        indexes = [
+            models.Index(
+                fields=["created_at", "id"],
+                condition=models.Q(deleted_at__isnull=True),
+                name="post_created_at_id_idx",
+            ),
+            models.Index(
+                fields=["last_commented_at", "id"],
+                condition=models.Q(deleted_at__isnull=True),
+                name="post_last_commented_id_idx",
+            ),
+            models.Index(
+                fields=["hot_score", "id"],
+                condition=models.Q(deleted_at__isnull=True),
+                name="post_hot_score_id_idx",
+            ),
+            models.Index(fields=["updated_at"], name="post_updated_at_idx"),
+            models.Index(fields=["hot_scored_at"], name="post_hot_scored_at_idx"),
+            models.Index(
+                fields=["deleted_at"],
+                condition=models.Q(deleted_at__isnull=False),
+                name="post_deleted_at_idx",
+            ),
+        ]
 
 
 class Comment(models.Model):
@@ -29,17 +262,215 @@ class Comment(models.Model):
     Comment - A model that represents a comment added by a user to a post.
     It contains information about the user who added the comment, the post it refers to,
     and the text of the comment.
+    The search vector is maintained by a database trigger and GIN-indexed on PostgreSQL.
+    A comment can reply to another comment of the same post. The materialized path
+    (see comment_path) is written by the insert on PostgreSQL, which draws the id
+    first, and right after it elsewhere, so a thread or a subtree is read with one
+    range scan of the (post, path) index.
+    The like counter is written in batches by the reaction counter buffer (see posts.reactions).
+    The comments of a deleted post, of its deleted author or of a deleted user are hidden
+    from `objects` until they are purged.
     """
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="commentator")
     post = models.ForeignKey(Post, on_delete=models.CASCADE)
+    parent = models.ForeignKey(
+        "self", on_delete=models.CASCADE, null=True, blank=True, related_name="replies"
+    )
+    path = models.CharField(
+        max_length=COMMENT_PATH_WIDTH * COMMENT_MAX_DEPTH, default="", editable=False
+    )
     text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    search_vector = SearchVectorField(null=True, editable=False)
+    like_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = LiveDependentManager.from_queryset(CommentQuerySet)(
+        "post", "post__user", "user"
+    )
+    all_objects = CommentQuerySet.as_manager()
 
     def __str__(self):
         return self.text
 
+    @property
+    def depth(self):
+        """
+        The nesting level of the comment, 1 for a comment on the post itself.
+        """
+        return len(self.path) // COMMENT_PATH_WIDTH
+
+    def save(self, *args, **kwargs):
+        if self.path:
+            return super().save(*args, **kwargs)
+        parent_path = self.parent.path if self.parent_id else ""
+        if self.pk is None and connection.vendor == "postgresql":
+            # Draw the id from the sequence first, so the INSERT writes the path.
+            allocate_ids(Comment, [self])
+            self.path = comment_path(parent_path, self.pk)
+            kwargs["force_insert"] = True
+            return super().save(*args, **kwargs)
+        super().save(*args, **kwargs)
+        self.path = comment_path(parent_path, self.pk)
+        Comment.all_objects.filter(pk=self.pk).update(path=self.path)
+
     class Meta:
         verbose_name = 'comment'
         verbose_name_plural = 'comments'
+        indexes = [
+            models.Index(
+                fields=["post", "created_at", "id"],
+                name="comment_post_created_at_id_idx",
+            ),
+            models.Index(
+                fields=["updated_at", "id"], name="comment_updated_at_id_idx"
+            ),
+            models.Index(fields=["post", "path"], name="comment_post_path_idx"),
+        ]
+
+
+class ForbiddenTerm(models.Model):
+    """
+    ForbiddenTerm - A word or phrase that post titles, post texts and comments must not contain.
+    Every write, single or bulk, bumps the lexicon version once it is committed.
+    """
+
+    term = models.CharField(max_length=255, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.term
+
+    objects = ForbiddenTermQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        self.term = self.term.strip().lower()
+        super().save(*args, **kwargs)
+
+    class Meta:
+        verbose_name = 'forbidden term'
+        verbose_name_plural = 'forbidden terms'
+
+
+@receiver([post_save, post_delete], sender=ForbiddenTerm)
+def forbidden_term_changed(sender, **kwargs):
+    transaction.on_commit(bump_lexicon_version)
+
+
+class Upload(models.Model):
+    """
+    Upload - An image being uploaded by a user in chunks.
+    Every accepted chunk is stored as a separate part, listed in order as (name, size) pairs,
+    so an interrupted upload can resume from the received offset. Completing the upload
+    concatenates the parts into the image of a new post.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="uploads")
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    content_type = models.CharField(max_length=50, blank=True)
+    parts = models.JSONField(default=list, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.filename
+
+    class Meta:
+        verbose_name = 'upload'
+        verbose_name_plural = 'uploads'
+
+
+class TimelineEntry(models.Model):
+    """
+    TimelineEntry - A post in the home timeline of a user, written when someone the user follows
+    creates the post. The creation time of the post is copied, so a page of a timeline
+    is a single range scan of the (user, created_at, post) index.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="timeline")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="timeline_entries")
+    created_at = models.DateTimeField()
+
+    objects = TimelineEntryQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.user_id}: {self.post_id}"
+
+    class Meta:
+        verbose_name = 'timeline entry'
+        verbose_name_plural = 'timeline entries'
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "post"], name="timeline_user_post_uniq"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "created_at", "post"],
+                name="timeline_user_created_post_idx",
+            ),
+        ]
+
+
+class ImportCheckpoint(models.Model):
+    """
+    ImportCheckpoint - How many records of a file the import_ndjson command has read.
+    It is updated in the same transaction as every inserted batch, so a failed import
+    resumes right after the last committed batch.
+    """
+
+    source = models.CharField(max_length=1024, unique=True)
+    position = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source}: {self.position}"
+
+    class Meta:
+        verbose_name = 'import checkpoint'
+        verbose_name_plural = 'import checkpoints'
+
+
+class Reaction(models.Model):
+    """
+    Reaction - A like given by a user to either a post or a comment.
+    A user likes a post or a comment at most once, which the partial unique constraints
+    enforce, so liking twice is a no-op and the like counters can be rebuilt by counting rows.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="reactions")
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, null=True, blank=True, related_name="reactions"
+    )
+    comment = models.ForeignKey(
+        Comment, on_delete=models.CASCADE, null=True, blank=True, related_name="reactions"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.post_id or self.comment_id}"
+
+    class Meta:
+        verbose_name = 'reaction'
+        verbose_name_plural = 'reactions'
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(post__isnull=False, comment__isnull=True)
+                | models.Q(post__isnull=True, comment__isnull=False),
+                name="reaction_single_target",
+            ),
+            models.UniqueConstraint(
+                fields=["user", "post"],
+                condition=models.Q(post__isnull=False),
+                name="reaction_user_post_uniq",
+            ),
+            models.UniqueConstraint(
+                fields=["user", "comment"],
+                condition=models.Q(comment__isnull=False),
+                name="reaction_user_comment_uniq",
+            ),
+        ]
@@ -0,0 +1,120 @@
+import os
+import uuid
+from collections import deque
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+
+DEFAULT_TERMS = ("ерунда", "глупость", "чепуха")
+LEXICON_VERSION_KEY = "moderation:lexicon-version"
+
+
+class AhoCorasick:
+    """
+    Aho–Corasick automaton over a set of terms.
+
+    `contains()` walks the text once, following failure links on mismatches,
+    so a check takes time linear in the length of the text whatever the
+    number of terms.
+    """
+
+    def __init__(self, terms):
+        self.goto = [{}]
+        self.fail = [0]
+        self.terminal = [False]
+        for term in terms:
+            self.add(term)
+        self.link()
+
+    def add(self, term):
+        state = 0
+        for char in term:
+            following = self.goto[state].get(char)
+            if following is None:
+                following = len(self.goto)
+                self.goto[state][char] = following
+                self.goto.append({})
+                self.fail.append(0)
+                self.terminal.append(False)
+            state = following
+        if term:
+            self.terminal[state] = True
+
+    def link(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, following in self.goto[state].items():
+                queue.append(following)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[following] = self.goto[fallback].get(char, 0)
+                if self.terminal[self.fail[following]]:
+                    self.terminal[following] = True
+
+    def contains(self, text):
+        goto, fail, terminal = self.goto, self.fail, self.terminal
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if terminal[state]:
+                return True
+        return False
+
+
+class Lexicon:
+    """
+    Forbidden terms from DEFAULT_TERMS, the ForbiddenTerm table and the
+    optional MODERATION_LEXICON_FILE (one term per line), compiled into a
+    single automaton.
+
+    The automaton is rebuilt only when the version stored in the cache (bumped
+    once a ForbiddenTerm write is committed) or the modification time of the file changes.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.version = None
+        self.matcher = None
+
+    def current_version(self):
+        version = cache.get(LEXICON_VERSION_KEY)
+        if version is None:
+            cache.add(LEXICON_VERSION_KEY, uuid.uuid4().hex, None)
+            version = cache.get(LEXICON_VERSION_KEY)
+        path = getattr(settings, "MODERATION_LEXICON_FILE", None)
+        mtime = os.stat(path).st_mtime_ns if path else None
+        return version, path, mtime
+
+    def load_terms(self, path):
+        from posts.models import ForbiddenTerm
+
+        terms = set(DEFAULT_TERMS)
+        terms.update(ForbiddenTerm.objects.values_list("term", flat=True))
+        if path:
+            with open(path, encoding="utf-8") as file:
+                terms.update(line.strip() for line in file)
+        return {term.lower() for term in terms if term}
+
+    def get_matcher(self):
+        version = self.current_version()
+        if version != self.version:
+            with self.lock:
+                if version != self.version:
+                    self.matcher = AhoCorasick(self.load_terms(version[1]))
+                    self.version = version
+        return self.matcher
+
+    def contains(self, text):
+        return self.get_matcher().contains(text.lower())
+
+
+def bump_lexicon_version():
+    cache.set(LEXICON_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+lexicon = Lexicon()
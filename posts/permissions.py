@@ -5,4 +5,4 @@ class IsOwner(BasePermission):
     message = "U must to be the owner!"
 
     def has_object_permission(self, request, view, obj):
-        return request.user == obj.user
+        return request.user.pk == obj.user_id
@@ -0,0 +1,140 @@
+from collections import Counter
+from itertools import islice
+
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from common.softdelete import DEFAULT_PURGE_BATCH_SIZE, delete_in_batches
+from posts.cache import comment_cache, post_cache
+from posts.models import Comment, Post, Reaction, TimelineEntry, last_comment_time
+from posts.reactions import reaction_counters
+from users.models import Follow, User
+
+
+def recount_comments(post_ids):
+    """
+    Recompute the comment counters and last comment times of posts some
+    comments were purged from.
+    """
+    counts = (
+        Comment.all_objects.filter(post=OuterRef("pk"))
+        .order_by()
+        .values("post")
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    Post.all_objects.filter(pk__in=post_ids).update(
+        comment_count=Coalesce(Subquery(counts), Value(0)),
+        last_commented_at=last_comment_time(),
+        updated_at=timezone.now(),
+    )
+    post_cache.invalidate_many(post_ids)
+
+
+def take_back_likes(pks):
+    """
+    Decrement the like counters of what the reactions `pks` were given to.
+    """
+    targets = Reaction.objects.filter(pk__in=pks).values_list("post_id", "comment_id")
+    for post_id, comment_id in targets:
+        if post_id is not None:
+            reaction_counters.add(Post, post_id, "like_count", -1)
+        else:
+            reaction_counters.add(Comment, comment_id, "like_count", -1)
+
+
+def drop_followers(pks):
+    """
+    Decrement the follower counters of the users followed by the follows `pks`.
+    """
+    follows = Follow.objects.filter(pk__in=pks).values_list("followee_id", flat=True)
+    for followee_id, count in Counter(follows).items():
+        User.all_objects.filter(pk=followee_id).update(
+            follower_count=F("follower_count") - count, updated_at=timezone.now()
+        )
+
+
+def forget_payloads(queryset, payload_cache, batch_size=DEFAULT_PURGE_BATCH_SIZE):
+    """
+    Drop the cached payloads of the rows of `queryset`, `batch_size` ids at a
+    time. Soft deleting hides rows from queries right away, and this hides them
+    from the cache before the purge reaches them.
+    """
+    pks = queryset.order_by("pk").values_list("pk", flat=True).iterator(batch_size)
+    while batch := list(islice(pks, batch_size)):
+        payload_cache.invalidate_many(batch)
+
+
+def purge_post(post_id, batch_size=DEFAULT_PURGE_BATCH_SIZE):
+    """
+    Delete a post with its comments, likes and timeline entries, at most
+    `batch_size` rows at a time. Comments go deepest first, so deleting one
+    never cascades to replies left for a later batch.
+    """
+    forget_payloads(Comment.all_objects.filter(post_id=post_id), comment_cache, batch_size)
+    delete_in_batches(
+        Comment.all_objects.filter(post_id=post_id).order_by("-path"),
+        batch_size,
+        before=comment_cache.invalidate_many,
+    )
+    delete_in_batches(Reaction.objects.filter(post_id=post_id), batch_size)
+    delete_in_batches(TimelineEntry.objects.filter(post_id=post_id), batch_size)
+    Post.all_objects.filter(pk=post_id).delete()
+    post_cache.invalidate(post_id)
+
+
+def purge_user(user_id, batch_size=DEFAULT_PURGE_BATCH_SIZE):
+    """
+    Delete a soft deleted user with everything they wrote, at most
+    `batch_size` rows at a time, keeping the counters of what remains right.
+    """
+    if not User.all_objects.deleted().filter(pk=user_id).exists():
+        return
+    forget_payloads(Post.all_objects.filter(user_id=user_id), post_cache, batch_size)
+    for comments in (
+        Comment.all_objects.filter(user_id=user_id),
+        Comment.all_objects.filter(post__user_id=user_id),
+    ):
+        forget_payloads(comments, comment_cache, batch_size)
+    while post_ids := list(
+        Post.all_objects.filter(user_id=user_id).values_list("pk", flat=True)[
+            :batch_size
+        ]
+    ):
+        for post_id in post_ids:
+            purge_post(post_id, batch_size)
+
+    post_ids = set(
+        Comment.all_objects.filter(user_id=user_id).values_list("post_id", flat=True)
+    )
+    for post_id in post_ids:
+        delete_in_batches(
+            Comment.all_objects.filter(post_id=post_id, user_id=user_id).order_by("-path"),
+            batch_size,
+            before=comment_cache.invalidate_many,
+        )
+        recount_comments([post_id])
+
+    delete_in_batches(
+        Reaction.objects.filter(user_id=user_id), batch_size, before=take_back_likes
+    )
+    delete_in_batches(
+        Follow.objects.filter(follower_id=user_id), batch_size, before=drop_followers
+    )
+    delete_in_batches(Follow.objects.filter(followee_id=user_id), batch_size)
+    delete_in_batches(TimelineEntry.objects.filter(user_id=user_id), batch_size)
+    User.all_objects.filter(pk=user_id).delete()
+
+
+def purge_deleted(batch_size=DEFAULT_PURGE_BATCH_SIZE):
+    """
+    Purge all the soft deleted users and posts, and return how many of each.
+    """
+    user_ids = list(User.all_objects.deleted().values_list("pk", flat=True))
+    for user_id in user_ids:
+        purge_user(user_id, batch_size)
+    post_ids = list(Post.all_objects.deleted().values_list("pk", flat=True))
+    for post_id in post_ids:
+        purge_post(post_id, batch_size)
+    return len(user_ids), len(post_ids)
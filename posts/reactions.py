@@ -0,0 +1,39 @@
+from django.db import transaction
+
+from common.counters import CounterBuffer
+from posts.cache import comment_cache, post_cache
+from posts.models import Comment, Post, Reaction
+
+# Like counters of posts and comments, written in batches: a viral post takes
+# one row lock per flush instead of one per like.
+reaction_counters = CounterBuffer(
+    on_flush={Post: post_cache.invalidate_many, Comment: comment_cache.invalidate_many}
+)
+
+
+def like(user_id, target):
+    """
+    Like a post or a comment, and return whether it was not liked already.
+    """
+    field = target._meta.model_name
+    with transaction.atomic():
+        _, created = Reaction.objects.get_or_create(
+            user_id=user_id, **{f"{field}_id": target.pk}
+        )
+        if created:
+            reaction_counters.add(type(target), target.pk, "like_count", 1)
+    return created
+
+
+def unlike(user_id, target):
+    """
+    Take back the like of a post or a comment, and return whether there was one.
+    """
+    field = target._meta.model_name
+    with transaction.atomic():
+        deleted, _ = Reaction.objects.filter(
+            user_id=user_id, **{f"{field}_id": target.pk}
+        ).delete()
+        if deleted:
+            reaction_counters.add(type(target), target.pk, "like_count", -1)
+    return bool(deleted)
@@ -0,0 +1,96 @@
+import operator
+import re
+from functools import reduce
+
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.functions import Cast, Replace
+from django.utils.html import escape
+
+# Must match the text search configuration of the triggers in migration 0006.
+SEARCH_CONFIG = "russian"
+HEADLINE_START = "<mark>"
+HEADLINE_STOP = "</mark>"
+HEADLINE_WORDS = 35
+# What django.utils.html.escape replaces, ampersands first.
+HTML_ESCAPES = (
+    ("&", "&amp;"),
+    ("<", "&lt;"),
+    (">", "&gt;"),
+    ('"', "&quot;"),
+    ("'", "&#x27;"),
+)
+
+
+def escape_html(expression):
+    """
+    Escape the text of `expression` in SQL the way django.utils.html.escape does.
+    """
+    for char, entity in HTML_ESCAPES:
+        expression = Replace(expression, Value(char), Value(entity))
+    return expression
+
+
+def search(queryset, query, weights, snippet_field):
+    """
+    Filter `queryset` down to the rows matching `query` and annotate them with
+    a float `rank` and, on PostgreSQL, a highlighted `snippet`. Snippets are
+    HTML: the text is escaped and only the query words are marked up.
+
+    PostgreSQL matches against the GIN-indexed `search_vector` column. Other
+    backends fall back to case-insensitive containment of every query word,
+    ranked by the `weights` of the fields each word was found in.
+    """
+    if connections[queryset.db].vendor == "postgresql":
+        search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type="websearch")
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=Cast(SearchRank(F("search_vector"), search_query), FloatField()),
+            snippet=SearchHeadline(
+                escape_html(F(snippet_field)),
+                search_query,
+                config=SEARCH_CONFIG,
+                start_sel=HEADLINE_START,
+                stop_sel=HEADLINE_STOP,
+                max_words=HEADLINE_WORDS,
+            ),
+        )
+
+    condition = Q()
+    rank = Value(0.0)
+    for word in query.split():
+        condition &= reduce(
+            operator.or_, (Q(**{f"{field}__icontains": word}) for field in weights)
+        )
+        rank += Case(
+            *(
+                When(**{f"{field}__icontains": word, "then": Value(weight)})
+                for field, weight in weights.items()
+            ),
+            default=Value(0.0),
+        )
+    return queryset.filter(condition).annotate(rank=Cast(rank, FloatField()))
+
+
+def headline(text, query, max_words=HEADLINE_WORDS):
+    """
+    Build a snippet of `text` around the first query word, with the query
+    words marked the same way PostgreSQL's ts_headline marks them and the
+    rest of the text HTML-escaped.
+    """
+    words = [re.escape(word) for word in query.split()]
+    if not words:
+        return ""
+    pattern = re.compile("|".join(words), re.IGNORECASE)
+    tokens = text.split()
+    first = next((i for i, token in enumerate(tokens) if pattern.search(token)), 0)
+    start = max(0, first - max_words // 3)
+    fragment = " ".join(tokens[start : start + max_words])
+    parts = []
+    end = 0
+    for match in pattern.finditer(fragment):
+        parts.append(escape(fragment[end : match.start()]))
+        parts.append(f"{HEADLINE_START}{escape(match.group())}{HEADLINE_STOP}")
+        end = match.end()
+    parts.append(escape(fragment[end:]))
+    return "".join(parts)
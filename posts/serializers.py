@@ -1,30 +1,147 @@
+from django.conf import settings
 from rest_framework import serializers
 
-from posts.models import Post, Comment
-from posts.validators import validate_title
+from common.expansions import ExpandableFieldsMixin
+from common.serializers import BulkCreateListSerializer
+from posts.models import COMMENT_MAX_DEPTH, Post, Comment, Upload
+from posts.search import headline
+from posts.validators import validate_text, validate_title
+from users.serializers import UserSummarySerializer
 
 
 class PostCreateSerializer(serializers.ModelSerializer):
     title = serializers.CharField(validators=[validate_title])
+    text = serializers.CharField(validators=[validate_text])
     class Meta:
         model = Post
-        fields = ("title", "text", "image",)
+        fields = ("id", "title", "text", "image",)
+        list_serializer_class = BulkCreateListSerializer
 
 
-class PostSerializer(serializers.ModelSerializer):
+class CommentSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    author = UserSummarySerializer(source="user", read_only=True)
+
+    class Meta:
+        model = Comment
+        exclude = ("search_vector", "path")
+        expandable_fields = ("author",)
+        extra_kwargs = {
+            "text": {"validators": [validate_text]},
+            "parent": {"read_only": True},
+        }
+
+
+class PostSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    author = UserSummarySerializer(source="user", read_only=True)
+    comment_count = serializers.IntegerField(read_only=True)
+    comments = CommentSerializer(source="recent_comments", many=True, read_only=True)
 
     class Meta:
         model = Post
-        fields = "__all__"
+        exclude = ("search_vector", "hot_score", "hot_scored_at", "deleted_at")
+        expandable_fields = ("author", "comment_count", "comments")
+        extra_kwargs = {
+            "title": {"validators": [validate_title]},
+            "text": {"validators": [validate_text]},
+        }
 
 
 class CommentCreateSerializer(serializers.ModelSerializer):
+    text = serializers.CharField(validators=[validate_text])
+    parent = serializers.PrimaryKeyRelatedField(
+        queryset=Comment.objects.only("id", "post_id", "path"),
+        required=False,
+        allow_null=True,
+    )
+
     class Meta:
         model = Comment
-        fields = ("text",)
+        fields = ("id", "text", "parent",)
+        list_serializer_class = BulkCreateListSerializer
+
+    def validate_parent(self, parent):
+        if parent is None:
+            return parent
+        if str(parent.post_id) != str(self.context["view"].kwargs["post_id"]):
+            raise serializers.ValidationError(
+                "The comment replied to is on another post."
+            )
+        if parent.depth >= COMMENT_MAX_DEPTH:
+            raise serializers.ValidationError(
+                f"Replies can not be nested more than {COMMENT_MAX_DEPTH} levels deep."
+            )
+        return parent
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class PostImportSerializer(serializers.ModelSerializer):
+    """
+    A post read by the import_ndjson command. The author is a plain id, checked
+    for a whole batch at once instead of with a query per record.
+    """
+
+    id = serializers.IntegerField(required=False, min_value=1)
+    user = serializers.IntegerField(source="user_id")
+
+    class Meta:
+        model = Post
+        fields = ("id", "user", "title", "text",)
+        extra_kwargs = {
+            "title": {"validators": [validate_title]},
+            "text": {"validators": [validate_text]},
+        }
+
+
+class CommentImportSerializer(serializers.ModelSerializer):
+    """
+    A comment read by the import_ndjson command. The author and the post are plain
+    ids, checked for a whole batch at once instead of with a query per record.
+    """
+
+    id = serializers.IntegerField(required=False, min_value=1)
+    user = serializers.IntegerField(source="user_id")
+    post = serializers.IntegerField(source="post_id")
+
     class Meta:
         model = Comment
-        fields = "__all__"
+        fields = ("id", "user", "post", "text",)
+        extra_kwargs = {"text": {"validators": [validate_text]}}
+
+
+class SearchResultMixin(serializers.Serializer):
+    """
+    Add the search rank and a highlighted snippet of the text to a result.
+    """
+
+    rank = serializers.FloatField(read_only=True)
+    snippet = serializers.SerializerMethodField()
+
+    def get_snippet(self, obj):
+        if hasattr(obj, "snippet"):
+            return obj.snippet
+        return headline(obj.text, self.context["query"])
+
+
+class PostSearchSerializer(SearchResultMixin, PostSerializer):
+    """
+    A post found by search.
+    """
+
+
+class CommentSearchSerializer(SearchResultMixin, CommentSerializer):
+    """
+    A comment found by search.
+    """
+
+
+class UploadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Upload
+        fields = ("id", "filename", "size", "received", "content_type", "created_at",)
+        read_only_fields = ("received", "content_type",)
+
+    def validate_size(self, value):
+        if not 0 < value <= settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f"Size must be between 1 and {settings.UPLOAD_MAX_SIZE} bytes."
+            )
+        return value
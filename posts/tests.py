@@ -1,10 +1,63 @@
-from django.test import TestCase, Client
+import asyncio
+import gc
+import gzip
+import itertools
+import json
+import os
+import statistics
+import random
+import re
+import string
+import shutil
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import skipUnless
+from unittest.mock import MagicMock, Mock, patch
+from urllib.request import urlopen
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.core.servers.basehttp import WSGIServer
+from django.test import AsyncClient, LiveServerTestCase, TestCase, TransactionTestCase, Client, override_settings
+from django.test.testcases import LiveServerThread
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
 from rest_framework import status
-from rest_framework.test import APITestCase, APIClient
-from .models import Post, Comment
-from .serializers import PostSerializer, CommentSerializer
+from rest_framework.test import APITestCase, APIClient, APIRequestFactory
+from rest_framework.views import APIView
+from PIL import Image
+from .models import Post, Comment, ForbiddenTerm, ImportCheckpoint, Reaction, TimelineEntry, Upload, comment_path, hot_score
+from .models import COMMENT_MAX_DEPTH, COMMENT_PATH_WIDTH
+from .moderation import AhoCorasick, lexicon
+from .purge import forget_payloads
+from .serializers import PostSerializer, PostCreateSerializer, CommentSerializer
 from django.contrib.auth import get_user_model
+from common.cache import ReadThroughCache
+from common.counters import CounterBuffer
+from common.metrics import install_query_recorder, registry
+from common.middleware import set_statement_timeout
+from common.pagination import KeysetPagination
+from common.throttling import ScopedThrottle, SlidingWindowThrottle
+from common.tasks import run_task
+from .cache import comment_cache, post_cache
+from .images import build_image_variants
+from .imports import PostImporter
+from .threads import build_tree
+from .timelines import fan_out_posts
+from .views import PostExport
+from users.models import Follow
+from users.serializers import ClaimsTokenObtainPairSerializer
 
 User = get_user_model()
 
@@ -34,9 +87,9 @@ class PostTests(APITestCase):
 
     def test_get_post_list(self):
         response = self.client.get(reverse("posts:post_list"))
-        posts = Post.objects.all()
+        posts = Post.objects.order_by("-created_at", "-id")
         serializer = PostSerializer(posts, many=True)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data["results"], serializer.data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
     def test_get_post_detail(self):
@@ -100,7 +153,7 @@ class CommentTests(APITestCase):
         )
         comments = Comment.objects.filter(post=self.post)
         serializer = CommentSerializer(comments, many=True)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data["results"], serializer.data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
     def test_get_comment_detail(self):
@@ -180,7 +233,7 @@ class PostValidationTests(APITestCase):
         response = client.post(
             reverse("posts:post_create"), post_data, format="json"
         )
-        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
     def test_create_post_no_title(self):
         post_data = {"text": "This is a test post.", "user": self.user.id}
@@ -315,3 +368,2640 @@ class PermissionsTests(APITestCase):
             reverse("posts:post_delete", kwargs={"pk": post.id})
         )
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+            email="test@mail.ru",
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        Post.objects.bulk_create(
+            Post(title=f"Post {i}", text="text", user=self.user) for i in range(60)
+        )
+
+    def walk(self, page_size):
+        url = reverse("posts:post_list") + f"?page_size={page_size}"
+        pages = []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append((response.data["results"], queries.captured_queries))
+            url = response.data["next"]
+        return pages
+
+    def test_pages_cover_every_post_once_in_order(self):
+        pages = self.walk(page_size=7)
+        ids = [post["id"] for results, _ in pages for post in results]
+        expected = list(
+            Post.objects.order_by("-created_at", "-id").values_list("id", flat=True)
+        )
+        self.assertEqual(ids, expected)
+
+    def test_query_count_is_flat_and_never_uses_offset(self):
+        pages = self.walk(page_size=5)
+        self.assertEqual(len(pages), 12)
+        for _, queries in pages:
+            self.assertEqual(len(queries), 1)
+            self.assertNotIn("OFFSET", queries[0]["sql"].upper())
+
+    def test_query_plan_is_flat_as_offset_grows(self):
+        paginator = KeysetPagination()
+        paginator.ordering = paginator.get_ordering(view=None)
+        posts = list(Post.objects.order_by("-created_at", "-id"))
+
+        def plan(position_index):
+            position = paginator.get_position(posts[position_index])
+            queryset = paginator.filter_queryset(Post.objects.all(), position)
+            return re.sub(r"[\d.]+", "?", queryset[:6].explain())
+
+        self.assertEqual(plan(4), plan(54))
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("posts:post_list") + "?cursor=bogus")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class PostCommentListTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+            email="test@mail.ru",
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.post = Post.objects.create(title="Post", text="text", user=self.user)
+        self.other_post = Post.objects.create(
+            title="Other", text="text", user=self.user
+        )
+        Comment.objects.bulk_create(
+            Comment(post=post, user=self.user, text=f"Comment {i}")
+            for i in range(25)
+            for post in (self.post, self.other_post)
+        )
+
+    def test_lists_only_comments_of_the_post_oldest_first(self):
+        url = reverse("comments:comment_list", kwargs={"post_id": self.post.id})
+        url += "?page_size=10"
+        ids = []
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            ids += [comment["id"] for comment in response.data["results"]]
+            url = response.data["next"]
+        expected = list(
+            Comment.objects.filter(post=self.post)
+            .order_by("created_at", "id")
+            .values_list("id", flat=True)
+        )
+        self.assertEqual(ids, expected)
+
+    def test_post_without_comments(self):
+        post = Post.objects.create(title="Empty", text="text", user=self.user)
+        response = self.client.get(
+            reverse("comments:comment_list", kwargs={"post_id": post.id})
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"], [])
+
+    def test_missing_post(self):
+        response = self.client.get(
+            reverse("comments:comment_list", kwargs={"post_id": 9999})
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ExpandTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+            email="test@mail.ru",
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def create_posts(self, count):
+        authors = User.objects.bulk_create(
+            User(
+                username=f"author{i}",
+                phone_number=f"+7{i}",
+                birth_date="2000-01-01",
+                email=f"author{i}@mail.ru",
+            )
+            for i in range(min(count, 50))
+        )
+        comments_per_post = min(len(authors), 2)
+        posts = Post.objects.bulk_create(
+            Post(
+                title=f"Post {i}",
+                text="text",
+                user=authors[i % len(authors)],
+                comment_count=comments_per_post,
+            )
+            for i in range(count)
+        )
+        Comment.objects.bulk_create(
+            Comment(post=post, user=authors[j], text="text")
+            for post in posts
+            for j in range(comments_per_post)
+        )
+
+    def test_no_expansions_by_default(self):
+        self.create_posts(1)
+        response = self.client.get(reverse("posts:post_list"))
+        self.assertNotIn("author", response.data["results"][0])
+        self.assertNotIn("comment_count", response.data["results"][0])
+
+    def test_expanded_fields(self):
+        self.create_posts(1)
+        post = Post.objects.get()
+        response = self.client.get(
+            reverse("posts:post_retrieve", kwargs={"pk": post.id}),
+            {"expand": "author,comment_count,comments"},
+        )
+        self.assertEqual(
+            response.data["author"],
+            {"id": post.user.id, "username": post.user.username},
+        )
+        self.assertEqual(response.data["comment_count"], 1)
+        self.assertEqual(len(response.data["comments"]), 1)
+        self.assertIn("author", response.data["comments"][0])
+
+    def test_unknown_expansion(self):
+        response = self.client.get(reverse("posts:post_list"), {"expand": "secrets"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_post_list_query_count_does_not_grow_with_rows(self):
+        for count in (1, 100, 1000):
+            with self.subTest(count=count):
+                Post.objects.all().delete()
+                User.objects.exclude(pk=self.user.pk).delete()
+                self.create_posts(count)
+                with self.assertNumQueries(1):
+                    response = self.client.get(
+                        reverse("posts:post_list"),
+                        {"expand": "author,comment_count", "page_size": count},
+                    )
+                self.assertEqual(len(response.data["results"]), count)
+                with self.assertNumQueries(2):
+                    response = self.client.get(
+                        reverse("posts:post_list"),
+                        {"expand": "author,comment_count,comments", "page_size": count},
+                    )
+                self.assertEqual(len(response.data["results"]), count)
+
+    def test_comment_list_query_count_does_not_grow_with_rows(self):
+        post = Post.objects.create(title="Post", text="text", user=self.user)
+        for count in (1, 100, 1000):
+            with self.subTest(count=count):
+                Comment.objects.all().delete()
+                Comment.objects.bulk_create(
+                    Comment(post=post, user=self.user, text="text")
+                    for _ in range(count)
+                )
+                with self.assertNumQueries(1):
+                    response = self.client.get(
+                        reverse("comments:comment_list", kwargs={"post_id": post.id}),
+                        {"expand": "author", "page_size": count},
+                    )
+                self.assertEqual(len(response.data["results"]), count)
+
+
+class CommentCounterTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+            email="test@mail.ru",
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.post = Post.objects.create(title="Post", text="text", user=self.user)
+
+    def create_comment(self, post):
+        return self.client.post(
+            reverse("comments:comment_create", kwargs={"post_id": post.id}),
+            {"text": "text"},
+            format="json",
+        )
+
+    def test_create_and_delete_update_counters(self):
+        self.create_comment(self.post)
+        self.create_comment(self.post)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 2)
+        self.assertIsNotNone(self.post.last_commented_at)
+
+        first, last = Comment.objects.order_by("created_at", "id")
+        for comment, remaining in ((last, first), (first, None)):
+            self.client.delete(
+                reverse(
+                    "comments:comment_delete",
+                    kwargs={"post_id": self.post.id, "pk": comment.id},
+                )
+            )
+            self.post.refresh_from_db()
+            self.assertEqual(self.post.comment_count, 1 if remaining else 0)
+            self.assertEqual(
+                self.post.last_commented_at, remaining and remaining.created_at
+            )
+
+    def test_active_list_is_sorted_by_last_comment(self):
+        older = Post.objects.create(title="Older", text="text", user=self.user)
+        Post.objects.create(title="Quiet", text="text", user=self.user)
+        self.create_comment(self.post)
+        self.create_comment(older)
+        response = self.client.get(reverse("posts:post_active_list"))
+        ids = [post["id"] for post in response.data["results"]]
+        self.assertEqual(ids, [older.id, self.post.id])
+
+    def test_last_comment_time_is_not_writable(self):
+        response = self.client.patch(
+            reverse("posts:post_update", kwargs={"pk": self.post.id}),
+            {"last_commented_at": "2099-01-01T00:00:00Z"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.post.refresh_from_db()
+        self.assertIsNone(self.post.last_commented_at)
+        response = self.client.get(reverse("posts:post_active_list"))
+        self.assertEqual(response.data["results"], [])
+
+    def test_rebuild_command(self):
+        other = Post.objects.create(title="Other", text="text", user=self.user)
+        Comment.objects.bulk_create(
+            Comment(post=post, user=self.user, text="text")
+            for post in (self.post, self.post, other)
+        )
+        Post.objects.filter(pk=other.pk).update(comment_count=42)
+        call_command("rebuild_comment_counters", chunk_size=1, stdout=StringIO())
+        counts = dict(Post.objects.values_list("id", "comment_count"))
+        self.assertEqual(counts, {self.post.id: 2, other.id: 1})
+        self.assertIsNotNone(Post.objects.get(pk=other.pk).last_commented_at)
+
+
+class PostCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        post_cache.stats.clear()
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+            email="test@mail.ru",
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.post = Post.objects.create(title="Post", text="text", user=self.user)
+        self.url = reverse("posts:post_retrieve", kwargs={"pk": self.post.id})
+
+    def test_second_read_is_served_from_cache(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data, PostSerializer(self.post).data)
+        self.assertEqual(post_cache.stats, {"hits": 1, "misses": 1})
+
+    def test_missing_post_is_not_cached(self):
+        url = reverse("posts:post_retrieve", kwargs={"pk": 9999})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_update_invalidates(self):
+        self.client.get(self.url)
+        self.client.patch(
+            reverse("posts:post_update", kwargs={"pk": self.post.id}),
+            {"title": "Updated"},
+            format="json",
+        )
+        response = self.client.get(self.url)
+        self.assertEqual(response.data["title"], "Updated")
+        self.assertEqual(post_cache.stats["misses"], 2)
+
+    def test_comment_writes_invalidate(self):
+        self.client.get(self.url)
+        self.client.post(
+            reverse("comments:comment_create", kwargs={"post_id": self.post.id}),
+            {"text": "text"},
+            format="json",
+        )
+        response = self.client.get(self.url)
+        self.assertIsNotNone(response.data["last_commented_at"])
+        self.assertEqual(post_cache.stats["misses"], 2)
+
+    def test_delete_invalidates(self):
+        self.client.get(self.url)
+        self.client.delete(reverse("posts:post_delete", kwargs={"pk": self.post.id}))
+        self.assertEqual(
+            self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND
+        )
+
+    def test_concurrent_misses_recompute_once(self):
+        payload_cache = ReadThroughCache("stampede")
+        loads = []
+
+        def load():
+            loads.append(1)
+            time.sleep(0.2)
+            return self.post
+
+        def read():
+            return payload_cache.get(
+                self.post.pk,
+                load=load,
+                build=lambda post: {"id": post.pk},
+            )
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: read(), range(8)))
+
+        self.assertEqual(len(loads), 1)
+        self.assertEqual(results, [{"id": self.post.pk}] * 8)
+        self.assertEqual(payload_cache.stats["waits"], 7)
+
+    def test_reads_racing_a_write_are_not_served(self):
+        payload_cache = ReadThroughCache("race")
+
+        def load():
+            # The write commits while the row is being read.
+            payload_cache.invalidate(self.post.pk)
+            return self.post
+
+        payload_cache.get(self.post.pk, load=load, build=lambda post: {"id": post.pk})
+        self.assertIsNone(payload_cache.lookup(self.post.pk))
+
+        # A read between the write and its commit is dropped by the commit.
+        with self.captureOnCommitCallbacks(execute=True):
+            payload_cache.invalidate(self.post.pk)
+            payload_cache.get(
+                self.post.pk, load=lambda: self.post, build=lambda post: {"id": post.pk}
+            )
+            self.assertIsNotNone(payload_cache.lookup(self.post.pk))
+        self.assertIsNone(payload_cache.lookup(self.post.pk))
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+            email="test@mail.ru",
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.post = Post.objects.create(title="Post", text="text", user=self.user)
+
+    def assert_not_modified_without_row_fetch(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"text"', queries[0]["sql"])
+        return etag
+
+    def test_post_detail(self):
+        url = reverse("posts:post_retrieve", kwargs={"pk": self.post.id})
+        etag = self.assert_not_modified_without_row_fetch(url)
+
+        self.client.patch(
+            reverse("posts:post_update", kwargs={"pk": self.post.id}),
+            {"title": "Updated"},
+            format="json",
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["title"], "Updated")
+
+    def test_post_list(self):
+        url = reverse("posts:post_list")
+        etag = self.assert_not_modified_without_row_fetch(url)
+
+        Post.objects.create(title="New", text="text", user=self.user)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 2)
+
+    def test_list_etag_changes_on_delete(self):
+        Post.objects.create(title="New", text="text", user=self.user)
+        url = reverse("posts:post_list")
+        etag = self.client.get(url)["ETag"]
+        self.post.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_comment_list_and_detail(self):
+        comment = Comment.objects.create(post=self.post, user=self.user, text="text")
+        self.assert_not_modified_without_row_fetch(
+            reverse("comments:comment_list", kwargs={"post_id": self.post.id})
+        )
+        self.assert_not_modified_without_row_fetch(
+            reverse(
+                "comments:comment_retrieve",
+                kwargs={"post_id": self.post.id, "pk": comment.id},
+            )
+        )
+
+    def test_if_modified_since(self):
+        url = reverse("posts:post_retrieve", kwargs={"pk": self.post.id})
+        last_modified = self.client.get(url)["Last-Modified"]
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_lists_are_validated_by_etag_only(self):
+        other = Post.objects.create(title="Other", text="text", user=self.user)
+        url = reverse("posts:post_list")
+        response = self.client.get(url)
+        self.assertNotIn("Last-Modified", response)
+        self.post.delete()
+        # The page's latest update time is unchanged, but the page is not.
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=http_date(other.updated_at.timestamp())
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([post["id"] for post in response.data["results"]], [other.pk])
+
+    def test_expanded_requests_are_unconditional(self):
+        url = reverse("posts:post_retrieve", kwargs={"pk": self.post.id})
+        response = self.client.get(url, {"expand": "author"})
+        self.assertNotIn("ETag", response)
+
+
+class BulkCreateTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+            email="test@mail.ru",
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_bulk_create_posts(self):
+        items = [{"title": f"Post {i}", "text": "text"} for i in range(50)]
+        lexicon.get_matcher()
+        with self.assertNumQueries(3):
+            response = self.client.post(
+                reverse("posts:post_bulk_create"), items, format="json"
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 50)
+        self.assertEqual(Post.objects.filter(user=self.user).count(), 50)
+
+    def test_errors_are_reported_per_item(self):
+        items = [
+            {"title": "Fine", "text": "text"},
+            {"title": "ерунда", "text": "text"},
+            {"text": "text"},
+        ]
+        response = self.client.post(
+            reverse("posts:post_bulk_create"), items, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn("title", response.data[1])
+        self.assertIn("title", response.data[2])
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(BULK_CREATE_MAX_ITEMS=2)
+    def test_batch_size_limit(self):
+        items = [{"title": f"Post {i}", "text": "text"} for i in range(3)]
+        response = self.client.post(
+            reverse("posts:post_bulk_create"), items, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Post.objects.exists())
+
+    def test_empty_batch(self):
+        response = self.client.post(
+            reverse("posts:post_bulk_create"), [], format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_create_comments(self):
+        post = Post.objects.create(title="Post", text="text", user=self.user)
+        items = [{"text": f"Comment {i}"} for i in range(20)]
+        response = self.client.post(
+            reverse("comments:comment_bulk_create", kwargs={"post_id": post.id}),
+            items,
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Comment.objects.filter(post=post).count(), 20)
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 20)
+
+    def test_bulk_create_comments_missing_post(self):
+        response = self.client.post(
+            reverse("comments:comment_bulk_create", kwargs={"post_id": 9999}),
+            [{"text": "text"}],
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Comment.objects.exists())
+
+
+@skipUnless(os.getenv("RUN_BENCHMARKS"), "set RUN_BENCHMARKS=1 to run benchmarks")
+@override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {}})
+class BulkCreateBenchmark(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+            email="test@mail.ru",
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    @override_settings(BULK_CREATE_MAX_ITEMS=1000)
+    def test_single_creates_against_one_batch(self):
+        items = [{"title": f"Post {i}", "text": "text"} for i in range(1000)]
+
+        started = time.perf_counter()
+        for item in items:
+            self.client.post(reverse("posts:post_create"), item, format="json")
+        single = time.perf_counter() - started
+
+        started = time.perf_counter()
+        self.client.post(reverse("posts:post_bulk_create"), items, format="json")
+        batch = time.perf_counter() - started
+
+        self.assertEqual(Post.objects.count(), 2000)
+        print(
+            f"\n1000 single creates: {single:.2f}s, one batch of 1000: {batch:.2f}s "
+            f"({single / batch:.1f}x)"
+        )
+
+
+class ModerationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+            email="test@mail.ru",
+        )
+        self.post = Post.objects.create(user=self.user, title="Title", text="Text")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_automaton_matches_overlapping_terms(self):
+        matcher = AhoCorasick(["he", "she", "his", "hers"])
+        self.assertTrue(matcher.contains("ushers"))
+        self.assertTrue(matcher.contains("ahishe"))
+        self.assertFalse(matcher.contains("shirt"))
+        self.assertFalse(matcher.contains(""))
+
+    def test_automaton_matches_term_hidden_behind_failure_link(self):
+        matcher = AhoCorasick(["abcd", "bc"])
+        self.assertTrue(matcher.contains("xabcx"))
+        self.assertFalse(matcher.contains("abd"))
+
+    def test_builtin_terms_are_forbidden_in_post_text(self):
+        response = self.client.post(
+            reverse("posts:post_create"),
+            {"title": "Title", "text": "Полная ЧЕПУХА"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("text", response.data)
+
+    def test_database_terms_are_picked_up(self):
+        self.assertFalse(lexicon.contains("spam offer"))
+        with self.captureOnCommitCallbacks(execute=True):
+            ForbiddenTerm.objects.create(term=" Spam ")
+        self.assertTrue(lexicon.contains("spam offer"))
+
+        response = self.client.post(
+            reverse("comments:comment_create", kwargs={"post_id": self.post.pk}),
+            {"text": "Cheap SPAM"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Comment.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ForbiddenTerm.objects.get().delete()
+        self.assertFalse(lexicon.contains("spam offer"))
+
+    def test_bulk_writes_bump_the_lexicon_once_committed(self):
+        self.assertFalse(lexicon.contains("spam offer"))
+        with self.captureOnCommitCallbacks() as callbacks:
+            ForbiddenTerm.objects.bulk_create([ForbiddenTerm(term="spam")])
+        self.assertFalse(lexicon.contains("spam offer"))
+        callbacks[0]()
+        self.assertTrue(lexicon.contains("spam offer"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ForbiddenTerm.objects.update(term="offer")
+        self.assertTrue(lexicon.contains("special offer"))
+        with self.captureOnCommitCallbacks(execute=True):
+            ForbiddenTerm.objects.all().delete()
+        self.assertFalse(lexicon.contains("spam offer"))
+
+    def test_matcher_is_not_rebuilt_while_lexicon_is_unchanged(self):
+        matcher = lexicon.get_matcher()
+        with self.assertNumQueries(0):
+            self.assertIs(lexicon.get_matcher(), matcher)
+
+    def test_file_terms_are_picked_up(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as file:
+            file.write("forbidden\n\n")
+        self.addCleanup(os.remove, file.name)
+
+        with override_settings(MODERATION_LEXICON_FILE=file.name):
+            self.assertTrue(lexicon.contains("Some Forbidden title"))
+            response = self.client.patch(
+                reverse("posts:post_update", kwargs={"pk": self.post.pk}),
+                {"title": "Forbidden"},
+                format="json",
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(lexicon.contains("Some Forbidden title"))
+
+
+class SearchTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+            email="test@mail.ru",
+        )
+        self.in_text = Post.objects.create(
+            user=self.user, title="Weekend", text="We went hiking in the mountains"
+        )
+        self.in_title = Post.objects.create(
+            user=self.user, title="Mountains", text="Photos from the trip"
+        )
+        Post.objects.create(user=self.user, title="Other", text="Nothing to see")
+        self.comment = Comment.objects.create(
+            user=self.user, post=self.in_title, text="Great mountains view"
+        )
+        Comment.objects.create(user=self.user, post=self.in_title, text="Nice")
+        self.client = APIClient()
+
+    def test_posts_are_ranked_title_first(self):
+        response = self.client.get(reverse("posts:post_search"), {"q": "mountains"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data["results"]
+        self.assertEqual(
+            [post["id"] for post in results], [self.in_title.pk, self.in_text.pk]
+        )
+        self.assertGreater(results[0]["rank"], results[1]["rank"])
+        self.assertIn("<mark>mountains</mark>", results[1]["snippet"])
+
+    def test_every_query_word_must_match(self):
+        response = self.client.get(
+            reverse("posts:post_search"), {"q": "hiking mountains"}
+        )
+        self.assertEqual(
+            [post["id"] for post in response.data["results"]], [self.in_text.pk]
+        )
+
+    def test_results_are_cursor_paginated(self):
+        for i in range(5):
+            Post.objects.create(user=self.user, title="Mountains", text=f"Trip {i}")
+        url = reverse("posts:post_search") + "?q=mountains&page_size=2"
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(post["id"] for post in response.data["results"])
+            url = response.data["next"]
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(len(set(seen)), 7)
+        self.assertEqual(seen[-1], self.in_text.pk)
+
+    def test_comments_are_searchable(self):
+        response = self.client.get(reverse("posts:comment_search"), {"q": "Mountains"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data["results"]
+        self.assertEqual([comment["id"] for comment in results], [self.comment.pk])
+        self.assertEqual(results[0]["snippet"], "Great <mark>mountains</mark> view")
+
+    def test_snippets_escape_the_text(self):
+        Comment.objects.create(
+            user=self.user,
+            post=self.in_title,
+            text="Tom & Jerry <script>alert(1)</script> in the mountains",
+        )
+        response = self.client.get(reverse("posts:comment_search"), {"q": "mountains"})
+        snippets = [comment["snippet"] for comment in response.data["results"]]
+        self.assertIn(
+            "Tom &amp; Jerry &lt;script&gt;alert(1)&lt;/script&gt; in the "
+            "<mark>mountains</mark>",
+            snippets,
+        )
+
+    def test_query_is_required(self):
+        response = self.client.get(reverse("posts:post_search"), {"q": " "})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("q", response.data)
+
+
+class ImageVariantTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root, TASKS_EAGER=True)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+            email="test@mail.ru",
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def make_image(self, size=(2000, 1000), name="photo.jpg"):
+        image = Image.new("RGB", size, "red")
+        exif = Image.Exif()
+        exif[0x010F] = "Camera maker"
+        buffer = BytesIO()
+        image.save(buffer, "JPEG", exif=exif)
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/jpeg")
+
+    def create_post(self, image):
+        return self.client.post(
+            reverse("posts:post_create"),
+            {"title": "Title", "text": "Text", "image": image},
+            format="multipart",
+        )
+
+    def test_variants_are_rendered_after_the_response(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.create_post(self.make_image())
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn(build_image_variants, [task.args[0] for task in callbacks])
+        post = Post.objects.get()
+        self.assertEqual(post.image_variants, {})
+
+        for task in callbacks:
+            task()
+        post.refresh_from_db()
+        self.assertEqual(list(post.image_variants), ["small", "medium", "large"])
+        large = post.image_variants["large"]["webp"]
+        self.assertEqual((large["width"], large["height"]), (1600, 800))
+        self.assertEqual(post.image_variants["small"]["jpeg"]["width"], 320)
+
+        response = self.client.get(reverse("posts:post_retrieve", args=[post.pk]))
+        self.assertEqual(response.data["image_variants"], post.image_variants)
+
+    def test_variants_are_stripped_of_metadata(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_post(self.make_image())
+        variants = Post.objects.get().image_variants
+        for formats in variants.values():
+            for variant in formats.values():
+                name = variant["url"].removeprefix(settings.MEDIA_URL)
+                with default_storage.open(name) as file, Image.open(file) as image:
+                    self.assertEqual(image.size, (variant["width"], variant["height"]))
+                    self.assertFalse(image.getexif())
+                    self.assertNotIn("icc_profile", image.info)
+
+    def test_small_images_are_not_upscaled(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_post(self.make_image(size=(100, 50)))
+        variants = Post.objects.get().image_variants
+        self.assertEqual(list(variants), ["small"])
+        self.assertEqual(variants["small"]["jpeg"]["width"], 100)
+
+    def test_replacing_the_image_rebuilds_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_post(self.make_image())
+        post = Post.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                reverse("posts:post_update", args=[post.pk]),
+                {"image": self.make_image(size=(400, 400), name="other.jpg")},
+                format="multipart",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        post.refresh_from_db()
+        self.assertEqual(list(post.image_variants), ["small"])
+        self.assertIn("other", post.image_variants["small"]["webp"]["url"])
+
+    def test_command_builds_missing_variants(self):
+        with self.captureOnCommitCallbacks():
+            self.create_post(self.make_image())
+        out = StringIO()
+        call_command("build_image_variants", stdout=out)
+        self.assertIn("1 posts", out.getvalue())
+        self.assertEqual(len(Post.objects.get().image_variants), 3)
+
+    def test_posts_without_images_are_not_processed(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.create_post("")
+        self.assertNotIn(build_image_variants, [task.args[0] for task in callbacks])
+
+
+class ChunkedUploadTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+            email="test@mail.ru",
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.image = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 40
+
+    def start(self, size, filename="photo.png"):
+        response = self.client.post(
+            reverse("posts:upload_create"),
+            {"filename": filename, "size": size},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data["id"]
+
+    def put_chunk(self, upload_id, offset, data):
+        return self.client.put(
+            reverse("posts:upload_detail", args=[upload_id]),
+            data,
+            content_type="application/octet-stream",
+            HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def complete(self, upload_id):
+        return self.client.post(
+            reverse("posts:upload_complete", args=[upload_id]),
+            {"title": "Title", "text": "Text"},
+            format="json",
+        )
+
+    def stored_files(self):
+        return [
+            os.path.join(root, name)
+            for root, _, names in os.walk(settings.MEDIA_ROOT)
+            for name in names
+        ]
+
+    def test_upload_in_chunks_and_complete(self):
+        upload_id = self.start(len(self.image))
+        for offset in range(0, len(self.image), 4000):
+            response = self.put_chunk(
+                upload_id, offset, self.image[offset : offset + 4000]
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["received"], len(self.image))
+        self.assertEqual(response.data["content_type"], "image/png")
+
+        response = self.complete(upload_id)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        post = Post.objects.get(pk=response.data["id"])
+        self.assertTrue(post.image.name.startswith("posts/photo"))
+        self.assertTrue(post.image.name.endswith(".png"))
+        with post.image.open("rb") as file:
+            self.assertEqual(file.read(), self.image)
+        self.assertFalse(Upload.objects.exists())
+        self.assertEqual(self.stored_files(), [post.image.path])
+
+    def test_resume_after_a_lost_response(self):
+        upload_id = self.start(len(self.image))
+        self.put_chunk(upload_id, 0, self.image[:5000])
+
+        response = self.put_chunk(upload_id, 0, self.image[:5000])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        response = self.client.get(reverse("posts:upload_detail", args=[upload_id]))
+        self.assertEqual(response.data["received"], 5000)
+
+        self.put_chunk(upload_id, 5000, self.image[5000:])
+        self.assertEqual(self.complete(upload_id).status_code, status.HTTP_201_CREATED)
+        with Post.objects.get().image.open("rb") as file:
+            self.assertEqual(file.read(), self.image)
+
+    def test_file_type_is_checked_on_the_first_bytes(self):
+        upload_id = self.start(100, filename="page.png")
+        response = self.put_chunk(upload_id, 0, b"<html>" + b" " * 94)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Upload.objects.get().received, 0)
+        self.assertEqual(self.stored_files(), [])
+
+    def test_file_is_stored_with_the_extension_of_its_type(self):
+        jpeg = b"\xff\xd8\xff\xe0" + b"\0" * 96
+        upload_id = self.start(len(jpeg), filename="photo.html")
+        self.put_chunk(upload_id, 0, jpeg)
+        response = self.complete(upload_id)
+        self.assertTrue(
+            Post.objects.get(pk=response.data["id"]).image.name.endswith(".jpg")
+        )
+
+    def test_size_limits(self):
+        with override_settings(UPLOAD_MAX_SIZE=1000):
+            response = self.client.post(
+                reverse("posts:upload_create"),
+                {"filename": "photo.png", "size": 1001},
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        upload_id = self.start(1000)
+        response = self.put_chunk(upload_id, 0, self.image[:1001])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        with override_settings(UPLOAD_CHUNK_MAX_SIZE=500):
+            response = self.put_chunk(upload_id, 0, self.image[:501])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Upload.objects.get().received, 0)
+        self.assertEqual(self.stored_files(), [])
+
+    def test_incomplete_upload_cannot_be_completed(self):
+        upload_id = self.start(len(self.image))
+        self.put_chunk(upload_id, 0, self.image[:100])
+        response = self.complete(upload_id)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Post.objects.exists())
+
+    def test_uploads_of_other_users_are_hidden(self):
+        upload_id = self.start(len(self.image))
+        other = User.objects.create_user(
+            username="other",
+            password="12345678",
+            phone_number="87654321",
+            birth_date="2003-01-01",
+            email="other@mail.ru",
+        )
+        self.client.force_authenticate(user=other)
+        response = self.put_chunk(upload_id, 0, self.image)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.complete(upload_id).status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(UPLOAD_MAX_SIZE=250 * 1024 * 1024)
+    def test_200mb_upload_keeps_memory_bounded(self):
+        chunk_size = settings.UPLOAD_CHUNK_MAX_SIZE
+        total = 200 * 1024 * 1024
+        head = b"\xff\xd8\xff\xe0" + b"\0" * (chunk_size - 4)
+        body = bytes(chunk_size)
+        upload_id = self.start(total, filename="large.jpg")
+
+        tracemalloc.start()
+        try:
+            for offset in range(0, total, chunk_size):
+                response = self.put_chunk(upload_id, offset, body if offset else head)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                # Test client responses keep their request alive in reference
+                # cycles, which would otherwise pile up the request bodies.
+                del response
+                gc.collect()
+            _, upload_peak = tracemalloc.get_traced_memory()
+
+            tracemalloc.reset_peak()
+            response = self.complete(upload_id)
+            _, complete_peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Post.objects.get().image.size, total)
+        # The test client holds a copy of each request body, so a chunk upload
+        # peaks at about two chunks; completing streams the parts.
+        self.assertLess(upload_peak, 3 * chunk_size)
+        self.assertLess(complete_peak, 2 * 1024 * 1024)
+
+
+@override_settings(TASKS_EAGER=True)
+class HomeTimelineTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = self.make_user("reader")
+        self.author = self.make_user("author")
+        self.stranger = self.make_user("stranger")
+        self.client = APIClient()
+
+    def make_user(self, username):
+        return User.objects.create_user(
+            username=username,
+            password="12345678",
+            phone_number=username,
+            birth_date="2003-01-01",
+            email=f"{username}@mail.ru",
+        )
+
+    def create_post(self, user, title):
+        self.client.force_authenticate(user=user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("posts:post_create"),
+                {"title": title, "text": "Text"},
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data["id"]
+
+    def follow(self, user, author):
+        self.client.force_authenticate(user=user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("users:user_follow", args=[author.pk]))
+
+    def home(self, url=None):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(url or reverse("posts:post_home"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def home_ids(self):
+        return [post["id"] for post in self.home().data["results"]]
+
+    def test_home_shows_own_and_followed_posts(self):
+        old = self.create_post(self.author, "Before follow")
+        self.create_post(self.stranger, "Stranger")
+        own = self.create_post(self.user, "Own")
+        self.follow(self.user, self.author)
+        new = self.create_post(self.author, "After follow")
+        self.assertEqual(self.home_ids(), [new, own, old])
+
+    def test_unfollow_clears_the_timeline(self):
+        self.follow(self.user, self.author)
+        self.create_post(self.author, "Post")
+        self.client.force_authenticate(user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse("users:user_follow", args=[self.author.pk]))
+        self.assertEqual(self.home_ids(), [])
+
+    def test_bulk_created_posts_are_fanned_out(self):
+        self.follow(self.user, self.author)
+        self.client.force_authenticate(user=self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("posts:post_bulk_create"),
+                [{"title": "One", "text": "Text"}, {"title": "Two", "text": "Text"}],
+                format="json",
+            )
+        self.assertEqual(len(self.home_ids()), 2)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=2)
+    def test_posts_of_popular_authors_are_pulled_on_read(self):
+        self.follow(self.user, self.author)
+        self.follow(self.stranger, self.author)
+        self.follow(self.user, self.stranger)
+
+        ids = []
+        for i in range(6):
+            ids.append(self.create_post(self.author, f"Pulled {i}"))
+            ids.append(self.create_post(self.stranger, f"Pushed {i}"))
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.user, post__user=self.author).exists()
+        )
+
+        seen = []
+        url = reverse("posts:post_home") + "?page_size=5"
+        while url:
+            response = self.home(url)
+            seen.extend(post["id"] for post in response.data["results"])
+            url = response.data["next"]
+        self.assertEqual(seen, ids[::-1])
+
+    def test_first_page_is_a_single_query(self):
+        self.follow(self.user, self.author)
+        for i in range(3):
+            self.create_post(self.author, f"Post {i}")
+        self.home()
+        self.client.force_authenticate(user=self.user)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("posts:post_home"))
+        self.assertEqual(len(response.data["results"]), 3)
+
+    def test_home_requires_authentication(self):
+        response = self.client.get(reverse("posts:post_home"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@skipUnless(os.getenv("RUN_BENCHMARKS"), "set RUN_BENCHMARKS=1 to run benchmarks")
+@override_settings(TIMELINE_FANOUT_LIMIT=5000)
+class HomeTimelineBenchmark(APITestCase):
+    def test_100k_users_with_skewed_follower_counts(self):
+        rng = random.Random(0)
+        users = User.objects.bulk_create(
+            User(
+                username=f"user{i}",
+                password="!",
+                phone_number=str(i),
+                email=f"user{i}@mail.ru",
+                birth_date="2003-01-01",
+            )
+            for i in range(100_000)
+        )
+        ids = [user.pk for user in users]
+        # Zipf-like popularity: the author at rank r is picked with weight 1 / r.
+        weights = list(
+            itertools.accumulate(1 / rank for rank in range(1, len(ids) + 1))
+        )
+        follows = {}
+        for follower in ids:
+            for followee in rng.choices(ids, cum_weights=weights, k=10):
+                if followee != follower:
+                    follows[follower, followee] = None
+        Follow.objects.bulk_create(
+            (Follow(follower_id=a, followee_id=b) for a, b in follows),
+            batch_size=5000,
+        )
+        counts = {}
+        for _, followee in follows:
+            counts[followee] = counts.get(followee, 0) + 1
+        User.objects.bulk_update(
+            [User(pk=pk, follower_count=count) for pk, count in counts.items()],
+            ["follower_count"],
+            batch_size=5000,
+        )
+
+        authors = ids[:20] * 5 + [rng.choice(ids) for _ in range(20_000)]
+        posts = Post.objects.bulk_create(
+            (Post(user_id=author, title="Title", text="Text") for author in authors),
+            batch_size=5000,
+        )
+        started = time.perf_counter()
+        fan_out_posts([post.pk for post in posts])
+        fan_out = time.perf_counter() - started
+
+        reader = User.objects.get(pk=rng.choice(ids))
+        timeline = TimelineEntry.objects.filter(user=reader).select_related("post")
+        followees = Follow.objects.filter(follower=reader).values("followee_id")
+        pulled = Post.objects.filter(
+            user_id__in=followees.filter(followee__follower_count__gte=5000)
+        )
+        followed = Post.objects.filter(user_id__in=followees)
+
+        def timed(read):
+            read()
+            started = time.perf_counter()
+            for _ in range(50):
+                read()
+            return (time.perf_counter() - started) / 50 * 1000
+
+        push = timed(lambda: list(timeline.order_by("-created_at", "-post_id")[:21]))
+        pull = timed(lambda: list(pulled.order_by("-created_at", "-id")[:21]))
+        naive = timed(lambda: list(followed.order_by("-created_at", "-id")[:21]))
+        self.client.force_authenticate(user=reader)
+        home = timed(lambda: self.client.get(reverse("posts:post_home")))
+
+        print(
+            f"\n{len(follows)} follows, top author has {max(counts.values())} "
+            f"followers; fan-out of {len(posts)} posts wrote "
+            f"{TimelineEntry.objects.count()} entries in {fan_out:.2f}s\n"
+            f"first page: timeline range {push:.2f}ms + pulled authors {pull:.2f}ms, "
+            f"posts of all followees {naive:.2f}ms, home endpoint {home:.2f}ms"
+        )
+
+
+class HotScoreTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+            email="test@mail.ru",
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def recompute(self, *args):
+        out = StringIO()
+        call_command("recompute_hot_scores", *args, stdout=out)
+        return out.getvalue()
+
+    def test_score_grows_with_comments_and_recency(self):
+        now = timezone.now()
+        self.assertGreater(hot_score(10, now), hot_score(1, now))
+        self.assertEqual(hot_score(0, now), hot_score(1, now))
+        day_old = now - timedelta(days=1)
+        self.assertGreater(hot_score(0, now), hot_score(10, day_old))
+        self.assertGreater(hot_score(1000, day_old), hot_score(0, now))
+
+    def test_hot_list_reads_the_precomputed_order(self):
+        quiet = Post.objects.create(user=self.user, title="Quiet", text="Text")
+        busy = Post.objects.create(user=self.user, title="Busy", text="Text")
+        Post.objects.filter(pk=busy.pk).add_comments(50)
+        Post.objects.filter(pk=quiet.pk).update(
+            created_at=quiet.created_at + timedelta(minutes=10)
+        )
+        self.recompute()
+
+        response = self.client.get(reverse("posts:post_hot"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [post["id"] for post in response.data["results"]], [busy.pk, quiet.pk]
+        )
+
+    def test_hot_list_is_cursor_paginated(self):
+        for i in range(5):
+            post = Post.objects.create(user=self.user, title=f"Post {i}", text="Text")
+            Post.objects.filter(pk=post.pk).add_comments(i)
+        self.recompute()
+        expected = list(
+            Post.objects.order_by("-hot_score", "-id").values_list("id", flat=True)
+        )
+
+        seen = []
+        url = reverse("posts:post_hot") + "?page_size=2"
+        while url:
+            response = self.client.get(url)
+            seen.extend(post["id"] for post in response.data["results"])
+            url = response.data["next"]
+        self.assertEqual(seen, expected)
+
+    def test_only_posts_with_new_activity_are_recomputed(self):
+        posts = [
+            Post.objects.create(user=self.user, title=f"Post {i}", text="Text")
+            for i in range(3)
+        ]
+        self.assertIn("3 posts", self.recompute())
+        self.assertIn("0 posts", self.recompute())
+
+        response = self.client.post(
+            reverse("comments:comment_create", kwargs={"post_id": posts[1].pk}),
+            {"text": "Comment"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        before = Post.objects.get(pk=posts[1].pk).hot_score
+        self.assertIn("1 posts", self.recompute())
+        self.assertIn("3 posts", self.recompute("--full"))
+        self.assertEqual(Post.objects.get(pk=posts[1].pk).hot_score, before)
+
+
+class AsyncViewTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+            email="test@mail.ru",
+        )
+        self.posts = [
+            Post.objects.create(user=self.user, title=f"Post {i}", text="Text")
+            for i in range(5)
+        ]
+        self.comments = [
+            Comment.objects.create(user=self.user, post=self.posts[0], text=f"C {i}")
+            for i in range(3)
+        ]
+
+    async def get_json(self, url, **kwargs):
+        response = await self.async_client.get(url, **kwargs)
+        if response.streaming:
+            body = b"".join([chunk async for chunk in response.streaming_content])
+        else:
+            body = response.content
+        return response, json.loads(body)
+
+    async def test_post_list_streams_the_sync_payload(self):
+        response, data = await self.get_json(reverse("async:post_list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        sync = await sync_to_async(self.client.get)(reverse("posts:post_list"))
+        self.assertEqual(data["results"], json.loads(sync.content)["results"])
+        self.assertIsNone(data["next"])
+
+    async def test_post_list_is_cursor_paginated(self):
+        seen = []
+        url = reverse("async:post_list") + "?page_size=2&expand=author,comments"
+        while url:
+            response, data = await self.get_json(url)
+            seen.extend(post["id"] for post in data["results"])
+            url = data["next"]
+        self.assertEqual(seen, [post.pk for post in reversed(self.posts)])
+        self.assertEqual(data["results"][-1]["author"]["username"], "testuser")
+        self.assertEqual(len(data["results"][-1]["comments"]), 3)
+
+    async def test_post_detail(self):
+        response, data = await self.get_json(
+            reverse("async:post_retrieve", args=[self.posts[0].pk])
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(data["title"], "Post 0")
+
+        response, data = await self.get_json(reverse("async:post_retrieve", args=[999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_comment_list_and_detail(self):
+        post_id = self.posts[0].pk
+        response, data = await self.get_json(
+            reverse("async:comment_list", args=[post_id])
+        )
+        self.assertEqual(
+            [comment["id"] for comment in data["results"]],
+            [comment.pk for comment in self.comments],
+        )
+        response, data = await self.get_json(
+            reverse("async:comment_retrieve", args=[post_id, self.comments[1].pk])
+        )
+        self.assertEqual(data["text"], "C 1")
+
+        response, _ = await self.get_json(
+            reverse("async:comment_list", args=[self.posts[1].pk])
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response, _ = await self.get_json(reverse("async:comment_list", args=[999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_profiles_require_authentication(self):
+        response, _ = await self.get_json(reverse("async:user_list"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        token = ClaimsTokenObtainPairSerializer.get_token(self.user).access_token
+        headers = {"authorization": f"Bearer {token}"}
+        response, data = await self.get_json(
+            reverse("async:user_list"), headers=headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([user["id"] for user in data["results"]], [self.user.pk])
+        response, data = await self.get_json(
+            reverse("async:user_retrieve", args=[self.user.pk]), headers=headers
+        )
+        self.assertEqual(data["username"], "testuser")
+
+    async def test_invalid_expansion_is_rejected(self):
+        response, data = await self.get_json(reverse("async:post_list") + "?expand=x")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("expand", data)
+
+
+@skipUnless(os.getenv("RUN_BENCHMARKS"), "set RUN_BENCHMARKS=1 to run benchmarks")
+class AsyncViewBenchmark(TransactionTestCase):
+    def setUp(self):
+        user = User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+            email="test@mail.ru",
+        )
+        Post.objects.bulk_create(
+            Post(user=user, title=f"Post {i}", text="Text " * 50) for i in range(500)
+        )
+
+    async def load(self, url, concurrency, requests):
+        client = AsyncClient()
+        latencies = []
+
+        async def worker():
+            for _ in range(requests // concurrency):
+                started = time.perf_counter()
+                response = await client.get(url)
+                if response.streaming:
+                    async for _ in response.streaming_content:
+                        pass
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        return len(latencies) / elapsed, statistics.median(latencies), p99
+
+    async def test_sync_against_async_list(self):
+        for concurrency in (1, 10, 50):
+            for name in ("posts:post_list", "async:post_list"):
+                url = reverse(name) + "?page_size=50"
+                rate, p50, p99 = await self.load(url, concurrency, 500)
+                print(
+                    f"\n{name:16} concurrency {concurrency:3}: {rate:6.0f} req/s, "
+                    f"p50 {p50 * 1000:6.1f}ms, p99 {p99 * 1000:6.1f}ms",
+                    end="",
+                )
+
+
+@skipUnless(os.getenv("RUN_BENCHMARKS"), "set RUN_BENCHMARKS=1 to run benchmarks")
+class ModerationBenchmark(TestCase):
+    def test_lexicon_of_5000_terms_against_100kb_texts(self):
+        rng = random.Random(0)
+        terms = {
+            "".join(rng.choices(string.ascii_lowercase, k=rng.randint(6, 12)))
+            for _ in range(5000)
+        }
+        text = "".join(rng.choices(string.ascii_lowercase + " ", k=100_000))
+        text = " ".join(word for word in text.split() if word not in terms)
+
+        started = time.perf_counter()
+        matcher = AhoCorasick(terms)
+        build = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for _ in range(10):
+            matcher.contains(text)
+        automaton = (time.perf_counter() - started) / 10
+
+        started = time.perf_counter()
+        naive_match = any(term in text for term in terms)
+        naive = time.perf_counter() - started
+
+        self.assertEqual(matcher.contains(text), naive_match)
+        print(
+            f"\n5000 terms: build {build * 1000:.0f}ms, automaton "
+            f"{automaton * 1000:.1f}ms per 100KB, naive scan {naive * 1000:.1f}ms"
+        )
+
+
+class ExportTests(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            username="admin",
+            password="12345678",
+            phone_number="87654321",
+            birth_date="2000-01-01",
+            email="admin@mail.ru",
+            is_staff=True,
+        )
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+            email="test@mail.ru",
+        )
+        self.posts = [
+            Post.objects.create(user=self.user, title=f"Post {i}", text="Text")
+            for i in range(5)
+        ]
+        Comment.objects.create(user=self.user, post=self.posts[0], text="Comment")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def export(self, url, **kwargs):
+        response = self.client.get(url, **kwargs)
+        return response, b"".join(response.streaming_content)
+
+    def lines(self, body):
+        return [json.loads(line) for line in body.decode().splitlines()]
+
+    def test_export_is_admin_only(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse("posts:post_export"))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_posts_are_exported_as_ndjson(self):
+        response, body = self.export(reverse("posts:post_export"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        expected = [PostSerializer(post).data for post in self.posts]
+        self.assertEqual(self.lines(body), json.loads(json.dumps(expected)))
+
+    def test_comments_are_exported(self):
+        response, body = self.export(reverse("posts:comment_export"))
+        self.assertEqual([line["text"] for line in self.lines(body)], ["Comment"])
+
+    def test_since_exports_only_changed_rows(self):
+        since = timezone.now()
+        Post.objects.filter(pk=self.posts[1].pk).update(updated_at=since)
+        response, body = self.export(
+            reverse("posts:post_export"), data={"since": since.isoformat()}
+        )
+        self.assertEqual([line["id"] for line in self.lines(body)], [self.posts[1].pk])
+
+    def test_invalid_since_is_rejected(self):
+        response = self.client.get(reverse("posts:post_export"), {"since": "yesterday"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_is_gzipped_when_accepted(self):
+        response, body = self.export(
+            reverse("posts:post_export"), HTTP_ACCEPT_ENCODING="gzip, deflate"
+        )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(len(self.lines(gzip.decompress(body))), 5)
+
+    def test_user_export_leaves_out_passwords(self):
+        response, body = self.export(reverse("users:user_export"))
+        users = self.lines(body)
+        self.assertEqual([user["username"] for user in users], ["admin", "testuser"])
+        self.assertNotIn("password", users[0])
+
+    def test_export_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "posts.ndjson.gz")
+            call_command(
+                "export_ndjson", "posts", "--gzip", "--output", path, stderr=StringIO()
+            )
+            with gzip.open(path) as file:
+                self.assertEqual(len(self.lines(file.read())), 5)
+
+    def test_memory_stays_flat_while_streaming(self):
+        Post.objects.bulk_create(
+            Post(user=self.user, title=f"Bulk {i}", text="x" * 500) for i in range(3000)
+        )
+        url = reverse("posts:post_export")
+        with patch.object(PostExport, "chunk_size", 100):
+            response = self.client.get(url)
+            tracemalloc.start()
+            try:
+                count = 0
+                for line in response.streaming_content:
+                    count += 1
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+        self.assertEqual(count, 3005)
+        # 3000 posts are about 2MB of JSON; only a chunk of them is ever held.
+        self.assertLess(peak, 1024 * 1024)
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+            email="test@mail.ru",
+        )
+        self.post = Post.objects.create(user=self.user, title="Title", text="Text")
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(content)
+        return path
+
+    def write_ndjson(self, name, records):
+        return self.write(name, "".join(json.dumps(record) + "\n" for record in records))
+
+    def run_import(self, *args):
+        out, err = StringIO(), StringIO()
+        call_command("import_ndjson", *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_posts_are_validated_and_imported(self):
+        path = self.write_ndjson(
+            "posts.ndjson",
+            [
+                {"user": self.user.pk, "title": "First", "text": "Text"},
+                {"user": self.user.pk, "title": "Second", "text": "Какая ерунда"},
+                {"user": 0, "title": "Third", "text": "Text"},
+                {"user": self.user.pk, "title": "Fourth", "text": "Text"},
+            ],
+        )
+        out, err = self.run_import("posts", path, "--batch-size", "3")
+        self.assertIn("Imported 2 posts, 2 invalid records.", out)
+        self.assertIn("Record 2:", err)
+        self.assertIn('Record 3: {"user"', err)
+        self.assertEqual(
+            list(Post.objects.order_by("id").values_list("title", flat=True)),
+            ["Title", "First", "Fourth"],
+        )
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+    def test_invalid_json_is_reported(self):
+        path = self.write("posts.ndjson", "{not json}\n")
+        out, err = self.run_import("posts", path)
+        self.assertIn("Record 1: [\"Invalid JSON", err)
+
+    def test_comments_are_imported_from_csv_and_counted(self):
+        path = self.write(
+            "comments.csv",
+            "user,post,text\n"
+            f"{self.user.pk},{self.post.pk},First\n"
+            f"{self.user.pk},{self.post.pk},Second\n"
+            f"{self.user.pk},0,Orphan\n",
+        )
+        out, err = self.run_import("comments", path)
+        self.assertIn("Imported 2 comments, 1 invalid records.", out)
+        self.assertFalse(Comment.objects.filter(path="").exists())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 2)
+        self.assertIsNotNone(self.post.last_commented_at)
+
+    def test_users_get_hashed_passwords(self):
+        path = self.write_ndjson(
+            "users.ndjson",
+            [
+                {
+                    "username": "imported",
+                    "email": "imported@mail.ru",
+                    "password": "password1",
+                    "birth_date": "2004-02-29",
+                    "phone_number": "111",
+                },
+                {
+                    "username": "testuser",
+                    "email": "other@mail.ru",
+                    "password": "password1",
+                    "birth_date": "2000-01-01",
+                    "phone_number": "222",
+                },
+                {
+                    "username": "gmail",
+                    "email": "gmail@gmail.com",
+                    "password": "password1",
+                    "birth_date": "2000-01-01",
+                    "phone_number": "333",
+                },
+            ],
+        )
+        out, err = self.run_import("users", path, "--workers", "2")
+        self.assertIn("Imported 1 users, 2 invalid records.", out)
+        self.assertIn('Record 2: {"username": ["Already exists."]}', err)
+        user = User.objects.get(username="imported")
+        self.assertTrue(user.check_password("password1"))
+        self.assertEqual(user.adult_since.isoformat(), "2022-03-01")
+
+    def test_duplicates_within_a_batch_are_rejected(self):
+        path = self.write_ndjson(
+            "posts.ndjson",
+            [
+                {"id": 1000, "user": self.user.pk, "title": "First", "text": "Text"},
+                {"id": 1000, "user": self.user.pk, "title": "Again", "text": "Text"},
+            ],
+        )
+        out, err = self.run_import("posts", path)
+        self.assertIn("Imported 1 posts, 1 invalid records.", out)
+        self.assertEqual(Post.objects.get(pk=1000).title, "First")
+
+    def test_failed_import_resumes_after_the_last_batch(self):
+        path = self.write_ndjson(
+            "posts.ndjson",
+            [
+                {"user": self.user.pk, "title": f"Post {i}", "text": "Text"}
+                for i in range(5)
+            ],
+        )
+        insert = PostImporter.insert
+        calls = []
+
+        def failing_insert(importer, objs):
+            calls.append(objs)
+            if len(calls) == 2:
+                raise RuntimeError("connection lost")
+            insert(importer, objs)
+
+        with patch.object(PostImporter, "insert", failing_insert):
+            with self.assertRaises(RuntimeError):
+                self.run_import("posts", path, "--batch-size", "2")
+        self.assertEqual(ImportCheckpoint.objects.get().position, 2)
+        self.assertEqual(Post.objects.count(), 3)
+
+        out, err = self.run_import("posts", path, "--batch-size", "2")
+        self.assertIn("Imported 3 posts, 0 invalid records.", out)
+        titles = Post.objects.exclude(pk=self.post.pk).values_list("title", flat=True)
+        self.assertEqual(sorted(titles), [f"Post {i}" for i in range(5)])
+
+
+@skipUnless(os.getenv("RUN_BENCHMARKS"), "set RUN_BENCHMARKS=1 to run benchmarks")
+class ImportBenchmark(TestCase):
+    def test_import_100k_comments(self):
+        user = User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+            email="test@mail.ru",
+        )
+        posts = Post.objects.bulk_create(
+            Post(user=user, title=f"Post {i}", text="Text") for i in range(1000)
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "comments.ndjson")
+            with open(path, "w") as file:
+                for i in range(100_000):
+                    record = {"user": user.pk, "post": posts[i % 1000].pk, "text": f"C {i}"}
+                    file.write(json.dumps(record) + "\n")
+            started = time.perf_counter()
+            call_command("import_ndjson", "comments", path, stdout=StringIO())
+            elapsed = time.perf_counter() - started
+        self.assertEqual(Comment.objects.count(), 100_000)
+        print(
+            f"\nImported 100000 comments in {elapsed:.1f}s "
+            f"({100_000 / elapsed:.0f} per second, {connection.vendor})"
+        )
+
+
+class RequestMetricsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        registry.clear()
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+            email="test@mail.ru",
+        )
+        for i in range(3):
+            Post.objects.create(user=self.user, title=f"Post {i}", text="Text")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def server_timing(self, response):
+        timings = {}
+        for entry in response["Server-Timing"].split(", "):
+            name, *params = entry.split(";")
+            timings[name] = dict(param.split("=", 1) for param in params)
+        return timings
+
+    def test_server_timing_header(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("posts:post_list"))
+        timings = self.server_timing(response)
+        self.assertEqual(timings["db"]["desc"], f'"{len(queries)} queries"')
+        self.assertGreater(float(timings["serializer"]["dur"]), 0)
+        self.assertGreaterEqual(
+            float(timings["total"]["dur"]), float(timings["db"]["dur"])
+        )
+
+    def test_requests_are_counted_per_route(self):
+        self.client.get(reverse("posts:post_list"))
+        response = self.client.get(reverse("posts:post_list"))
+        self.client.post(
+            reverse("comments:comment_create", args=[Post.objects.first().pk]),
+            {"text": "Comment"},
+        )
+        stats = registry.routes["posts:post_list"]
+        self.assertEqual(stats.count, 2)
+        self.assertEqual(sum(stats.buckets), 2)
+        self.assertEqual(stats.bytes, 2 * len(response.content))
+        self.assertGreater(stats.queries, 0)
+        self.assertGreater(registry.routes["comments:comment_create"].serializer_time, 0)
+
+    def test_bulk_validation_is_timed(self):
+        def slow_validate(serializer, attrs):
+            time.sleep(0.05)
+            return attrs
+
+        with patch.object(PostCreateSerializer, "validate", slow_validate):
+            response = self.client.post(
+                reverse("posts:post_bulk_create"),
+                [{"title": "Bulk", "text": "Text"}] * 2,
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertGreaterEqual(
+            float(self.server_timing(response)["serializer"]["dur"]), 100
+        )
+        self.assertGreaterEqual(
+            registry.routes["posts:post_bulk_create"].serializer_time, 0.1
+        )
+
+    async def test_async_views_are_measured(self):
+        # Under ASGI the queries run in a new thread, on a new connection that
+        # gets the recorder when it opens; tests reuse the connection of the
+        # test thread, opened before the middleware was loaded.
+        await sync_to_async(install_query_recorder)(connection)
+        post = await Post.objects.afirst()
+        response = await self.async_client.get(
+            reverse("async:post_retrieve", args=[post.pk])
+        )
+        self.assertEqual(self.server_timing(response)["db"]["desc"], '"1 queries"')
+
+    def test_metrics_endpoint_needs_the_token(self):
+        self.assertEqual(self.client.get("/metrics/").status_code, 404)
+        with override_settings(METRICS_TOKEN="secret"):
+            response = self.client.get("/metrics/", HTTP_AUTHORIZATION="Bearer wrong")
+            self.assertEqual(response.status_code, 401)
+            self.client.get(reverse("posts:post_list"))
+            response = self.client.get("/metrics/", HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn(
+            'http_request_duration_seconds_count{route="posts:post_list"} 1', body
+        )
+        self.assertIn('http_request_db_queries_total{route="posts:post_list"}', body)
+
+
+class StatementTimeoutTests(TestCase):
+    @override_settings(STATEMENT_TIMEOUT=30000)
+    def test_new_postgresql_connections_are_limited(self):
+        postgresql = MagicMock(vendor="postgresql")
+        set_statement_timeout(None, postgresql)
+        cursor = postgresql.cursor.return_value.__enter__.return_value
+        cursor.execute.assert_called_once_with("SET statement_timeout = %s", [30000])
+
+        other = Mock(vendor="sqlite")
+        set_statement_timeout(None, other)
+        other.cursor.assert_not_called()
+
+    @override_settings(STATEMENT_TIMEOUT=0)
+    def test_no_limit_sets_nothing(self):
+        postgresql = MagicMock(vendor="postgresql")
+        set_statement_timeout(None, postgresql)
+        postgresql.cursor.assert_not_called()
+
+
+@skipUnless(os.getenv("RUN_BENCHMARKS"), "set RUN_BENCHMARKS=1 to run benchmarks")
+class RequestMetricsBenchmark(APITestCase):
+    def test_middleware_overhead(self):
+        user = User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+            email="test@mail.ru",
+        )
+        Post.objects.bulk_create(
+            Post(user=user, title=f"Post {i}", text="Text") for i in range(20)
+        )
+        url = reverse("posts:post_list") + "?expand=author,comments"
+
+        def measure():
+            timings = []
+            for _ in range(300):
+                started = time.perf_counter()
+                self.client.get(url)
+                timings.append(time.perf_counter() - started)
+            return statistics.median(timings)
+
+        measure()
+        with_metrics = measure()
+        with self.modify_settings(
+            MIDDLEWARE={"remove": "common.middleware.RequestMetricsMiddleware"}
+        ):
+            without_metrics = measure()
+        print(
+            f"\npost list median: {with_metrics * 1000:.2f}ms with metrics, "
+            f"{without_metrics * 1000:.2f}ms without"
+        )
+
+
+class CommentThreadTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+            email="test@mail.ru",
+        )
+        self.post = Post.objects.create(user=self.user, title="Post", text="Text")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def comment(self, text, parent=None, post=None):
+        return Comment.objects.create(
+            user=self.user, post=post or self.post, parent=parent, text=text
+        )
+
+    def reply(self, parent, text="Reply"):
+        return self.client.post(
+            reverse("comments:comment_create", args=[self.post.pk]),
+            {"text": text, "parent": parent.pk if parent else None},
+            format="json",
+        )
+
+    def build_tree(self, sizes, seed=0):
+        """
+        Create a thread with sizes[i] comments at depth i + 1, each replying
+        to a random comment of the level above, level by level in bulk.
+        """
+        rng = random.Random(seed)
+        level = [self.comment("Root")]
+        comments = list(level)
+        for size in sizes[1:]:
+            level = Comment.objects.bulk_create(
+                Comment(
+                    user=self.user,
+                    post=self.post,
+                    parent=rng.choice(level),
+                    text=f"Reply {i}",
+                )
+                for i in range(size)
+            )
+            Comment.objects.set_paths(level)
+            comments.extend(level)
+        return comments
+
+    def walk(self, node, depth=1):
+        yield node, depth
+        for reply in node["replies"]:
+            self.assertEqual(reply["parent"], node["id"])
+            yield from self.walk(reply, depth + 1)
+
+    def test_replies_get_the_path_of_their_parent(self):
+        root = self.comment("Root")
+        response = self.reply(root)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["parent"], root.pk)
+        reply = Comment.objects.get(pk=response.data["id"])
+        self.assertEqual(root.path, str(root.pk).zfill(COMMENT_PATH_WIDTH))
+        self.assertEqual(reply.path, root.path + str(reply.pk).zfill(COMMENT_PATH_WIDTH))
+        self.assertEqual(reply.depth, 2)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+
+    def test_reply_to_a_comment_on_another_post(self):
+        other = Post.objects.create(user=self.user, title="Other", text="Text")
+        response = self.reply(self.comment("Root", post=other))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("parent", response.data)
+
+    def test_nesting_depth_is_limited(self):
+        parent = None
+        for depth in range(COMMENT_MAX_DEPTH):
+            parent = self.comment(f"Level {depth}", parent)
+        response = self.reply(parent)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.reply(parent.parent).status_code, status.HTTP_201_CREATED)
+
+    def test_bulk_replies_get_paths(self):
+        root = self.comment("Root")
+        response = self.client.post(
+            reverse("comments:comment_bulk_create", args=[self.post.pk]),
+            [{"text": "First", "parent": root.pk}, {"text": "Second"}],
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        first, second = Comment.objects.filter(pk__in=[c["id"] for c in response.data])
+        self.assertTrue(first.path.startswith(root.path))
+        self.assertEqual(first.depth, 2)
+        self.assertEqual(second.depth, 1)
+
+    def test_subtree_is_read_with_one_range_query(self):
+        root = self.comment("Root")
+        reply = self.comment("Reply", root)
+        nested = self.comment("Nested", reply)
+        self.comment("Sibling", root)
+        self.comment("Other thread")
+        # One query looks up the path of the comment, one reads its subtree.
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                reverse("comments:comment_thread", args=[self.post.pk, reply.pk])
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["id"], reply.pk)
+        self.assertEqual(
+            [node["id"] for node, _ in self.walk(response.data)], [reply.pk, nested.pk]
+        )
+
+    def test_threads_with_their_first_replies(self):
+        threads = []
+        for i in range(3):
+            root = self.comment(f"Thread {i}")
+            first = self.comment("First", root)
+            self.comment("Nested", first)
+            self.comment("Second", root)
+            threads.append(root)
+        url = reverse("comments:comment_threads", args=[self.post.pk])
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {"page_size": 2, "replies": 2})
+        results = response.data["results"]
+        self.assertEqual([thread["id"] for thread in results], [t.pk for t in threads[:2]])
+        self.assertEqual(results[0]["reply_count"], 3)
+        self.assertEqual(
+            [node["text"] for node, _ in self.walk(results[0])],
+            ["Thread 0", "First", "Nested"],
+        )
+        response = self.client.get(response.data["next"])
+        self.assertEqual([thread["id"] for thread in response.data["results"]], [threads[2].pk])
+        self.assertIsNone(response.data["next"])
+
+    def test_threads_of_a_missing_post(self):
+        response = self.client.get(reverse("comments:comment_threads", args=[9999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_deleting_a_comment_deletes_its_replies(self):
+        root = Comment.objects.get(pk=self.reply(None, "Root").data["id"])
+        reply = Comment.objects.get(pk=self.reply(root).data["id"])
+        self.reply(reply)
+        self.reply(None, "Other")
+        response = self.client.delete(
+            reverse("comments:comment_delete", args=[self.post.pk, root.pk])
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(list(Comment.objects.values_list("text", flat=True)), ["Other"])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+        self.assertEqual(
+            self.post.last_commented_at, Comment.objects.get(text="Other").created_at
+        )
+
+    def test_thread_of_10k_comments(self):
+        comments = self.build_tree([1, 10, 100, 1000, 8889])
+        root = comments[0]
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                reverse("comments:comment_thread", args=[self.post.pk, root.pk])
+            )
+        nodes = list(self.walk(response.data))
+        self.assertEqual(len(nodes), 10_000)
+        self.assertEqual(max(depth for _, depth in nodes), 5)
+        by_id = {comment.pk: comment for comment in comments}
+        for node, depth in nodes:
+            self.assertEqual(by_id[node["id"]].depth, depth)
+            ids = [reply["id"] for reply in node["replies"]]
+            self.assertEqual(ids, sorted(ids))
+
+        response = self.client.get(
+            reverse("comments:comment_threads", args=[self.post.pk]), {"replies": 5}
+        )
+        thread = response.data["results"][0]
+        self.assertEqual(thread["reply_count"], 9_999)
+        expected = [c.pk for c in sorted(comments, key=lambda c: c.path)[:6]]
+        self.assertEqual([node["id"] for node, _ in self.walk(thread)], expected)
+
+    def test_tree_building_is_linear(self):
+        class CountingDict(dict):
+            operations = 0
+
+            def __getitem__(self, key):
+                CountingDict.operations += 1
+                return super().__getitem__(key)
+
+            def __setitem__(self, key, value):
+                CountingDict.operations += 1
+                super().__setitem__(key, value)
+
+        comments = self.build_tree([1, 10, 100, 1000, 8889])
+        items = [
+            CountingDict(id=c.pk, parent=c.parent_id)
+            for c in sorted(comments, key=lambda c: c.path)
+        ]
+        roots = build_tree(items)
+        self.assertEqual(len(roots), 1)
+        # A few lookups per comment, never a search through the others.
+        self.assertLessEqual(CountingDict.operations, 4 * len(items))
+
+    def test_the_insert_writes_the_path(self):
+        if connection.vendor != "postgresql":
+            self.skipTest("ids are only drawn before the insert on PostgreSQL")
+        root = self.comment("Root")
+        with CaptureQueriesContext(connection) as queries:
+            reply = Comment.objects.create(
+                user=self.user, post=self.post, parent=root, text="Reply"
+            )
+        writes = [q["sql"] for q in queries if not q["sql"].startswith("SELECT")]
+        self.assertEqual(len(writes), 1)
+        self.assertTrue(writes[0].startswith("INSERT"))
+        reply.refresh_from_db()
+        self.assertEqual(reply.path, comment_path(root.path, reply.pk))
+
+
+@override_settings(TASKS_EAGER=True)
+class ReactionTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+            email="test@mail.ru",
+        )
+        self.post = Post.objects.create(user=self.user, title="Post", text="Text")
+        self.comment = Comment.objects.create(user=self.user, post=self.post, text="Text")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def toggle(self, url, method="post"):
+        with self.captureOnCommitCallbacks(execute=True):
+            return getattr(self.client, method)(url)
+
+    def test_liking_a_post_is_idempotent(self):
+        url = reverse("posts:post_like", args=[self.post.pk])
+        for _ in range(2):
+            response = self.toggle(url)
+            self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        self.assertEqual(Reaction.objects.filter(post=self.post).count(), 1)
+
+        for _ in range(2):
+            response = self.toggle(url, "delete")
+            self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
+        self.assertFalse(Reaction.objects.exists())
+
+    def test_liking_a_comment(self):
+        url = reverse("comments:comment_like", args=[self.post.pk, self.comment.pk])
+        self.toggle(url)
+        self.toggle(url)
+        self.comment.refresh_from_db()
+        self.post.refresh_from_db()
+        self.assertEqual(self.comment.like_count, 1)
+        self.assertEqual(self.post.like_count, 0)
+
+    def test_liking_a_comment_of_another_post(self):
+        other = Post.objects.create(user=self.user, title="Other", text="Text")
+        url = reverse("comments:comment_like", args=[other.pk, self.comment.pk])
+        response = self.toggle(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_anonymous_users_cannot_like(self):
+        self.client.force_authenticate(user=None)
+        response = self.toggle(reverse("posts:post_like", args=[self.post.pk]))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_likes_show_up_in_the_cached_post(self):
+        detail = reverse("posts:post_retrieve", args=[self.post.pk])
+        self.assertEqual(self.client.get(detail).data["like_count"], 0)
+        self.toggle(reverse("posts:post_like", args=[self.post.pk]))
+        self.assertEqual(self.client.get(detail).data["like_count"], 1)
+
+    def test_one_reaction_per_user_and_target(self):
+        Reaction.objects.create(user=self.user, post=self.post)
+        Reaction.objects.create(user=self.user, comment=self.comment)
+        for target in ({"post": self.post}, {"comment": self.comment}):
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                Reaction.objects.create(user=self.user, **target)
+
+    def test_a_reaction_has_a_single_target(self):
+        for target in ({}, {"post": self.post, "comment": self.comment}):
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                Reaction.objects.create(user=self.user, **target)
+
+    def test_rebuild_command(self):
+        Reaction.objects.create(user=self.user, post=self.post)
+        Reaction.objects.create(user=self.user, comment=self.comment)
+        Post.objects.update(like_count=42)
+        call_command("rebuild_like_counters", chunk_size=1, stdout=StringIO())
+        self.post.refresh_from_db()
+        self.comment.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        self.assertEqual(self.comment.like_count, 1)
+
+
+@override_settings(TASKS_EAGER=False, COUNTER_FLUSH_INTERVAL=3600)
+class CounterBufferTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+            email="test@mail.ru",
+        )
+        self.posts = [
+            Post.objects.create(user=self.user, title="Post", text="Text")
+            for _ in range(3)
+        ]
+        self.buffer = CounterBuffer()
+
+    def tearDown(self):
+        if self.buffer.timer is not None:
+            self.buffer.timer.cancel()
+
+    def test_concurrent_increments_are_exact_after_a_flush(self):
+        threads = 8
+        per_thread = 5000
+
+        def like(worker):
+            for i in range(per_thread):
+                post = self.posts[(worker + i) % len(self.posts)]
+                # Every fourth call takes a like back.
+                self.buffer.buffer(Post, post.pk, "like_count", -1 if i % 4 == 3 else 1)
+
+        with ThreadPoolExecutor(threads) as pool:
+            futures = [pool.submit(like, worker) for worker in range(threads)]
+            # Flush while the increments come in, so some land mid-flush.
+            while not all(future.done() for future in futures):
+                self.buffer.flush()
+            for future in futures:
+                future.result()
+        self.buffer.flush()
+
+        expected = {post.pk: 0 for post in self.posts}
+        for worker in range(threads):
+            for i in range(per_thread):
+                post = self.posts[(worker + i) % len(self.posts)]
+                expected[post.pk] += -1 if i % 4 == 3 else 1
+        counts = dict(Post.objects.values_list("pk", "like_count"))
+        self.assertEqual(counts, expected)
+        self.assertEqual(sum(counts.values()), threads * per_thread // 2)
+
+    def test_the_flush_runs_on_a_task_worker(self):
+        executor = Mock()
+        with patch("common.counters.get_executor", return_value=executor):
+            with override_settings(COUNTER_FLUSH_INTERVAL=0):
+                self.buffer.buffer(Post, self.posts[0].pk, "like_count", 1)
+            self.buffer.timer.join()
+        executor.submit.assert_called_once_with(run_task, self.buffer.flush)
+        self.assertEqual(self.buffer.flush(), 1)
+
+    def test_one_update_per_delta(self):
+        for post in self.posts:
+            for _ in range(100):
+                self.buffer.buffer(Post, post.pk, "like_count", 1)
+        self.buffer.buffer(Post, self.posts[0].pk, "like_count", 1)
+        # A savepoint, one locking read and one UPDATE per distinct delta.
+        with self.assertNumQueries(2 + 1 + 2):
+            self.assertEqual(self.buffer.flush(), 3)
+        counts = sorted(Post.objects.values_list("like_count", flat=True))
+        self.assertEqual(counts, [100, 100, 101])
+
+    def test_counters_do_not_go_below_zero(self):
+        self.buffer.buffer(Post, self.posts[0].pk, "like_count", -1)
+        self.buffer.flush()
+        self.posts[0].refresh_from_db()
+        self.assertEqual(self.posts[0].like_count, 0)
+
+    def test_failed_flush_keeps_the_increments(self):
+        self.buffer.buffer(Post, self.posts[0].pk, "like_count", 2)
+        with patch("common.counters.has_field", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.buffer.flush()
+        self.buffer.flush()
+        self.posts[0].refresh_from_db()
+        self.assertEqual(self.posts[0].like_count, 2)
+
+
+@override_settings(TASKS_EAGER=True)
+class SoftDeleteTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(
+            username="author",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+            email="author@mail.ru",
+        )
+        self.reader = User.objects.create_user(
+            username="reader",
+            password="12345678",
+            phone_number="87654321",
+            birth_date="2003-01-01",
+            email="reader@mail.ru",
+            is_staff=True,
+        )
+        self.post = Post.objects.create(user=self.author, title="Post", text="Text")
+        self.other = Post.objects.create(user=self.reader, title="Other", text="Text")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.author)
+
+    def comment(self, user, post, parent=None):
+        comment = Comment.objects.create(user=user, post=post, parent=parent, text="Text")
+        Post.objects.filter(pk=post.pk).add_comments(1)
+        return comment
+
+    def delete_post(self, execute):
+        with self.captureOnCommitCallbacks(execute=execute):
+            return self.client.delete(reverse("posts:post_delete", args=[self.post.pk]))
+
+    def test_deleted_post_is_hidden_until_purged(self):
+        comment = self.comment(self.reader, self.post)
+        Reaction.objects.create(user=self.reader, post=self.post)
+        response = self.delete_post(execute=False)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        self.assertFalse(Post.objects.filter(pk=self.post.pk).exists())
+        self.assertTrue(Post.all_objects.deleted().filter(pk=self.post.pk).exists())
+        self.assertTrue(Comment.all_objects.filter(pk=comment.pk).exists())
+        self.assertFalse(Comment.objects.filter(pk=comment.pk).exists())
+        response = self.client.get(reverse("posts:post_retrieve", args=[self.post.pk]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        ids = [post["id"] for post in self.client.get(reverse("posts:post_list")).data["results"]]
+        self.assertEqual(ids, [self.other.pk])
+        response = self.client.post(
+            reverse("comments:comment_create", args=[self.post.pk]), {"text": "Late"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        out = StringIO()
+        call_command("purge_deleted", batch_size=1, stdout=out)
+        self.assertEqual(out.getvalue().strip(), "Purged 0 users and 1 posts.")
+        self.assertFalse(Post.all_objects.filter(pk=self.post.pk).exists())
+        self.assertFalse(Comment.all_objects.filter(post_id=self.post.pk).exists())
+        self.assertFalse(Reaction.objects.exists())
+
+    def test_deleted_post_leaves_the_timelines(self):
+        TimelineEntry.objects.create(
+            user=self.author, post=self.post, created_at=self.post.created_at
+        )
+        self.delete_post(execute=False)
+        response = self.client.get(reverse("posts:post_home"))
+        self.assertEqual(response.data["results"], [])
+
+    def test_deleted_post_is_purged_in_the_background(self):
+        self.comment(self.reader, self.post)
+        self.delete_post(execute=True)
+        self.assertFalse(Post.all_objects.filter(pk=self.post.pk).exists())
+        self.assertFalse(Comment.all_objects.exists())
+
+    def test_purge_deletes_replies_before_their_parents(self):
+        parent = None
+        for _ in range(5):
+            parent = self.comment(self.reader, self.post, parent)
+        Post.objects.filter(pk=self.post.pk).soft_delete()
+        with CaptureQueriesContext(connection) as queries:
+            call_command("purge_deleted", batch_size=1, stdout=StringIO())
+        deletes = [
+            query["sql"]
+            for query in queries
+            if query["sql"].startswith('DELETE FROM "posts_comment"')
+        ]
+        # One comment per statement: no batch cascades to the next ones.
+        self.assertEqual(len(deletes), 5)
+        for sql in deletes:
+            self.assertNotIn(",", sql.split(" IN ")[-1])
+        self.assertFalse(Comment.all_objects.exists())
+
+    def test_purging_a_user_keeps_the_counters_of_others_right(self):
+        own = self.comment(self.reader, self.post)
+        on_other = self.comment(self.author, self.other)
+        self.comment(self.reader, self.other, parent=on_other)
+        self.comment(self.reader, self.other)
+        comment = self.comment(self.reader, self.other)
+        for target in ({"post": self.other}, {"comment": comment}):
+            Reaction.objects.create(user=self.author, **target)
+        Post.objects.filter(pk=self.other.pk).update(like_count=1)
+        Comment.objects.filter(pk=comment.pk).update(like_count=1)
+        Follow.objects.create(follower=self.author, followee=self.reader)
+        User.objects.filter(pk=self.reader.pk).update(follower_count=1)
+
+        self.client.force_authenticate(user=self.reader)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(
+                reverse("users:user_delete", args=[self.author.pk])
+            )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        self.assertFalse(User.all_objects.filter(pk=self.author.pk).exists())
+        self.assertFalse(Post.all_objects.filter(pk=self.post.pk).exists())
+        self.assertFalse(Comment.all_objects.filter(pk=own.pk).exists())
+        self.other.refresh_from_db()
+        comment.refresh_from_db()
+        self.reader.refresh_from_db()
+        # The reply to the purged comment went with it.
+        self.assertEqual(self.other.comment_count, 2)
+        self.assertEqual(
+            self.other.last_commented_at,
+            Comment.objects.filter(post=self.other).latest("created_at").created_at,
+        )
+        self.assertEqual(self.other.like_count, 0)
+        self.assertEqual(comment.like_count, 0)
+        self.assertEqual(self.reader.follower_count, 0)
+
+    def test_comments_of_a_deleted_post_are_hidden(self):
+        comment = self.comment(self.reader, self.post)
+        detail = reverse("comments:comment_retrieve", args=[self.post.pk, comment.pk])
+        self.delete_post(execute=False)
+
+        self.assertEqual(self.client.get(detail).status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse("comments:comment_list", args=[self.post.pk]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse("posts:comment_search"), {"q": "Text"})
+        self.assertEqual(response.data["results"], [])
+
+    def test_purge_drops_cached_payloads_first(self):
+        comment = self.comment(self.reader, self.post)
+        detail = reverse("comments:comment_retrieve", args=[self.post.pk, comment.pk])
+        self.assertEqual(self.client.get(detail).status_code, status.HTTP_200_OK)
+        self.delete_post(execute=False)
+        forget_payloads(Comment.all_objects.filter(post=self.post), comment_cache, 1)
+        self.assertEqual(self.client.get(detail).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_deleted_user_is_hidden_with_what_they_wrote(self):
+        comment = self.comment(self.author, self.other)
+        reply = self.comment(self.reader, self.post)
+        self.client.force_authenticate(user=self.reader)
+        with self.captureOnCommitCallbacks(execute=False):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.delete(reverse("users:user_delete", args=[self.author.pk]))
+        # Only the user row is written: what they own is hidden by the managers.
+        self.assertFalse(
+            [
+                query["sql"]
+                for query in queries
+                if query["sql"].startswith(("UPDATE", "DELETE"))
+                and "posts_" in query["sql"].split()[2]
+            ]
+        )
+
+        for url in (
+            reverse("posts:post_retrieve", args=[self.post.pk]),
+            reverse("comments:comment_retrieve", args=[self.other.pk, comment.pk]),
+            reverse("comments:comment_retrieve", args=[self.post.pk, reply.pk]),
+        ):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse("posts:post_list"), {"expand": "author,comments"})
+        self.assertEqual([post["id"] for post in response.data["results"]], [self.other.pk])
+        self.assertEqual(response.data["results"][0]["comments"], [])
+        response = self.client.get(reverse("comments:comment_list", args=[self.other.pk]))
+        self.assertEqual(response.data["results"], [])
+        response = self.client.get(reverse("posts:post_search"), {"q": "Post"})
+        self.assertEqual(response.data["results"], [])
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+THROTTLE_RATES = {
+    **settings.REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"],
+    "write": "3/min",
+    "write_ip": "5/min",
+    "test": "10/min",
+}
+
+
+@override_settings(
+    REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": THROTTLE_RATES}
+)
+class ThrottleTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        # At the start of a minute, so windows line up with the test.
+        self.clock = FakeClock(60 * 1_000_000)
+        patcher = patch.object(SlidingWindowThrottle, "timer", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.users = [
+            User.objects.create_user(
+                username=f"user{i}",
+                password="12345678",
+                phone_number=f"1234567{i}",
+                birth_date="2003-01-01",
+                email=f"user{i}@mail.ru",
+            )
+            for i in range(3)
+        ]
+        self.post = Post.objects.create(user=self.users[0], title="Post", text="Text")
+        self.client = APIClient()
+
+    def comment(self, user):
+        self.client.force_authenticate(user=user)
+        return self.client.post(
+            reverse("comments:comment_create", args=[self.post.pk]), {"text": "Text"}
+        )
+
+    def check(self, throttle, ip="10.0.0.1"):
+        request = APIRequestFactory().get("/", REMOTE_ADDR=ip)
+        request.user = None
+        view = APIView()
+        view.throttle_scope = "test"
+        return throttle.allow_request(request, view)
+
+    def test_writes_are_limited_per_user(self):
+        for _ in range(3):
+            self.assertEqual(self.comment(self.users[0]).status_code, status.HTTP_201_CREATED)
+        response = self.comment(self.users[0])
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn("Retry-After", response)
+        self.assertEqual(self.comment(self.users[1]).status_code, status.HTTP_201_CREATED)
+        # Reading is not a write.
+        response = self.client.get(reverse("posts:post_retrieve", args=[self.post.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_writes_are_limited_per_ip(self):
+        statuses = [self.comment(user).status_code for user in self.users for _ in range(2)]
+        self.assertEqual(statuses[:5], [status.HTTP_201_CREATED] * 5)
+        self.assertEqual(statuses[5], status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_window_slides(self):
+        throttle = ScopedThrottle()
+        self.assertTrue(all(self.check(throttle) for _ in range(10)))
+        # A quarter into the next minute, three quarters of the previous one
+        # still count: 7.5 requests, so two more fit and a third does not.
+        self.clock.now += 75
+        self.assertTrue(self.check(throttle))
+        self.assertTrue(self.check(throttle))
+        self.assertFalse(self.check(throttle))
+        # The previous minute has to slide out to 30%, from 25%.
+        self.assertAlmostEqual(throttle.wait(), 3)
+        # Another address has its own budget.
+        self.assertTrue(self.check(throttle, ip="10.0.0.2"))
+        # From the start of the minute after next, nothing counts anymore.
+        self.clock.now += 105
+        self.assertTrue(all(self.check(throttle) for _ in range(10)))
+        self.assertFalse(self.check(throttle))
+        self.assertAlmostEqual(throttle.wait(), 60 + 60 / 11)
+
+    def test_a_check_is_one_cache_round_trip(self):
+        spy = Mock(wraps=cache)
+        with patch.object(SlidingWindowThrottle, "cache", spy):
+            throttle = ScopedThrottle()
+            self.check(throttle)
+            spy.reset_mock()
+            for _ in range(5):
+                self.check(throttle)
+        self.assertEqual([call[0] for call in spy.method_calls], ["incr"] * 5)
+
+    def test_the_previous_window_is_carried_over_once(self):
+        spy = Mock(wraps=cache)
+        with patch.object(SlidingWindowThrottle, "cache", spy):
+            throttle = ScopedThrottle()
+            for _ in range(4):
+                self.check(throttle)
+            self.clock.now += 60
+            spy.reset_mock()
+            self.check(throttle)
+            self.check(throttle)
+        self.assertEqual(
+            [call[0] for call in spy.method_calls], ["incr", "get", "add", "incr"]
+        )
+        self.assertEqual((throttle.previous, throttle.current), (4, 2))
+
+    async def test_async_routes_are_limited(self):
+        rates = {**THROTTLE_RATES, "anon": "2/min"}
+        url = reverse("async:post_retrieve", args=[self.post.pk])
+        with override_settings(
+            REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": rates}
+        ):
+            statuses = [(await self.async_client.get(url)).status_code for _ in range(2)]
+            response = await self.async_client.get(url)
+        self.assertEqual(statuses, [status.HTTP_200_OK] * 2)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn("Retry-After", response)
+
+    def test_scopes_without_a_rate_are_not_limited(self):
+        rates = {**THROTTLE_RATES}
+        del rates["write"], rates["write_ip"]
+        with override_settings(
+            REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": rates}
+        ):
+            for _ in range(10):
+                self.assertEqual(
+                    self.comment(self.users[0]).status_code, status.HTTP_201_CREATED
+                )
+
+
+class SingleThreadedWSGIServer(WSGIServer):
+    def __init__(self, *args, connections_override=None, **kwargs):
+        super().__init__(*args, **kwargs)
+
+
+class SingleThreadedLiveServerThread(LiveServerThread):
+    # Every request is handled by the server thread itself, which keeps its
+    # connection between requests like the worker threads of a WSGI server.
+    server_class = SingleThreadedWSGIServer
+
+
+@skipUnless(os.getenv("RUN_BENCHMARKS"), "set RUN_BENCHMARKS=1 to run benchmarks")
+@override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {}})
+class ConnectionBenchmark(LiveServerTestCase):
+    """
+    Requests per second with a new database connection for every request
+    against persistent connections. Run it again with POSTGRES_HOST and
+    POSTGRES_PORT pointing at PgBouncer to measure it instead.
+    """
+
+    server_thread_class = SingleThreadedLiveServerThread
+
+    def test_requests_per_second(self):
+        if connection.vendor != "postgresql":
+            self.skipTest("connection setup is only worth measuring on PostgreSQL")
+        user = User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+            email="test@mail.ru",
+        )
+        Post.objects.bulk_create(
+            Post(user=user, title=f"Post {i}", text="Text") for i in range(20)
+        )
+        url = self.live_server_url + reverse("posts:post_list")
+        # Without persistence first: a persistent connection stays open until
+        # its CONN_MAX_AGE is over.
+        modes = [("a connection per request", 0), ("persistent connections", 60)]
+        for name, max_age in modes:
+            with patch.dict(connection.settings_dict, CONN_MAX_AGE=max_age):
+                for _ in range(20):
+                    urlopen(url).read()
+                started = time.perf_counter()
+                for _ in range(500):
+                    urlopen(url).read()
+                elapsed = time.perf_counter() - started
+            print(f"\n{name}: {500 / elapsed:.0f} requests per second")
@@ -0,0 +1,101 @@
+from django.db.models import Count, Subquery, Value, Window
+from django.db.models.functions import Coalesce, RowNumber, Substr
+from rest_framework.response import Response
+
+from common.pagination import KeysetPagination
+from posts.models import COMMENT_PATH_WIDTH
+
+DEFAULT_THREAD_REPLIES = 3
+MAX_THREAD_REPLIES = 100
+# Sorts after every path, as paths are made of digits only.
+PATH_END = "z"
+
+
+def build_tree(items):
+    """
+    Nest serialized comments, listed depth-first, in the `replies` of their
+    parents, in a single pass. Comments whose parent is not among the items
+    are returned as the roots.
+    """
+    nodes = {}
+    roots = []
+    for item in items:
+        item["replies"] = []
+        nodes[item["id"]] = item
+        parent = nodes.get(item["parent"])
+        if parent is None:
+            roots.append(item)
+        else:
+            parent["replies"].append(item)
+    return roots
+
+
+class ThreadPagination(KeysetPagination):
+    """
+    Keyset pagination over the threads of a post, each with its first replies.
+
+    A page is read with one query: the threads of the page are consecutive
+    in path order, so their comments are the range of paths from the first
+    thread up to the first thread of the next page, and a window function
+    keeps the first `replies` comments of each thread in that range.
+    """
+
+    ordering = ("path",)
+    replies_query_param = "replies"
+
+    def get_page_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.position = self.decode_cursor(request, queryset)
+        roots = self.filter_queryset(queryset.filter(parent=None), self.position)
+        roots = roots.values("path")
+        # The first comment of the next page is included, to tell if it exists.
+        end = Coalesce(
+            Subquery(roots[self.page_size : self.page_size + 1]), Value(PATH_END)
+        )
+        thread = Substr("path", 1, COMMENT_PATH_WIDTH)
+        return (
+            queryset.filter(path__gte=Subquery(roots[:1]), path__lte=end)
+            .annotate(
+                thread_position=Window(RowNumber(), partition_by=thread, order_by="path"),
+                thread_size=Window(Count("id"), partition_by=thread),
+            )
+            .filter(thread_position__lte=self.get_replies(request) + 1)
+            .order_by("path")
+        )
+
+    def get_replies(self, request):
+        try:
+            replies = int(request.query_params[self.replies_query_param])
+        except (KeyError, ValueError):
+            return DEFAULT_THREAD_REPLIES
+        return max(0, min(replies, MAX_THREAD_REPLIES))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        results = list(queryset)
+        roots = [comment for comment in results if comment.parent_id is None]
+        self.has_next = len(roots) > self.page_size
+        if self.has_next:
+            # The first comment of the next page sorts after the whole page.
+            results.pop()
+            roots.pop()
+        self.page = results
+        self.last_root = roots[-1] if roots else None
+        return self.page
+
+    def get_position(self, instance):
+        return [self.last_root.path]
+
+    def get_paginated_response(self, data):
+        sizes = {comment.pk: comment.thread_size for comment in self.page}
+        threads = build_tree(data)
+        for thread in threads:
+            thread["reply_count"] = sizes[thread["id"]] - 1
+        return Response({"next": self.get_next_link(), "results": threads})
@@ -0,0 +1,142 @@
+from itertools import chain, islice
+
+from django.conf import settings
+from django.core.cache import cache
+
+from common.pagination import KeysetPagination, keyset_filter
+from posts.models import Post, TimelineEntry
+from users.models import Follow, User
+
+PULLED_AUTHORS_TIMEOUT = 300
+WRITE_BATCH = 1000
+
+
+def is_pulled(follower_count):
+    """
+    Posts of authors with this many followers are not copied into every
+    follower's timeline but read from the author when a timeline is read.
+    """
+    return follower_count >= settings.TIMELINE_FANOUT_LIMIT
+
+
+def write_entries(posts, user_ids):
+    """
+    Add `posts` to the timelines of `user_ids` in batches, skipping entries
+    that already exist.
+    """
+    entries = (
+        TimelineEntry(user_id=user_id, post_id=post.pk, created_at=post.created_at)
+        for user_id in user_ids
+        for post in posts
+    )
+    while batch := list(islice(entries, WRITE_BATCH)):
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out_posts(post_ids):
+    """
+    Write new posts into the timelines of their authors and, unless the
+    authors are pulled, of all their followers.
+    """
+    posts = Post.objects.filter(pk__in=post_ids).only("id", "user_id", "created_at")
+    by_author = {}
+    for post in posts:
+        by_author.setdefault(post.user_id, []).append(post)
+
+    counts = User.objects.filter(pk__in=by_author).values_list("pk", "follower_count")
+    for author_id, follower_count in counts:
+        followers = ()
+        if not is_pulled(follower_count):
+            followers = (
+                Follow.objects.filter(followee_id=author_id)
+                .values_list("follower_id", flat=True)
+                .iterator(chunk_size=WRITE_BATCH)
+            )
+        write_entries(by_author[author_id], chain([author_id], followers))
+
+
+def backfill_timeline(user_id, author_id):
+    """
+    Copy the latest TIMELINE_BACKFILL posts of a newly followed author into
+    the follower's timeline.
+    """
+    author = User.objects.filter(pk=author_id).only("follower_count").first()
+    if author is None or is_pulled(author.follower_count):
+        return
+    posts = (
+        Post.objects.filter(user_id=author_id)
+        .only("id", "created_at")
+        .order_by("-created_at", "-id")[: settings.TIMELINE_BACKFILL]
+    )
+    write_entries(list(posts), [user_id])
+
+
+def clear_timeline(user_id, author_id):
+    """
+    Remove the posts of an unfollowed author from the follower's timeline.
+    """
+    TimelineEntry.objects.filter(user_id=user_id, post__user_id=author_id).delete()
+
+
+def pulled_authors_key(user_id):
+    return f"timeline:pulled:{user_id}"
+
+
+def get_pulled_authors(user_id):
+    """
+    Return the ids of the pulled authors `user_id` follows, cached for a few
+    minutes so that reading a timeline does not need to look them up.
+    """
+    key = pulled_authors_key(user_id)
+    authors = cache.get(key)
+    if authors is None:
+        authors = list(
+            Follow.objects.filter(
+                follower_id=user_id,
+                followee__follower_count__gte=settings.TIMELINE_FANOUT_LIMIT,
+            ).values_list("followee_id", flat=True)
+        )
+        cache.set(key, authors, PULLED_AUTHORS_TIMEOUT)
+    return authors
+
+
+def forget_pulled_authors(user_id):
+    cache.delete(pulled_authors_key(user_id))
+
+
+class TimelinePagination(KeysetPagination):
+    """
+    Keyset pagination over the timeline entries of a user, merged with the
+    posts of the pulled authors they follow.
+
+    Both sources are ordered by post creation time and id, so one cursor
+    positions both of them and a page takes at most page size + 1 rows from
+    each.
+    """
+
+    post_ordering = ("-created_at", "-id")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        entries = self.get_page_queryset(queryset, request, view)
+        if entries is None:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        posts = [entry.post for entry in entries]
+        pulled = view.get_pulled_queryset()
+        if pulled is not None:
+            pulled = pulled.order_by(*self.post_ordering)
+            if self.position is not None:
+                pulled = pulled.filter(keyset_filter(self.post_ordering, self.position))
+            seen = {post.pk for post in posts}
+            posts.extend(
+                post for post in pulled[: self.page_size + 1] if post.pk not in seen
+            )
+            posts.sort(key=lambda post: (post.created_at, post.pk), reverse=True)
+
+        self.page = posts[: self.page_size]
+        self.has_next = len(posts) > self.page_size
+        return self.page
+
+    def get_position(self, instance):
+        return [instance.created_at, instance.pk]
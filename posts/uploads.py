@@ -0,0 +1,140 @@
+import io
+import posixpath
+import uuid
+
+from django.core.files.base import File
+from django.core.files.storage import default_storage
+from rest_framework.exceptions import ValidationError
+
+from posts.models import Post
+
+UPLOADS_DIR = "uploads"
+READ_SIZE = 64 * 1024
+SIGNATURE_LENGTH = 12
+
+# Leading bytes of the accepted image formats and the extension they are stored with.
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png", ".png"),
+    (b"GIF87a", "image/gif", ".gif"),
+    (b"GIF89a", "image/gif", ".gif"),
+)
+IMAGE_EXTENSIONS = {
+    content_type: extension for _, content_type, extension in IMAGE_SIGNATURES
+}
+IMAGE_EXTENSIONS["image/webp"] = ".webp"
+
+
+def detect_image_type(head):
+    """
+    Return the content type of an image from its first bytes, or None.
+    """
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, content_type, _ in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    return None
+
+
+class ChunkReader:
+    """
+    File-like view of a request body that is read as it is written to storage.
+
+    It fails as soon as more than `limit` bytes arrive and, for the first chunk
+    of an upload, as soon as the leading bytes are known not to be an image, so
+    neither an oversized nor a mistyped body is ever held in memory or stored
+    in full.
+    """
+
+    def __init__(self, stream, limit, check_type=False):
+        self.stream = stream
+        self.limit = limit
+        self.check_type = check_type
+        self.head = b""
+        self.content_type = None
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size if size and size > 0 else READ_SIZE)
+        self.size += len(data)
+        if self.size > self.limit:
+            raise ValidationError(
+                f"The chunk is larger than the {self.limit} bytes left to upload."
+            )
+        if self.check_type and self.content_type is None:
+            self.head += data[: SIGNATURE_LENGTH - len(self.head)]
+            if len(self.head) >= SIGNATURE_LENGTH or not data:
+                self.content_type = detect_image_type(self.head)
+                if self.content_type is None:
+                    raise ValidationError(
+                        "The file is not a JPEG, PNG, GIF or WebP image."
+                    )
+        return data
+
+
+def store_part(upload, stream, limit):
+    """
+    Stream a chunk of `upload` from `stream` into its own part file and return
+    the part's name, size and, for the first chunk, the detected content type.
+    """
+    reader = ChunkReader(stream, limit, check_type=not upload.received)
+    name = f"{UPLOADS_DIR}/{upload.pk}/{upload.received}-{uuid.uuid4().hex}.part"
+    try:
+        name = default_storage.save(name, File(reader, name))
+    except Exception:
+        default_storage.delete(name)
+        raise
+    return name, reader.size, reader.content_type
+
+
+class ConcatenatedParts(io.RawIOBase):
+    """
+    Read the parts of an upload one after another as a single stream.
+    """
+
+    def __init__(self, names):
+        self.names = iter(names)
+        self.current = None
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while True:
+            if self.current is None:
+                name = next(self.names, None)
+                if name is None:
+                    return 0
+                self.current = default_storage.open(name, "rb")
+            count = self.current.readinto(buffer)
+            if count:
+                return count
+            self.current.close()
+            self.current = None
+
+    def close(self):
+        if self.current is not None:
+            self.current.close()
+            self.current = None
+        super().close()
+
+
+def assemble(upload):
+    """
+    Concatenate the parts of a completed upload into a post image in storage
+    and return its name. The parts are streamed, never loaded whole.
+    """
+    stem = posixpath.splitext(posixpath.basename(upload.filename))[0] or "image"
+    filename = stem + IMAGE_EXTENSIONS[upload.content_type]
+    name = Post._meta.get_field("image").generate_filename(None, filename)
+    names = [part_name for part_name, _ in upload.parts]
+    with io.BufferedReader(ConcatenatedParts(names), READ_SIZE) as stream:
+        content = File(stream, name)
+        content.size = upload.size
+        return default_storage.save(name, content)
+
+
+def delete_parts(parts):
+    for name, _ in parts:
+        default_storage.delete(name)
@@ -1,8 +1,14 @@
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
+from posts.moderation import lexicon
+
 
 def validate_title(value):
-    forbidden_words = ["ерунда", "глупость", "чепуха"]
-    if any(word in value.lower() for word in forbidden_words):
+    if lexicon.contains(value):
         raise ValidationError("Title cannot contain forbidden words.")
+
+
+def validate_text(value):
+    if lexicon.contains(value):
+        raise ValidationError("Text cannot contain forbidden words.")
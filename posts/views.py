@@ -1,13 +1,32 @@
-from datetime import date, datetime
-
+from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.db import transaction
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from rest_framework import generics, permissions, viewsets, serializers
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
 from rest_framework.views import status
-from .models import Post, Comment
+
+from common.asyncviews import AsyncListView, AsyncRetrieveView
+from common.cache import CachedRetrieveMixin
+from common.tasks import enqueue
+from common.conditional import ConditionalGetMixin
+from common.expansions import ExpandMixin
+from common.export import NDJSONExportView
+from users.permissions import IsAdult
+from .cache import comment_cache, post_cache
+from .images import build_image_variants
+from .models import Post, Comment, TimelineEntry, Upload
 from .permissions import IsOwner
+from .purge import purge_post
+from .reactions import like, unlike
 from .serializers import PostSerializer, CommentSerializer, CommentCreateSerializer, PostCreateSerializer
+from .serializers import PostSearchSerializer, CommentSearchSerializer, UploadSerializer
+from .threads import ThreadPagination, build_tree
+from .timelines import TimelinePagination, fan_out_posts, get_pulled_authors
+from .uploads import assemble, delete_parts, store_part
 
 
 class PostCreate(generics.CreateAPIView):
@@ -17,28 +36,136 @@ class PostCreate(generics.CreateAPIView):
 
     queryset = Post.objects.all()
     serializer_class = PostCreateSerializer
-    permission_classes = [permissions.IsAuthenticated]
+    permission_classes = [permissions.IsAuthenticated, IsAdult]
+    throttle_scope = "write"
+
+    def perform_create(self, serializer):
+        post = serializer.save(user_id=self.request.user.pk)
+        post_cache.invalidate(post.pk)
+        enqueue(fan_out_posts, [post.pk])
+        if post.image:
+            enqueue(build_image_variants, post.pk)
+
+
+class PostBulkCreate(PostCreate):
+    """
+    Create a batch of posts in one transaction.
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.update(
+            many=True, allow_empty=False, max_length=settings.BULK_CREATE_MAX_ITEMS
+        )
+        return super().get_serializer(*args, **kwargs)
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            posts = serializer.save(user_id=self.request.user.pk)
+            enqueue(fan_out_posts, [post.pk for post in posts])
+        post_cache.invalidate_many(post.pk for post in posts)
+
+
+class UploadCreate(generics.CreateAPIView):
+    """
+    Start a chunked image upload.
+    """
+
+    queryset = Upload.objects.all()
+    serializer_class = UploadSerializer
+    permission_classes = [permissions.IsAuthenticated, IsAdult]
+    throttle_scope = "write"
 
     def perform_create(self, serializer):
+        serializer.save(user_id=self.request.user.pk)
+
+
+class UploadDetail(generics.RetrieveAPIView):
+    """
+    Show the progress of an upload, or append a chunk to it.
+    """
+
+    serializer_class = UploadSerializer
+    permission_classes = [permissions.IsAuthenticated, IsAdult]
+    offset_header = "Upload-Offset"
+
+    def get_queryset(self):
+        return Upload.objects.filter(user_id=self.request.user.pk)
+
+    def put(self, request, *args, **kwargs):
         """
-        Check if the user is old enough to create a post.
+        Stream the request body into storage as the next part of the upload.
+        The `Upload-Offset` header must match the bytes received so far, so a
+        client that lost a response can ask for the offset and resume.
         """
-        today = date.today()
-        birth_date_str = str(self.request.user.birth_date)
-        birth_date = datetime.strptime(birth_date_str, "%Y-%m-%d").date()
-        age = (
-            today.year
-            - birth_date.year
-            - ((today.month, today.day) < (birth_date.month, birth_date.day))
-        )
-        if age < 18:
+        upload = self.get_object()
+        try:
+            offset = int(request.headers[self.offset_header])
+        except (KeyError, ValueError):
+            raise serializers.ValidationError(
+                {self.offset_header: "The byte offset of the chunk is required."}
+            )
+        if offset != upload.received:
+            return Response(
+                {"received": upload.received}, status=status.HTTP_409_CONFLICT
+            )
+
+        limit = min(upload.size - offset, settings.UPLOAD_CHUNK_MAX_SIZE)
+        if request.stream is None:
+            raise serializers.ValidationError("The chunk is empty.")
+        if int(request.META.get("CONTENT_LENGTH") or 0) > limit:
             raise serializers.ValidationError(
-                "User must be at least 18 years old to create a post."
+                f"The chunk is larger than the {limit} bytes left to upload."
+            )
+        name, size, content_type = store_part(upload, request.stream, limit)
+
+        fields = {
+            "received": offset + size,
+            "parts": upload.parts + [[name, size]],
+            "updated_at": timezone.now(),
+        }
+        if content_type:
+            fields["content_type"] = content_type
+        if not Upload.objects.filter(pk=upload.pk, received=offset).update(**fields):
+            default_storage.delete(name)
+            upload.refresh_from_db()
+            return Response(
+                {"received": upload.received}, status=status.HTTP_409_CONFLICT
             )
-        serializer.save(user=self.request.user)
+        for field, value in fields.items():
+            setattr(upload, field, value)
+        return Response(self.get_serializer(upload).data)
+
+
+class UploadComplete(PostCreate):
+    """
+    Create a post with the image of a completed upload.
+    """
 
+    def get_upload(self):
+        return get_object_or_404(
+            Upload.objects.filter(user_id=self.request.user.pk), pk=self.kwargs["pk"]
+        )
 
-class PostList(generics.ListAPIView):
+    def perform_create(self, serializer):
+        upload = self.get_upload()
+        if upload.received != upload.size:
+            raise serializers.ValidationError(
+                f"Only {upload.received} of {upload.size} bytes have been uploaded."
+            )
+        name = assemble(upload)
+        try:
+            with transaction.atomic():
+                if not Upload.objects.filter(pk=upload.pk).delete()[0]:
+                    raise NotFound()
+                serializer.validated_data["image"] = name
+                super().perform_create(serializer)
+        except Exception:
+            default_storage.delete(name)
+            raise
+        delete_parts(upload.parts)
+
+
+class PostList(ConditionalGetMixin, ExpandMixin, generics.ListAPIView):
     """
     List all posts.
     """
@@ -47,13 +174,111 @@ class PostList(generics.ListAPIView):
     serializer_class = PostSerializer
 
 
-class PostDetail(generics.RetrieveAPIView):
+class PostHot(PostList):
+    """
+    List posts by their precomputed hot score, hottest first.
+    """
+
+    keyset_ordering = ("-hot_score", "-id")
+
+
+class PostHome(ExpandMixin, generics.ListAPIView):
+    """
+    List the posts of the user and of the users they follow, newest first.
+    """
+
+    queryset = TimelineEntry.objects.select_related("post")
+    serializer_class = PostSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = TimelinePagination
+    keyset_ordering = ("-created_at", "-post_id")
+
+    def get_queryset(self):
+        return (
+            super()
+            .get_queryset()
+            .filter(
+                user_id=self.request.user.pk,
+                post__deleted_at=None,
+                post__user__deleted_at=None,
+            )
+        )
+
+    def get_pulled_queryset(self):
+        """
+        Return the posts of followed authors that are read on request instead
+        of being written into every timeline, or None if there are none.
+        """
+        authors = get_pulled_authors(self.request.user.pk)
+        if not authors:
+            return None
+        return Post.objects.filter(user_id__in=authors).expand(self.get_expand())
+
+
+class PostActiveList(PostList):
+    """
+    List commented posts, most recently commented first.
+    """
+
+    keyset_ordering = ("-last_commented_at", "-id")
+
+    def get_queryset(self):
+        return super().get_queryset().filter(last_commented_at__isnull=False)
+
+
+class SearchMixin:
+    """
+    Rank the results of `?q=` and paginate them by rank, best match first.
+    """
+
+    search_query_param = "q"
+    keyset_ordering = ("-rank", "-id")
+
+    def get_search_query(self):
+        query = self.request.query_params.get(self.search_query_param, "").strip()
+        if not query:
+            raise serializers.ValidationError(
+                {self.search_query_param: "This query parameter is required."}
+            )
+        return query
+
+    def get_queryset(self):
+        return super().get_queryset().search(self.get_search_query())
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["query"] = self.get_search_query()
+        return context
+
+
+class PostSearch(SearchMixin, ExpandMixin, generics.ListAPIView):
+    """
+    Search posts by title and text.
+    """
+
+    queryset = Post.objects.all()
+    serializer_class = PostSearchSerializer
+
+
+class CommentSearch(SearchMixin, ExpandMixin, generics.ListAPIView):
+    """
+    Search comments by text.
+    """
+
+    queryset = Comment.objects.all()
+    serializer_class = CommentSearchSerializer
+
+
+class PostDetail(
+    ConditionalGetMixin, CachedRetrieveMixin, ExpandMixin, generics.RetrieveAPIView
+):
     """
     Retrieve a post.
     """
 
     queryset = Post.objects.all()
     serializer_class = PostSerializer
+    payload_cache = post_cache
 
 
 class PostUpdate(generics.UpdateAPIView):
@@ -70,12 +295,18 @@ class PostUpdate(generics.UpdateAPIView):
         Check if the user has permission to edit the post.
         """
         post = self.get_object()
-        if post.user != self.request.user and not self.request.user.is_staff:
+        if post.user_id != self.request.user.pk and not self.request.user.is_staff:
             return Response(
                 {"message": "You do not have permission to edit this post."},
                 status=status.HTTP_403_FORBIDDEN,
             )
-        serializer.save()
+        if "image" not in serializer.validated_data:
+            serializer.save()
+        else:
+            post = serializer.save(image_variants={})
+            if post.image:
+                enqueue(build_image_variants, post.pk)
+        post_cache.invalidate(post.pk)
 
 
 class PostDelete(generics.DestroyAPIView):
@@ -91,13 +322,40 @@ class PostDelete(generics.DestroyAPIView):
         Check if the user has permission to delete the post.
         """
         post = self.get_object()
-        if not request.user.is_staff and post.user != request.user:
+        if not request.user.is_staff and post.user_id != request.user.pk:
             return Response(
                 {"message": "You do not have permission to delete this post."},
                 status=status.HTTP_403_FORBIDDEN,
             )
         return self.destroy(request, *args, **kwargs)
 
+    def perform_destroy(self, instance):
+        """
+        Hide the post right away and purge it with its comments in the background.
+        """
+        Post.objects.filter(pk=instance.pk).soft_delete()
+        post_cache.invalidate(instance.pk)
+        enqueue(purge_post, instance.pk)
+
+
+class PostLike(generics.GenericAPIView):
+    """
+    Like or unlike a post. Both are idempotent, and the like counter of the
+    post catches up within COUNTER_FLUSH_INTERVAL seconds.
+    """
+
+    queryset = Post.objects.only("id")
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = "write"
+
+    def post(self, request, *args, **kwargs):
+        like(request.user.pk, self.get_object())
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def delete(self, request, *args, **kwargs):
+        unlike(request.user.pk, self.get_object())
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 
 class CommentCreate(generics.CreateAPIView):
     """
@@ -107,39 +365,138 @@ class CommentCreate(generics.CreateAPIView):
     queryset = Comment.objects.all()
     serializer_class = CommentCreateSerializer
     permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = "write"
 
     def perform_create(self, serializer, *args, **kwargs):
         """
-        Check if the post exists.
+        Check if the post exists and bump its comment counters.
         """
         post_id = self.kwargs.get("post_id")
-        try:
-            post = Post.objects.get(pk=post_id)
-        except Post.DoesNotExist:
+        with transaction.atomic():
+            self.add_comments(post_id, 1)
+            comment = serializer.save(
+                user_id=self.request.user.pk,
+                post_id=post_id,
+                text=self.request.data.get("text"),
+            )
+        post_cache.invalidate(post_id)
+        comment_cache.invalidate(comment.pk)
+
+    def add_comments(self, post_id, count):
+        if not Post.objects.filter(pk=post_id).add_comments(count):
             raise serializers.ValidationError(
                 f"There's no any post with given id {post_id}"
             )
-        serializer.save(
-            user=self.request.user, post=post, text=self.request.data.get("text")
+
+
+class CommentBulkCreate(CommentCreate):
+    """
+    Create a batch of comments for a post in one transaction.
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.update(
+            many=True, allow_empty=False, max_length=settings.BULK_CREATE_MAX_ITEMS
         )
+        return super().get_serializer(*args, **kwargs)
+
+    def perform_create(self, serializer, *args, **kwargs):
+        post_id = self.kwargs.get("post_id")
+        with transaction.atomic():
+            self.add_comments(post_id, len(serializer.validated_data))
+            comments = serializer.save(user_id=self.request.user.pk, post_id=post_id)
+            Comment.all_objects.set_paths(comments)
+        post_cache.invalidate(post_id)
+        comment_cache.invalidate_many(comment.pk for comment in comments)
 
 
-class CommentList(generics.ListAPIView):
+class CommentList(ConditionalGetMixin, ExpandMixin, generics.ListAPIView):
     """
-    List all comments.
+    List the comments of a post, oldest first.
     """
 
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
+    keyset_ordering = ("created_at", "id")
+
+    def get_queryset(self):
+        return super().get_queryset().filter(post_id=self.kwargs["post_id"])
+
+    def list(self, request, *args, **kwargs):
+        """
+        Only an empty page needs to tell a missing post from a post without
+        comments, so the existence check never runs on the common path.
+        """
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK and not response.data["results"]:
+            get_object_or_404(Post.objects.only("id"), pk=self.kwargs["post_id"])
+        return response
 
 
-class CommentDetail(generics.RetrieveAPIView):
+class CommentThreadList(ExpandMixin, generics.ListAPIView):
+    """
+    List the threads of a post, oldest first, each with its first replies
+    (`?replies=`, depth-first) nested under the comments they answer.
+    """
+
+    queryset = Comment.objects.all()
+    serializer_class = CommentSerializer
+    pagination_class = ThreadPagination
+
+    def get_queryset(self):
+        return super().get_queryset().filter(post_id=self.kwargs["post_id"])
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if not response.data["results"]:
+            get_object_or_404(Post.objects.only("id"), pk=self.kwargs["post_id"])
+        return response
+
+
+class CommentThread(ExpandMixin, generics.GenericAPIView):
+    """
+    Retrieve a comment with all its replies, nested under the comments they answer.
+    The path of the comment is looked up first, then its subtree is read with
+    one range query.
+    """
+
+    queryset = Comment.objects.all()
+    serializer_class = CommentSerializer
+
+    def get_queryset(self):
+        return super().get_queryset().filter(post_id=self.kwargs["post_id"])
+
+    def get(self, request, *args, **kwargs):
+        comment = get_object_or_404(
+            Comment.objects.filter(post_id=self.kwargs["post_id"]).only("path"),
+            pk=self.kwargs["pk"],
+        )
+        comments = self.get_queryset().subtree(comment.path).order_by("path")
+        serializer = self.get_serializer(comments, many=True)
+        return Response(build_tree(serializer.data)[0])
+
+
+class CommentLike(PostLike):
+    """
+    Like or unlike a comment.
+    """
+
+    queryset = Comment.objects.only("id")
+
+    def get_queryset(self):
+        return super().get_queryset().filter(post_id=self.kwargs["post_id"])
+
+
+class CommentDetail(
+    ConditionalGetMixin, CachedRetrieveMixin, ExpandMixin, generics.RetrieveAPIView
+):
     """
     Retrieve a comment.
     """
 
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
+    payload_cache = comment_cache
 
 
 class CommentUpdate(generics.UpdateAPIView):
@@ -156,12 +513,13 @@ class CommentUpdate(generics.UpdateAPIView):
         Check if the user has permission to edit the comment.
         """
         post = self.get_object()
-        if post.user != self.request.user and not self.request.user.is_staff:
+        if post.user_id != self.request.user.pk and not self.request.user.is_staff:
             return Response(
                 {"message": "You do not have permission to edit this comment."},
                 status=status.HTTP_403_FORBIDDEN,
             )
         serializer.save()
+        comment_cache.invalidate(post.pk)
 
 
 class CommentDelete(generics.DestroyAPIView):
@@ -177,9 +535,87 @@ class CommentDelete(generics.DestroyAPIView):
         Check if the user has permission to delete the comment.
         """
         post = self.get_object()
-        if not request.user.is_staff and post.user != request.user:
+        if not request.user.is_staff and post.user_id != request.user.pk:
             return Response(
                 {"message": "You do not have permission to delete this comment."},
                 status=status.HTTP_403_FORBIDDEN,
             )
         return self.destroy(request, *args, **kwargs)
+
+    def perform_destroy(self, instance):
+        """
+        Delete the comment with its replies and decrement the comment counter
+        of its post.
+        """
+        with transaction.atomic():
+            pks = list(
+                Comment.objects.filter(post_id=instance.post_id)
+                .subtree(instance.path)
+                .values_list("pk", flat=True)
+            )
+            instance.delete()
+            Post.objects.filter(pk=instance.post_id).add_comments(-len(pks))
+        post_cache.invalidate(instance.post_id)
+        comment_cache.invalidate_many(pks)
+
+
+class PostExport(NDJSONExportView):
+    """
+    Export posts as NDJSON.
+    """
+
+    queryset = Post.objects.all()
+    serializer_class = PostSerializer
+
+
+class CommentExport(NDJSONExportView):
+    """
+    Export comments as NDJSON.
+    """
+
+    queryset = Comment.objects.all()
+    serializer_class = CommentSerializer
+
+
+class AsyncPostList(ExpandMixin, AsyncListView):
+    """
+    List all posts, streamed from the async ORM.
+    """
+
+    queryset = Post.objects.all()
+    serializer_class = PostSerializer
+
+
+class AsyncPostDetail(ExpandMixin, AsyncRetrieveView):
+    """
+    Retrieve a post with the async ORM.
+    """
+
+    queryset = Post.objects.all()
+    serializer_class = PostSerializer
+
+
+class AsyncCommentList(ExpandMixin, AsyncListView):
+    """
+    List the comments of a post, oldest first, streamed from the async ORM.
+    """
+
+    queryset = Comment.objects.all()
+    serializer_class = CommentSerializer
+    keyset_ordering = ("created_at", "id")
+
+    def get_queryset(self):
+        return super().get_queryset().filter(post_id=self.kwargs["post_id"])
+
+    async def check_empty_page(self):
+        if not await Post.objects.filter(pk=self.kwargs["post_id"]).aexists():
+            raise NotFound()
+
+
+class AsyncCommentDetail(ExpandMixin, AsyncRetrieveView):
+    """
+    Retrieve a comment with the async ORM.
+    """
+
+    queryset = Comment.objects.all()
+    serializer_class = CommentSerializer
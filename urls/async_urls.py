@@ -0,0 +1,28 @@
+from django.urls import path
+
+from posts.views import (
+    AsyncPostList,
+    AsyncPostDetail,
+    AsyncCommentList,
+    AsyncCommentDetail,
+)
+from users.views import AsyncUserList, AsyncUserDetail
+
+app_name = "async"
+
+urlpatterns = [
+    path("posts/", AsyncPostList.as_view(), name="post_list"),
+    path("posts/<int:pk>/", AsyncPostDetail.as_view(), name="post_retrieve"),
+    path(
+        "posts/<int:post_id>/comments/",
+        AsyncCommentList.as_view(),
+        name="comment_list",
+    ),
+    path(
+        "posts/<int:post_id>/comments/<int:pk>/",
+        AsyncCommentDetail.as_view(),
+        name="comment_retrieve",
+    ),
+    path("profiles/", AsyncUserList.as_view(), name="user_list"),
+    path("profile/<pk>/", AsyncUserDetail.as_view(), name="user_retrieve"),
+]
@@ -3,18 +3,26 @@ from django.urls import path
 from posts.apps import PostsConfig
 from posts.views import (
     CommentCreate,
+    CommentBulkCreate,
     CommentList,
     CommentUpdate,
     CommentDelete,
     CommentDetail,
+    CommentLike,
+    CommentThread,
+    CommentThreadList,
 )
 
 app_name = PostsConfig.name
 
 urlpatterns = [
     path("create/", CommentCreate.as_view(), name="comment_create"),
+    path("bulk/", CommentBulkCreate.as_view(), name="comment_bulk_create"),
     path("", CommentList.as_view(), name="comment_list"),
+    path("threads/", CommentThreadList.as_view(), name="comment_threads"),
     path("<int:pk>/", CommentDetail.as_view(), name="comment_retrieve"),
+    path("<int:pk>/thread/", CommentThread.as_view(), name="comment_thread"),
     path("<int:pk>/update/", CommentUpdate.as_view(), name="comment_update"),
     path("<int:pk>/delete/", CommentDelete.as_view(), name="comment_delete"),
+    path("<int:pk>/like/", CommentLike.as_view(), name="comment_like"),
 ]
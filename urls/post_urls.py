@@ -1,14 +1,46 @@
 from django.urls import path
 
 from posts.apps import PostsConfig
-from posts.views import PostCreate, PostList, PostDetail, PostUpdate, PostDelete
+from posts.views import (
+    PostCreate,
+    PostBulkCreate,
+    PostList,
+    PostActiveList,
+    PostHome,
+    PostHot,
+    PostExport,
+    CommentExport,
+    PostSearch,
+    UploadCreate,
+    UploadDetail,
+    UploadComplete,
+    CommentSearch,
+    PostDetail,
+    PostUpdate,
+    PostDelete,
+    PostLike,
+)
 
 app_name = PostsConfig.name
 
 urlpatterns = [
     path("create/", PostCreate.as_view(), name="post_create"),
+    path("bulk/", PostBulkCreate.as_view(), name="post_bulk_create"),
+    path("uploads/", UploadCreate.as_view(), name="upload_create"),
+    path("uploads/<uuid:pk>/", UploadDetail.as_view(), name="upload_detail"),
+    path(
+        "uploads/<uuid:pk>/complete/", UploadComplete.as_view(), name="upload_complete"
+    ),
     path("", PostList.as_view(), name="post_list"),
+    path("active/", PostActiveList.as_view(), name="post_active_list"),
+    path("home/", PostHome.as_view(), name="post_home"),
+    path("hot/", PostHot.as_view(), name="post_hot"),
+    path("export/", PostExport.as_view(), name="post_export"),
+    path("export/comments/", CommentExport.as_view(), name="comment_export"),
+    path("search/", PostSearch.as_view(), name="post_search"),
+    path("search/comments/", CommentSearch.as_view(), name="comment_search"),
     path("<int:pk>/", PostDetail.as_view(), name="post_retrieve"),
     path("<int:pk>/update/", PostUpdate.as_view(), name="post_update"),
     path("<int:pk>/delete/", PostDelete.as_view(), name="post_delete"),
+    path("<int:pk>/like/", PostLike.as_view(), name="post_like"),
 ]
@@ -0,0 +1,53 @@
+from datetime import date
+
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+
+from users.models import User
+from users.tokens import is_revoked
+
+
+class ClaimsUser(TokenUser):
+    """
+    Stateless user built from the claims of a validated token.
+    The `User` row is only loaded when `instance` is accessed.
+    """
+
+    @cached_property
+    def is_active(self):
+        return self.token.get("is_active", True)
+
+    @cached_property
+    def adult_since(self):
+        value = self.token.get("adult_since")
+        return date.fromisoformat(value) if value else None
+
+    @property
+    def is_adult(self):
+        return self.adult_since is not None and self.adult_since <= timezone.localdate()
+
+    @cached_property
+    def instance(self):
+        return User.objects.get(pk=self.pk)
+
+
+class StatelessJWTAuthentication(JWTStatelessUserAuthentication):
+    """
+    JWT authentication that trusts the signed claims instead of selecting the
+    user on every request, and rejects tokens on the revocation denylist.
+    """
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        if is_revoked(token):
+            raise InvalidToken("Token has been revoked")
+        return token
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        if not user.is_active:
+            raise InvalidToken("User is inactive")
+        return user
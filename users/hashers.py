@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+_executor = None
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    """
+    scrypt with the cost parameters from the settings. The memory a hash takes
+    is 128 * SCRYPT_WORK_FACTOR * SCRYPT_BLOCK_SIZE bytes, 16MB by default.
+    """
+
+    def __init__(self):
+        self.work_factor = settings.SCRYPT_WORK_FACTOR
+        self.block_size = settings.SCRYPT_BLOCK_SIZE
+        self.parallelism = settings.SCRYPT_PARALLELISM
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """
+    Argon2id with the cost parameters from the settings. Needs argon2-cffi.
+    """
+
+    def __init__(self):
+        self.time_cost = settings.ARGON2_TIME_COST
+        self.memory_cost = settings.ARGON2_MEMORY_COST
+        self.parallelism = settings.ARGON2_PARALLELISM
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.PASSWORD_HASH_WORKERS,
+            thread_name_prefix="password-hash",
+        )
+    return _executor
+
+
+def hash_password(password):
+    """
+    Hash a password with the default hasher.
+
+    With PASSWORD_HASH_WORKERS set, the hash is computed in a pool of that
+    many threads, which bounds how many hashes run at once, and so the CPU
+    time and memory a burst of registrations takes. The hash functions
+    release the GIL, so the pool runs them in parallel.
+    """
+    if not settings.PASSWORD_HASH_WORKERS:
+        return hashers.make_password(password)
+    return get_executor().submit(hashers.make_password, password).result()
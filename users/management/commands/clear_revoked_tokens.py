@@ -0,0 +1,14 @@
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from users.models import RevokedToken, TokenRevocation
+
+
+class Command(BaseCommand):
+    help = "Delete the denylist entries of tokens that have expired anyway."
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        tokens = RevokedToken.objects.filter(expires_at__lte=now).delete()[0]
+        users = TokenRevocation.objects.filter(expires_at__lte=now).delete()[0]
+        self.stdout.write(f"Deleted {tokens} revoked tokens and {users} user revocations.")
@@ -0,0 +1,43 @@
+# Generated by Django 5.0.1 on 2026-10-17 20:45
+
+from datetime import date
+
+from django.db import migrations, models
+
+ADULT_AGE = 18
+BATCH_SIZE = 1000
+
+
+def get_adult_since(birth_date):
+    try:
+        return birth_date.replace(year=birth_date.year + ADULT_AGE)
+    except ValueError:
+        return date(birth_date.year + ADULT_AGE, 3, 1)
+
+
+def backfill_adult_since(apps, schema_editor):
+    User = apps.get_model("users", "User")
+    users = User.objects.filter(adult_since__isnull=True).only("id", "birth_date")
+    batch = []
+    for user in users.iterator(chunk_size=BATCH_SIZE):
+        user.adult_since = get_adult_since(user.birth_date)
+        batch.append(user)
+        if len(batch) == BATCH_SIZE:
+            User.objects.bulk_update(batch, ["adult_since"])
+            batch = []
+    User.objects.bulk_update(batch, ["adult_since"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0002_created_at_id_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="adult_since",
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_adult_since, migrations.RunPython.noop),
+    ]
@@ -1,23 +1,171 @@
+from datetime import date
+
 from django.db import models
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
+from django.utils import timezone
+
+from common.softdelete import LiveManager, SoftDeleteQuerySet
+
+ADULT_AGE = 18
+# The fields tokens carry or depend on: saving a change to any of them revokes
+# the tokens issued before it (see users.tokens.get_user_claims).
+TOKEN_FIELDS = ("password", "is_active", "is_staff", "is_superuser", "adult_since")
+
+
+def get_adult_since(birth_date):
+    """
+    Return the date a person born on `birth_date` turns ADULT_AGE.
+    Someone born on February 29 comes of age on March 1 in non-leap years.
+    """
+    try:
+        return birth_date.replace(year=birth_date.year + ADULT_AGE)
+    except ValueError:
+        return date(birth_date.year + ADULT_AGE, 3, 1)
+
+
+class LiveUserManager(LiveManager.from_queryset(SoftDeleteQuerySet), UserManager):
+    """
+    The user manager, limited to the users that are not soft deleted.
+    """
 
 
 class User(AbstractUser):
     """
     User - A model that reflects information about the user, including email,
     phone number, date of birth and account information (username, password, email, etc).
+    The date the user comes of age is derived from the birth date on every save,
+    so age checks are a single date comparison.
+    The follower counter is kept up to date by the follow views.
+    Saving a change to the password or to a claim tokens carry revokes the user's tokens.
+    A deleted user is only marked with deleted_at, which hides them from `objects`
+    and from authentication, and is removed with their posts and comments by the
+    purge_deleted command in bounded batches.
     """
 
     username = models.CharField(unique=True, max_length=255, verbose_name='login')
     email = models.EmailField(unique=True)
     phone_number = models.CharField(unique=True, max_length=17)
     birth_date = models.DateField()
+    adult_since = models.DateField(null=True, editable=False)
+    follower_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = LiveUserManager()
+    all_objects = SoftDeleteQuerySet.as_manager()
 
     def __str__(self):
         return self.username
 
+    def save(self, *args, **kwargs):
+        self.birth_date = self._meta.get_field("birth_date").to_python(self.birth_date)
+        if self.birth_date is not None:
+            self.adult_since = get_adult_since(self.birth_date)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "birth_date" in update_fields:
+            update_fields = kwargs["update_fields"] = {*update_fields, "adult_since"}
+        token_fields_changed = (
+            not self._state.adding
+            and (update_fields is None or {*TOKEN_FIELDS} & {*update_fields})
+            and self.token_fields_changed()
+        )
+        super().save(*args, **kwargs)
+        if token_fields_changed:
+            from users.tokens import revoke_user_tokens
+
+            revoke_user_tokens(self.pk)
+
+    def token_fields_changed(self):
+        """
+        Return whether the TOKEN_FIELDS differ from the ones stored.
+        """
+        stored = User.all_objects.filter(pk=self.pk).values_list(*TOKEN_FIELDS).first()
+        return stored is not None and stored != tuple(
+            getattr(self, field) for field in TOKEN_FIELDS
+        )
+
+    @property
+    def is_adult(self):
+        return self.adult_since is not None and self.adult_since <= timezone.localdate()
+
     class Meta:
         verbose_name = 'user'
         verbose_name_plural = 'users'
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="user_created_at_id_idx"),
+            models.Index(fields=["updated_at", "id"], name="user_updated_at_id_idx"),
+            models.Index(
+                fields=["deleted_at"],
+                condition=models.Q(deleted_at__isnull=False),
+                name="user_deleted_at_idx",
+            ),
+        ]
+
+
+class Follow(models.Model):
+    """
+    Follow - A model that represents a user following another user, whose posts
+    then appear in the follower's home timeline.
+    """
+
+    follower = models.ForeignKey(User, on_delete=models.CASCADE, related_name="following")
+    followee = models.ForeignKey(User, on_delete=models.CASCADE, related_name="followers")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.follower} -> {self.followee}"
+
+    class Meta:
+        verbose_name = 'follow'
+        verbose_name_plural = 'follows'
+        constraints = [
+            models.UniqueConstraint(
+                fields=["follower", "followee"], name="follow_follower_followee_uniq"
+            ),
+            models.CheckConstraint(
+                check=~models.Q(follower=models.F("followee")),
+                name="follow_not_self",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["followee", "follower"], name="follow_followee_follower_idx"
+            ),
+        ]
+
+
+class RevokedToken(models.Model):
+    """
+    RevokedToken - A model that records a token denied before it expires, by its jti.
+    Rows past expires_at are deleted by the clear_revoked_tokens command.
+    """
+
+    jti = models.CharField(unique=True, max_length=255)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.jti
+
+    class Meta:
+        verbose_name = 'revoked token'
+        verbose_name_plural = 'revoked tokens'
+
+
+class TokenRevocation(models.Model):
+    """
+    TokenRevocation - A model that records when all the tokens of a user were revoked,
+    denying every token issued before revoked_at. It keeps the user id without a
+    foreign key, so the revocation outlives a purged user.
+    """
+
+    user_id = models.PositiveBigIntegerField(unique=True)
+    revoked_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.user_id} @ {self.revoked_at}"
+
+    class Meta:
+        verbose_name = 'token revocation'
+        verbose_name_plural = 'token revocations'
@@ -3,4 +3,11 @@ from rest_framework import permissions
 
 class IsProfileOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        return obj == request.user
+        return obj.pk == request.user.pk
+
+
+class IsAdult(permissions.BasePermission):
+    message = "User must be at least 18 years old."
+
+    def has_permission(self, request, view):
+        return getattr(request.user, "is_adult", False)
@@ -1,16 +1,49 @@
+import time
+
 from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer,
+    TokenRefreshSerializer,
+)
+from rest_framework_simplejwt.tokens import RefreshToken
 
 from users.models import User
+from users.tokens import ISSUED_AT_CLAIM, get_user_claims, is_revoked
 from users.validators import validate_password, validate_email
 
 
 class UserCreateSerializer(serializers.ModelSerializer):
-    password = serializers.CharField(validators=[validate_password])
+    password = serializers.CharField(write_only=True, validators=[validate_password])
     email = serializers.CharField(validators=[validate_email])
 
     class Meta:
         model = User
         fields = ("username", "email", "password", "birth_date", "phone_number")
+        # Deleted users keep their login and phone number until they are purged.
+        extra_kwargs = {
+            "username": {"validators": [UniqueValidator(User.all_objects.all())]},
+            "phone_number": {"validators": [UniqueValidator(User.all_objects.all())]},
+        }
+
+
+class UserImportSerializer(UserCreateSerializer):
+    """
+    A user read by the import_ndjson command.
+    """
+
+    id = serializers.IntegerField(required=False, min_value=1)
+
+    class Meta(UserCreateSerializer.Meta):
+        fields = ("id",) + UserCreateSerializer.Meta.fields
+
+
+class UserSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ("id", "username")
+
 
 class UserSerializer(serializers.ModelSerializer):
     password = serializers.CharField(validators=[validate_password])
@@ -19,3 +52,37 @@ class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = '__all__'
+        extra_kwargs = UserCreateSerializer.Meta.extra_kwargs
+
+
+class UserExportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        exclude = ("password",)
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        for claim, value in get_user_claims(user).items():
+            token[claim] = value
+        token[ISSUED_AT_CLAIM] = time.time()
+        return token
+
+
+class DenylistTokenRefreshSerializer(TokenRefreshSerializer):
+    def validate(self, attrs):
+        if is_revoked(self.token_class(attrs["refresh"])):
+            raise InvalidToken("Token has been revoked")
+        return super().validate(attrs)
+
+
+class TokenRevokeSerializer(serializers.Serializer):
+    refresh = serializers.CharField(required=False)
+
+    def validate_refresh(self, value):
+        try:
+            return RefreshToken(value)
+        except TokenError as error:
+            raise serializers.ValidationError(str(error))
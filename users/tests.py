@@ -1,7 +1,27 @@
+import os
+import time
+from datetime import date
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
-from rest_framework.test import APITestCase, APIClient
+from rest_framework.request import Request
+from rest_framework.test import APITestCase, APIClient, APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from .authentication import StatelessJWTAuthentication
+from .models import Follow, RevokedToken, TokenRevocation, get_adult_since
+from .permissions import IsAdult
 from .serializers import UserSerializer
+from .tokens import revoke_user_tokens
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -32,9 +52,9 @@ class UserTests(APITestCase):
 
     def test_get_user_list(self):
         response = self.client.get(reverse("users:user_list"))
-        users = User.objects.all()
+        users = User.objects.order_by("-created_at", "-id")
         serializer = UserSerializer(users, many=True)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data["results"], serializer.data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
     def test_get_user_detail(self):
@@ -67,6 +87,45 @@ class UserTests(APITestCase):
         )
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
 
+    def test_deleted_user_is_hidden_until_purged(self):
+        user = User.objects.create_user(
+            username="gone",
+            password="12345678",
+            phone_number="55555555",
+            birth_date="2003-01-01",
+            email="gone@mail.ru",
+        )
+        with self.captureOnCommitCallbacks(execute=False):
+            self.client.delete(reverse("users:user_delete", kwargs={"pk": user.id}))
+        response = self.client.get(reverse("users:user_retrieve", kwargs={"pk": user.id}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(
+            reverse("users:token_obtain_pair"),
+            {"username": "gone", "password": "12345678"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        user_data = {
+            "phone_number": "55555555",
+            "username": "gone",
+            "birth_date": "2004-01-01",
+            "email": "gone@mail.ru",
+            "password": "12345678",
+        }
+        response = self.client.post(reverse("users:register"), user_data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(
+            reverse("users:user_update", kwargs={"pk": self.user.id}),
+            {"username": "gone", "phone_number": "55555555"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data), {"username", "phone_number"})
+        call_command("purge_deleted", stdout=StringIO())
+        response = self.client.post(reverse("users:register"), user_data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
     def test_get_user_detail_with_non_existent_user(self):
         response = self.client.get(
             reverse("users:user_retrieve", kwargs={"pk": 9999})
@@ -159,3 +218,444 @@ class IsOwnerPermissionsTests(APITestCase):
             reverse("users:user_delete", kwargs={"pk": user.id})
         )
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+            email="test@mail.ru",
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_profile_not_modified(self):
+        url = reverse("users:user_retrieve", kwargs={"pk": self.user.id})
+        etag = self.client.get(url)["ETag"]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"password"', queries[0]["sql"])
+
+    def test_profile_list_changes_with_profiles(self):
+        url = reverse("users:user_list")
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+            status.HTTP_304_NOT_MODIFIED,
+        )
+        self.user.first_name = "Updated"
+        self.user.save()
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+            status.HTTP_200_OK,
+        )
+
+
+class AdultSinceTests(APITestCase):
+    def create_user(self, birth_date):
+        return User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date=birth_date,
+            email="test@mail.ru",
+        )
+
+    def test_adult_since_is_stored_on_create_and_update(self):
+        user = self.create_user("2000-05-10")
+        self.assertEqual(user.adult_since, date(2018, 5, 10))
+
+        self.client.force_authenticate(user=user)
+        self.client.patch(
+            reverse("users:user_update", kwargs={"pk": user.id}),
+            {"birth_date": "2001-06-11"},
+            format="json",
+        )
+        user.refresh_from_db()
+        self.assertEqual(user.adult_since, date(2019, 6, 11))
+
+    def test_birthday_boundary(self):
+        user = self.create_user("2000-05-10")
+        with patch("users.models.timezone.localdate", return_value=date(2018, 5, 9)):
+            self.assertFalse(user.is_adult)
+        with patch("users.models.timezone.localdate", return_value=date(2018, 5, 10)):
+            self.assertTrue(user.is_adult)
+
+    def test_leap_day(self):
+        user = self.create_user("2004-02-29")
+        self.assertEqual(user.adult_since, date(2022, 3, 1))
+        with patch("users.models.timezone.localdate", return_value=date(2022, 2, 28)):
+            self.assertFalse(user.is_adult)
+        with patch("users.models.timezone.localdate", return_value=date(2022, 3, 1)):
+            self.assertTrue(user.is_adult)
+
+    def test_leap_day_in_leap_year(self):
+        self.assertEqual(get_adult_since(date(2000, 2, 29)), date(2018, 3, 1))
+        self.assertEqual(get_adult_since(date(2006, 2, 28)), date(2024, 2, 28))
+
+    def test_permission(self):
+        request = APIRequestFactory().post("/")
+        request.user = self.create_user("2000-05-10")
+        permission = IsAdult()
+        with patch("users.models.timezone.localdate", return_value=date(2018, 5, 9)):
+            self.assertFalse(permission.has_permission(request, None))
+        with patch("users.models.timezone.localdate", return_value=date(2018, 5, 10)):
+            self.assertTrue(permission.has_permission(request, None))
+
+
+class StatelessJWTAuthenticationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+            email="test@mail.ru",
+        )
+        response = self.client.post(
+            reverse("users:token_obtain_pair"),
+            {"username": "testuser", "password": "12345678"},
+            format="json",
+        )
+        self.access = response.data["access"]
+        self.refresh = response.data["refresh"]
+
+    def auth_request(self):
+        return Request(
+            APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {self.access}")
+        )
+
+    def test_claims_user_needs_no_query(self):
+        with self.assertNumQueries(1):
+            user, _ = JWTAuthentication().authenticate(self.auth_request())
+        self.assertEqual(user.pk, self.user.pk)
+
+        # The first request reads the denylist entries through the cache.
+        StatelessJWTAuthentication().authenticate(self.auth_request())
+        with self.assertNumQueries(0):
+            user, _ = StatelessJWTAuthentication().authenticate(self.auth_request())
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertFalse(user.is_staff)
+        self.assertTrue(user.is_adult)
+        self.assertEqual(user.adult_since, self.user.adult_since)
+
+    def test_full_user_is_loaded_on_demand(self):
+        user, _ = StatelessJWTAuthentication().authenticate(self.auth_request())
+        with self.assertNumQueries(1):
+            self.assertEqual(user.instance, self.user)
+
+    def test_post_list_runs_only_the_list_query(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.access}")
+        self.client.get(reverse("posts:post_list"))
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("posts:post_list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_owner_checks_work_with_claims_user(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.access}")
+        response = self.client.post(
+            reverse("posts:post_create"), {"title": "Post", "text": "text"}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.patch(
+            reverse("posts:post_update", kwargs={"pk": response.data["id"]}),
+            {"title": "Updated"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_revoke_access_and_refresh_tokens(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.access}")
+        response = self.client.post(
+            reverse("users:token_revoke"), {"refresh": self.refresh}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        response = self.client.get(reverse("posts:post_list"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.credentials()
+        response = self.client.post(
+            reverse("users:token_refresh"), {"refresh": self.refresh}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_claim_changes_revoke_user_tokens(self):
+        admin = User.objects.create_user(
+            username="admin",
+            password="12345678",
+            phone_number="87654321",
+            birth_date="2000-01-01",
+            email="admin@mail.ru",
+            is_staff=True,
+        )
+        client = APIClient()
+        client.force_authenticate(user=admin)
+        client.patch(
+            reverse("users:user_update", kwargs={"pk": self.user.id}),
+            {"birth_date": "2010-01-01"},
+            format="json",
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.access}")
+        response = self.client.get(reverse("posts:post_list"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_changes_revoke_user_tokens(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.access}")
+        self.user.last_login = timezone.now()
+        self.user.save(update_fields=["last_login"])
+        self.user.save()
+        response = self.client.get(reverse("posts:post_list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.user.set_password("87654321")
+        self.user.save()
+        response = self.client.get(reverse("posts:post_list"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revocations_outlive_the_cache(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.access}")
+        self.client.post(
+            reverse("users:token_revoke"), {"refresh": self.refresh}, format="json"
+        )
+        cache.clear()
+        response = self.client.get(reverse("posts:post_list"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        revoke_user_tokens(self.user.pk)
+        cache.clear()
+        self.client.credentials()
+        response = self.client.post(
+            reverse("users:token_refresh"), {"refresh": self.refresh}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_tokens_obtained_right_after_a_revocation_work(self):
+        revoke_user_tokens(self.user.pk)
+        response = self.client.post(
+            reverse("users:token_obtain_pair"),
+            {"username": "testuser", "password": "12345678"},
+            format="json",
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        response = self.client.get(reverse("posts:post_list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.access}")
+        response = self.client.get(reverse("posts:post_list"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_clear_revoked_tokens(self):
+        RevokedToken.objects.create(jti="expired", expires_at=timezone.now())
+        revoke_user_tokens(self.user.pk)
+        out = StringIO()
+        call_command("clear_revoked_tokens", stdout=out)
+        self.assertEqual(
+            out.getvalue().strip(), "Deleted 1 revoked tokens and 0 user revocations."
+        )
+        self.assertTrue(TokenRevocation.objects.filter(user_id=self.user.pk).exists())
+
+
+class FollowTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+            email="test@mail.ru",
+        )
+        self.author = User.objects.create_user(
+            username="author",
+            password="12345678",
+            phone_number="87654321",
+            birth_date="2003-01-01",
+            email="author@mail.ru",
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse("users:user_follow", args=[self.author.pk])
+
+    def test_follow_and_unfollow_are_idempotent(self):
+        for _ in range(2):
+            response = self.client.post(self.url)
+            self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.follower_count, 1)
+        self.assertTrue(
+            Follow.objects.filter(follower=self.user, followee=self.author).exists()
+        )
+
+        for _ in range(2):
+            response = self.client.delete(self.url)
+            self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.follower_count, 0)
+        self.assertFalse(Follow.objects.exists())
+
+    def test_cannot_follow_yourself(self):
+        response = self.client.post(reverse("users:user_follow", args=[self.user.pk]))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Follow.objects.exists())
+
+    def test_follow_requires_authentication(self):
+        self.client.force_authenticate(user=None)
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class RegistrationHashingTests(APITestCase):
+    user_data = {
+        "phone_number": "88888888",
+        "username": "newuser",
+        "birth_date": "2004-01-01",
+        "email": "newuser@yandex.ru",
+        "password": "12345678",
+    }
+
+    def register(self):
+        return self.client.post(reverse("users:register"), self.user_data, format="json")
+
+    def test_user_is_written_with_one_insert(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.register()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        writes = [
+            query["sql"]
+            for query in queries
+            if query["sql"].startswith(("INSERT", "UPDATE"))
+        ]
+        self.assertEqual(len(writes), 1)
+        self.assertNotIn("password", response.data)
+        user = User.objects.get(username="newuser")
+        self.assertTrue(user.check_password("12345678"))
+        self.assertEqual(user.adult_since, date(2022, 1, 1))
+
+    @override_settings(
+        PASSWORD_HASHERS=["users.hashers.ScryptPasswordHasher"],
+        SCRYPT_WORK_FACTOR=2**10,
+    )
+    def test_scrypt_parameters_come_from_the_settings(self):
+        self.register()
+        user = User.objects.get(username="newuser")
+        algorithm, work_factor = user.password.split("$")[:2]
+        self.assertEqual((algorithm, work_factor), ("scrypt", "1024"))
+        self.assertTrue(user.check_password("12345678"))
+
+    def test_hashes_are_upgraded_to_the_configured_hasher_on_login(self):
+        self.register()
+        with override_settings(
+            PASSWORD_HASHERS=[
+                "users.hashers.ScryptPasswordHasher",
+                "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+            ],
+            SCRYPT_WORK_FACTOR=2**10,
+        ):
+            user = User.objects.get(username="newuser")
+            self.assertTrue(user.check_password("12345678"))
+            user.refresh_from_db()
+            self.assertTrue(user.password.startswith("scrypt$"))
+
+    @override_settings(PASSWORD_HASH_WORKERS=2)
+    def test_hashing_in_the_worker_pool(self):
+        self.assertEqual(self.register().status_code, status.HTTP_201_CREATED)
+        self.assertTrue(
+            User.objects.get(username="newuser").check_password("12345678")
+        )
+
+
+THROTTLE_RATES = {
+    **settings.REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"],
+    "login": "2/min",
+    "register": "2/hour",
+}
+
+
+@override_settings(
+    REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": THROTTLE_RATES}
+)
+class AuthThrottleTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(
+            username="testuser",
+            password="12345678",
+            phone_number="12345678",
+            birth_date="2003-01-01",
+        )
+
+    def login(self, password="wrong-password1"):
+        return self.client.post(
+            reverse("users:token_obtain_pair"),
+            {"username": "testuser", "password": password},
+            format="json",
+        )
+
+    def register(self, i):
+        return self.client.post(
+            reverse("users:register"),
+            {
+                "phone_number": f"8888888{i}",
+                "username": f"newuser{i}",
+                "birth_date": "2004-01-01",
+                "email": f"newuser{i}@mail.ru",
+                "password": "12345678",
+            },
+            format="json",
+        )
+
+    def test_login_attempts_are_limited_per_address(self):
+        self.assertEqual(self.login().status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.login().status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.login(password="12345678")
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        response = self.client.post(
+            reverse("users:token_obtain_pair"),
+            {"username": "testuser", "password": "12345678"},
+            format="json",
+            REMOTE_ADDR="10.0.0.2",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_login_and_registration_have_separate_budgets(self):
+        self.login()
+        self.login()
+        self.assertEqual(self.register(1).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.register(2).status_code, status.HTTP_201_CREATED)
+        response = self.register(3)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertFalse(User.objects.filter(username="newuser3").exists())
+
+
+@skipUnless(os.getenv("RUN_BENCHMARKS"), "set RUN_BENCHMARKS=1 to run benchmarks")
+@override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {}})
+class RegistrationBenchmark(APITestCase):
+    def test_registrations_per_second(self):
+        hashers = {
+            "pbkdf2": "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+            "scrypt": "users.hashers.ScryptPasswordHasher",
+        }
+        for name, hasher in hashers.items():
+            with override_settings(PASSWORD_HASHERS=[hasher]):
+                started = time.perf_counter()
+                for i in range(20):
+                    response = self.client.post(
+                        reverse("users:register"),
+                        {
+                            "phone_number": f"{name}{i}",
+                            "username": f"{name}{i}",
+                            "birth_date": "2004-01-01",
+                            "email": f"{name}{i}@mail.ru",
+                            "password": "12345678",
+                        },
+                        format="json",
+                    )
+                    self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+                elapsed = time.perf_counter() - started
+            print(f"\n{name}: {20 / elapsed:.1f} registrations per second per worker")
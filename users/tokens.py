@@ -0,0 +1,118 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from users.models import RevokedToken, TokenRevocation
+
+# Issue time of a token with sub-second precision, unlike `iat`, so tokens
+# obtained right after a revocation are told apart from the revoked ones.
+ISSUED_AT_CLAIM = "issued_at"
+
+
+def get_user_claims(user):
+    """
+    Return the user attributes that tokens carry, so stateless requests can
+    authorize without loading the user.
+    """
+    return {
+        "is_staff": user.is_staff,
+        "is_superuser": user.is_superuser,
+        "is_active": user.is_active,
+        "adult_since": user.adult_since.isoformat() if user.adult_since else None,
+    }
+
+
+def revoked_token_key(jti):
+    return f"jwt:revoked:{jti}"
+
+
+def revoked_user_key(user_id):
+    return f"jwt:revoked-before:{user_id}"
+
+
+def forget(*keys):
+    """
+    Drop cached denylist entries now, and again once the revocation is
+    committed, in case a concurrent request cached the state before it.
+    """
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def revoke_token(token):
+    """
+    Deny a single token until it expires.
+    """
+    jti = token[api_settings.JTI_CLAIM]
+    expires_at = datetime.fromtimestamp(token["exp"], tz=dt_timezone.utc)
+    RevokedToken.objects.get_or_create(jti=jti, defaults={"expires_at": expires_at})
+    forget(revoked_token_key(jti))
+
+
+def revoke_user_tokens(user_id):
+    """
+    Deny every token issued to the user before now.
+    """
+    now = timezone.now()
+    TokenRevocation.objects.update_or_create(
+        user_id=user_id,
+        defaults={
+            "revoked_at": now,
+            "expires_at": now + settings.SIMPLE_JWT["REFRESH_TOKEN_LIFETIME"],
+        },
+    )
+    forget(revoked_user_key(user_id))
+
+
+def load_denylist(jti, user_id):
+    """
+    Read the denylist entries of a token from the database and cache them,
+    those that are not there for TOKEN_DENYLIST_CACHE_TIMEOUT, those that are
+    until they expire.
+    """
+    token_key = revoked_token_key(jti)
+    user_key = revoked_user_key(user_id)
+    now = timezone.now()
+    entries = {token_key: False, user_key: 0}
+    timeouts = {token_key: None, user_key: None}
+
+    revoked = RevokedToken.objects.filter(jti=jti, expires_at__gt=now).first()
+    if revoked is not None:
+        entries[token_key] = True
+        timeouts[token_key] = revoked.expires_at
+    revocation = TokenRevocation.objects.filter(
+        user_id=user_id, expires_at__gt=now
+    ).first()
+    if revocation is not None:
+        entries[user_key] = revocation.revoked_at.timestamp()
+        timeouts[user_key] = revocation.expires_at
+
+    for key, value in entries.items():
+        if timeouts[key] is None:
+            timeout = settings.TOKEN_DENYLIST_CACHE_TIMEOUT
+        else:
+            timeout = max(int((timeouts[key] - now).total_seconds()), 1)
+        cache.set(key, value, timeout)
+    return entries
+
+
+def is_revoked(token):
+    """
+    Return whether a token is on the denylist, read through the cache.
+    """
+    jti = token.get(api_settings.JTI_CLAIM)
+    user_id = token.get(api_settings.USER_ID_CLAIM)
+    token_key = revoked_token_key(jti)
+    user_key = revoked_user_key(user_id)
+    denied = cache.get_many([token_key, user_key])
+    if len(denied) < 2:
+        denied = load_denylist(jti, user_id)
+    if denied[token_key]:
+        return True
+    revoked_before = denied[user_key]
+    issued_at = token.get(ISSUED_AT_CLAIM, token.get("iat", 0))
+    return bool(revoked_before) and issued_at < revoked_before
@@ -1,19 +1,32 @@
-from rest_framework import generics, permissions
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import generics, permissions, serializers
 from rest_framework.response import Response
 from rest_framework.views import status
-
-from .models import User
+from rest_framework_simplejwt.views import TokenObtainPairView
+
+from common.asyncviews import AsyncListView, AsyncRetrieveView
+from common.conditional import ConditionalGetMixin
+from common.export import NDJSONExportView
+from common.tasks import enqueue
+from posts.purge import purge_user
+from posts.timelines import backfill_timeline, clear_timeline, forget_pulled_authors
+from .hashers import hash_password
+from .models import Follow, User
 from .permissions import IsProfileOwner
-from .serializers import UserSerializer, UserCreateSerializer
+from .serializers import UserSerializer, UserCreateSerializer, TokenRevokeSerializer, UserExportSerializer
+from .tokens import revoke_token, revoke_user_tokens
 
 
-class UserList(generics.ListAPIView):
+class UserList(ConditionalGetMixin, generics.ListAPIView):
     """
     List of all users.
     """
 
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    validator_fields = ("updated_at", "last_login")
     permission_classes = [permissions.IsAdminUser | permissions.IsAuthenticated]
 
 
@@ -24,29 +37,26 @@ class UserCreate(generics.CreateAPIView):
 
     queryset = User.objects.all()
     serializer_class = UserCreateSerializer
+    throttle_scope = "register"
 
     def perform_create(self, serializer):
-        user = User.objects.create(
-            phone_number=self.request.data.get("phone_number"),
+        # Hash first, so the user is written with a single INSERT.
+        serializer.save(
+            password=hash_password(serializer.validated_data["password"]),
             is_superuser=False,
             is_staff=False,
             is_active=True,
-            username=self.request.data.get("username"),
-            birth_date=self.request.data.get("birth_date"),
-            email=self.request.data.get("email"),
         )
 
-        user.set_password(self.request.data.get("password"))
-        user.save()
-
 
-class UserDetail(generics.RetrieveAPIView):
+class UserDetail(ConditionalGetMixin, generics.RetrieveAPIView):
     """
     Detailed information about the user.
     """
 
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    validator_fields = ("updated_at", "last_login")
     permission_classes = [permissions.IsAuthenticated | permissions.IsAdminUser]
 
 
@@ -66,7 +76,7 @@ class UserUpdate(generics.UpdateAPIView):
 
     def put(self, request, *args, **kwargs):
         user = self.get_object()
-        if user != request.user and not request.user.is_staff:
+        if user.pk != request.user.pk and not request.user.is_staff:
             return Response(
                 {"message": "You do not have permission to edit this user."},
                 status=status.HTTP_403_FORBIDDEN,
@@ -91,3 +101,107 @@ class UserDelete(generics.DestroyAPIView):
                 status=status.HTTP_403_FORBIDDEN,
             )
         return self.destroy(request, *args, **kwargs)
+
+    def perform_destroy(self, instance):
+        """
+        Hide the user right away and purge what they wrote in the background.
+        """
+        revoke_user_tokens(instance.pk)
+        User.objects.filter(pk=instance.pk).soft_delete()
+        enqueue(purge_user, instance.pk)
+
+
+class TokenObtain(TokenObtainPairView):
+    """
+    Obtain a pair of tokens, with its own rate limit against password guessing.
+    """
+
+    throttle_scope = "login"
+
+
+class TokenRevoke(generics.GenericAPIView):
+    """
+    Revoke the access token of the request and, if given, a refresh token.
+    """
+
+    serializer_class = TokenRevokeSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if request.auth is not None:
+            revoke_token(request.auth)
+        if serializer.validated_data.get("refresh"):
+            revoke_token(serializer.validated_data["refresh"])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UserFollow(generics.GenericAPIView):
+    """
+    Follow or unfollow a user.
+    """
+
+    queryset = User.objects.only("id")
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = "write"
+
+    def post(self, request, *args, **kwargs):
+        followee = self.get_object()
+        if followee.pk == request.user.pk:
+            raise serializers.ValidationError("You cannot follow yourself.")
+        with transaction.atomic():
+            _, created = Follow.objects.get_or_create(
+                follower_id=request.user.pk, followee_id=followee.pk
+            )
+            if created:
+                self.add_followers(followee.pk, 1)
+                enqueue(backfill_timeline, request.user.pk, followee.pk)
+        forget_pulled_authors(request.user.pk)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def delete(self, request, *args, **kwargs):
+        followee = self.get_object()
+        with transaction.atomic():
+            deleted, _ = Follow.objects.filter(
+                follower_id=request.user.pk, followee_id=followee.pk
+            ).delete()
+            if deleted:
+                self.add_followers(followee.pk, -1)
+                enqueue(clear_timeline, request.user.pk, followee.pk)
+        forget_pulled_authors(request.user.pk)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def add_followers(self, user_id, count):
+        User.objects.filter(pk=user_id).update(
+            follower_count=F("follower_count") + count, updated_at=timezone.now()
+        )
+
+
+class UserExport(NDJSONExportView):
+    """
+    Export users, without their password hashes, as NDJSON.
+    """
+
+    queryset = User.objects.prefetch_related("groups", "user_permissions")
+    serializer_class = UserExportSerializer
+
+
+class AsyncUserList(AsyncListView):
+    """
+    List of all users, streamed from the async ORM.
+    """
+
+    queryset = User.objects.prefetch_related("groups", "user_permissions")
+    serializer_class = UserSerializer
+    permission_classes = [permissions.IsAdminUser | permissions.IsAuthenticated]
+
+
+class AsyncUserDetail(AsyncRetrieveView):
+    """
+    Detailed information about the user, read with the async ORM.
+    """
+
+    queryset = User.objects.prefetch_related("groups", "user_permissions")
+    serializer_class = UserSerializer
+    permission_classes = [permissions.IsAuthenticated | permissions.IsAdminUser]